@@ -0,0 +1,181 @@
+# backend/admission.py
+"""
+Допуск обработок отчетов по оценке их стоимости (память и время).
+
+Перед обработкой по формату и числу строк отчета оценивается, сколько памяти и времени
+она займет (estimate_cost). Обработка начинается, если оценка помещается в бюджет памяти
+процесса и есть свободное место (max_running); иначе ждет своей очереди не дольше
+queue_timeout. Если очередь заполнена или ожидание заведомо дольше queue_timeout, обработка
+сразу отклоняется (AdmissionRejected с рекомендуемым Retry-After) - при всплеске загрузок
+сервис отвечает 429, а не падает от нехватки памяти.
+
+Обработка дороже всего бюджета допускается, только когда других нет, - большие отчеты
+выполняются по одному, но не ждут бесконечно.
+"""
+import math
+import time
+import threading
+import collections
+from contextlib import contextmanager
+
+# Память и время обработки на строку отчета (замеры на отчетах от 3 до 500 тыс. строк).
+# xlsx разбирается целиком, CSV - порциями: в памяти только строки текущей порции
+ROW_COST = {
+    'xlsx': {'memory_bytes': 1200, 'cpu_seconds': 45e-6},
+    'csv': {'memory_bytes': 800, 'cpu_seconds': 8e-6}
+}
+# Постоянная часть стоимости: таблицы результата, Excel-файл
+BASE_MEMORY_BYTES = 16 * 1024 * 1024
+BASE_CPU_SECONDS = 0.05
+
+
+def estimate_cost(rows: int, file_format: str, chunk_rows: int = 0) -> dict:
+    """
+    Оценка стоимости обработки отчета: {'rows', 'memory_bytes', 'cpu_seconds'}.
+
+    chunk_rows - размер порции, которыми читается CSV (0 - файл читается целиком).
+    """
+    row_cost = ROW_COST.get(file_format, ROW_COST['xlsx'])
+    rows_in_memory = min(rows, chunk_rows) if file_format == 'csv' and chunk_rows else rows
+    return {
+        'rows': rows,
+        'memory_bytes': BASE_MEMORY_BYTES + row_cost['memory_bytes'] * rows_in_memory,
+        'cpu_seconds': BASE_CPU_SECONDS + row_cost['cpu_seconds'] * rows
+    }
+
+
+class AdmissionRejected(Exception):
+    """Обработка не допущена: бюджет занят; retry_after - через сколько секунд повторить запрос"""
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """
+    Бюджет памяти и число одновременных обработок в процессе; ожидающие допускаются по порядку.
+    """
+
+    def __init__(self, memory_budget_bytes: int, max_running: int = 1, max_queue: int = 16,
+                 queue_timeout: float = 30):
+        """
+        Args:
+            memory_budget_bytes (int): Сколько памяти могут занимать одновременные обработки (0 - без ограничения)
+            max_running (int): Максимум одновременных обработок
+            max_queue (int): Сколько обработок может ждать допуска (остальные отклоняются сразу)
+            queue_timeout (float): Сколько секунд ждать допуска по умолчанию
+        """
+        self.memory_budget = memory_budget_bytes
+        self.max_running = max(max_running, 1)
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+
+        self._condition = threading.Condition()
+        # Допущенные обработки: билет -> (память, ожидаемое время окончания по time.monotonic)
+        self._running = {}
+        # Ожидающие допуска: билеты по порядку и их оценки
+        self._waiting = collections.deque()
+        self._waiting_costs = {}
+        self.memory_used = 0
+        self.admitted = 0
+        self.queued = 0
+        self.rejected = 0
+
+    def _fits(self, memory: int) -> bool:
+        if not self._running:
+            return True
+        if len(self._running) >= self.max_running:
+            return False
+        return not self.memory_budget or self.memory_used + memory <= self.memory_budget
+
+    def _expected_wait(self) -> float:
+        """Оценка ожидания допуска для новой обработки, секунды: остаток текущих и всех ожидающих"""
+        now = time.monotonic()
+        backlog = sum(max(finish - now, 0) for _, finish in self._running.values())
+        backlog += sum(cost['cpu_seconds'] for cost in self._waiting_costs.values())
+        return backlog / self.max_running
+
+    def _reject(self, message: str):
+        self.rejected += 1
+        raise AdmissionRejected(message, max(math.ceil(self._expected_wait()), 1))
+
+    def acquire(self, cost: dict, timeout: float = -1):
+        """
+        Ждет допуска обработки со стоимостью cost (estimate_cost) и возвращает билет для release.
+
+        timeout - сколько секунд ждать (по умолчанию queue_timeout); None - ждать без ограничения
+        и без учета длины очереди (для фоновой очереди задач). Если дождаться нельзя,
+        выбрасывается AdmissionRejected.
+        """
+        timeout = self.queue_timeout if timeout == -1 else timeout
+        memory = min(cost['memory_bytes'], self.memory_budget) if self.memory_budget else cost['memory_bytes']
+        ticket = object()
+        with self._condition:
+            if self._waiting or not self._fits(memory):
+                if timeout is not None:
+                    if len(self._waiting) >= self.max_queue:
+                        self._reject("Сервис занят: очередь обработки заполнена")
+                    if self._expected_wait() > timeout:
+                        self._reject("Сервис занят: обработка не начнется в пределах ожидания")
+                deadline = time.monotonic() + timeout if timeout is not None else None
+                self._waiting.append(ticket)
+                self._waiting_costs[ticket] = cost
+                self.queued += 1
+                try:
+                    while self._waiting[0] is not ticket or not self._fits(memory):
+                        remaining = deadline - time.monotonic() if deadline is not None else None
+                        if remaining is not None and remaining <= 0:
+                            self._reject("Сервис занят: время ожидания обработки истекло")
+                        self._condition.wait(remaining)
+                finally:
+                    self._waiting.remove(ticket)
+                    del self._waiting_costs[ticket]
+                    self._condition.notify_all()
+
+            self._running[ticket] = (memory, time.monotonic() + cost['cpu_seconds'])
+            self.memory_used += memory
+            self.admitted += 1
+        return ticket
+
+    def release(self, ticket):
+        """Освобождает бюджет завершившейся обработки"""
+        with self._condition:
+            memory, _ = self._running.pop(ticket)
+            self.memory_used -= memory
+            self._condition.notify_all()
+
+    @contextmanager
+    def admit(self, cost: dict, timeout: float = -1):
+        """Контекстный менеджер: acquire перед блоком, release после него"""
+        ticket = self.acquire(cost, timeout)
+        try:
+            yield
+        finally:
+            self.release(ticket)
+
+    def stats(self) -> dict:
+        """Занятость бюджета: память, число выполняемых и ожидающих обработок, счетчики"""
+        with self._condition:
+            return {
+                'memory_budget_bytes': self.memory_budget,
+                'memory_used_bytes': self.memory_used,
+                'running': len(self._running),
+                'max_running': self.max_running,
+                'waiting': len(self._waiting),
+                'max_queue': self.max_queue,
+                'queue_timeout': self.queue_timeout,
+                'expected_wait_seconds': self._expected_wait(),
+                'admitted': self.admitted,
+                'queued': self.queued,
+                'rejected': self.rejected
+            }
+
+
+def combine_costs(costs) -> dict:
+    """Стоимость нескольких обработок, выполняемых вместе (пакет отчетов)"""
+    combined = {'rows': 0, 'memory_bytes': 0, 'cpu_seconds': 0}
+    for cost in costs:
+        for name in combined:
+            combined[name] += cost[name]
+    return combined
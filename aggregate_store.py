@@ -0,0 +1,259 @@
+# backend/aggregate_store.py
+"""Хранилище сумм обработанных отчетов по продавцам (SQLite) для расчетов за произвольный период"""
+import time
+import sqlite3
+import logging
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Суммы aggregate_by_keys и aggregate_supplies (см. processor.aggregate_report)
+KEY_COLUMNS = ['J', 'K', 'AQ']
+KEY_MEASURES = ['N', 'NO', 'AH', 'AC', 'AK', 'BH', 'BI', 'AO', 'BJ', 'BK', 'NOX']
+SUPPLY_KEYS = ['category', 'supply']
+SUPPLY_MEASURES = ['N', 'O_sum', 'O_count', 'AH', 'AC']
+
+def _quoted(columns: list) -> str:
+    """Список имен столбцов для SQL (NO - ключевое слово SQLite)"""
+    return ', '.join(f'"{name}"' for name in columns)
+
+
+def _sums(columns: list) -> str:
+    """Суммы столбцов для SQL с прежними именами"""
+    return ', '.join(f'SUM({name}) AS {name}' for name in _quoted(columns).split(', '))
+
+
+_SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS reports (
+    seller TEXT NOT NULL,
+    id TEXT NOT NULL,
+    label TEXT,
+    period_start TEXT NOT NULL,
+    period_end TEXT NOT NULL,
+    ingested_at REAL NOT NULL,
+    PRIMARY KEY (seller, id)
+);
+CREATE INDEX IF NOT EXISTS reports_seller_period ON reports (seller, period_start, period_end);
+CREATE TABLE IF NOT EXISTS key_totals (
+    seller TEXT NOT NULL,
+    report_id TEXT NOT NULL,
+    J TEXT, K TEXT, AQ TEXT,
+    {_quoted(KEY_MEASURES).replace(',', ' REAL NOT NULL,')} REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS key_totals_report ON key_totals (seller, report_id);
+CREATE TABLE IF NOT EXISTS supplies (
+    seller TEXT NOT NULL,
+    report_id TEXT NOT NULL,
+    category TEXT NOT NULL,
+    supply REAL,
+    N REAL NOT NULL, O_sum REAL NOT NULL, O_count INTEGER NOT NULL, AH REAL NOT NULL, AC REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS supplies_report ON supplies (seller, report_id);
+"""
+
+
+def _rows(frame: 'pd.DataFrame', columns: list) -> list:
+    """Строки DataFrame для вставки в базу: пропуски (NaN) - NULL"""
+    values = frame[columns].astype(object)
+    return values.where(values.notna(), None).values.tolist()
+
+
+def _numeric(aggregates: dict) -> dict:
+    """Суммы из базы с числовыми типами: пустая выборка приходит с типом object, а суммы всегда числовые"""
+    key_totals, supplies = aggregates['key_totals'], aggregates['supplies']
+    key_totals[KEY_MEASURES] = key_totals[KEY_MEASURES].astype('float64')
+    supplies[SUPPLY_MEASURES] = supplies[SUPPLY_MEASURES].astype('float64')
+    supplies['supply'] = supplies['supply'].astype('float64')
+    return aggregates
+
+
+class AggregateStore:
+    """
+    Суммы отчетов Wildberries по продавцам.
+
+    Для каждого отчета хранятся только его суммы (processor.aggregate_report) -
+    несколько сотен строк вместо всего отчета. Новый отчет добавляется без повторной
+    обработки остальных, а суммы за любой период складываются запросом к базе.
+    Отчет идентифицируется ключом содержимого: повторная загрузка заменяет его суммы.
+    """
+
+    def __init__(self, db_path: str):
+        """
+        Args:
+            db_path (str): Путь к файлу базы SQLite
+        """
+        self.db_path = db_path
+        with self._connect() as conn:
+            conn.executescript(_SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        """Соединение с базой в режиме autocommit, закрывается при выходе"""
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            conn.execute('PRAGMA journal_mode=WAL')
+            yield conn
+        finally:
+            conn.close()
+
+    def contains(self, seller: str, report_id: str) -> bool:
+        """Есть ли суммы отчета в хранилище"""
+        with self._connect() as conn:
+            row = conn.execute("SELECT 1 FROM reports WHERE seller = ? AND id = ?", (seller, report_id)).fetchone()
+        return row is not None
+
+    def add(self, seller: str, report_id: str, period_start: str, period_end: str, aggregates: dict,
+            label: str = None):
+        """
+        Сохраняет суммы отчета продавца (заменяя ранее сохраненные для того же отчета).
+
+        Args:
+            seller (str): Идентификатор продавца
+            report_id (str): Ключ отчета (например, ключ содержимого файла)
+            period_start (str): Начало периода отчета, YYYY-MM-DD
+            period_end (str): Конец периода отчета, YYYY-MM-DD
+            aggregates (dict): Суммы отчета (processor.aggregate_report)
+            label (str): Название отчета для списка отчетов
+        """
+        key_rows = [[seller, report_id] + row for row in _rows(aggregates['key_totals'], KEY_COLUMNS + KEY_MEASURES)]
+        supply_rows = [[seller, report_id] + row for row in _rows(aggregates['supplies'], SUPPLY_KEYS + SUPPLY_MEASURES)]
+
+        with self._connect() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                self._delete(conn, seller, report_id)
+                conn.execute(
+                    "INSERT INTO reports (seller, id, label, period_start, period_end, ingested_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (seller, report_id, label, period_start, period_end, time.time())
+                )
+                columns = KEY_COLUMNS + KEY_MEASURES
+                conn.executemany(
+                    f"INSERT INTO key_totals (seller, report_id, {_quoted(columns)}) "
+                    f"VALUES ({', '.join('?' * (len(columns) + 2))})",
+                    key_rows
+                )
+                columns = SUPPLY_KEYS + SUPPLY_MEASURES
+                conn.executemany(
+                    f"INSERT INTO supplies (seller, report_id, {', '.join(columns)}) "
+                    f"VALUES ({', '.join('?' * (len(columns) + 2))})",
+                    supply_rows
+                )
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+        logger.info(f"Суммы отчета {report_id} продавца {seller} сохранены: {period_start} - {period_end}")
+
+    def set_period(self, seller: str, report_id: str, period_start: str, period_end: str, label: str = None) -> bool:
+        """Меняет период (и название) сохраненного отчета, возвращает False, если отчета нет"""
+        with self._connect() as conn:
+            return conn.execute(
+                "UPDATE reports SET period_start = ?, period_end = ?, label = COALESCE(?, label) "
+                "WHERE seller = ? AND id = ?",
+                (period_start, period_end, label, seller, report_id)
+            ).rowcount > 0
+
+    def remove(self, seller: str, report_id: str) -> bool:
+        """Удаляет суммы отчета, возвращает False, если отчета не было"""
+        with self._connect() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                removed = self._delete(conn, seller, report_id)
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+        return removed
+
+    def _delete(self, conn: sqlite3.Connection, seller: str, report_id: str) -> bool:
+        conn.execute("DELETE FROM key_totals WHERE seller = ? AND report_id = ?", (seller, report_id))
+        conn.execute("DELETE FROM supplies WHERE seller = ? AND report_id = ?", (seller, report_id))
+        return conn.execute("DELETE FROM reports WHERE seller = ? AND id = ?", (seller, report_id)).rowcount > 0
+
+    def reports(self, seller: str, date_from: str = None, date_to: str = None) -> list:
+        """Отчеты продавца, период которых целиком входит в [date_from, date_to], по началу периода"""
+        where, params = self._period_filter(seller, date_from, date_to)
+        with self._connect() as conn:
+            rows = conn.execute(
+                f"SELECT id, label, period_start, period_end, ingested_at FROM reports r WHERE {where} "
+                "ORDER BY period_start, ingested_at",
+                params
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def aggregates(self, seller: str, date_from: str = None, date_to: str = None) -> dict:
+        """
+        Суммы всех отчетов продавца за период - в том же виде, что и processor.aggregate_report.
+
+        Учитываются отчеты, период которых целиком входит в [date_from, date_to]
+        (границы включительно, без границы - без ограничения).
+        """
+        # pandas импортируется при первом расчете, чтобы не замедлять запуск веб-сервера
+        import pandas as pd
+
+        where, params = self._period_filter(seller, date_from, date_to)
+        reports = f"SELECT id FROM reports r WHERE {where}"
+        with self._connect() as conn:
+            key_totals = pd.read_sql_query(
+                f"SELECT J, K, AQ, {_sums(KEY_MEASURES)} "
+                f"FROM key_totals WHERE seller = ? AND report_id IN ({reports}) GROUP BY J, K, AQ",
+                conn, params=[seller] + params
+            )
+            supplies = pd.read_sql_query(
+                f"SELECT category, supply, {_sums(SUPPLY_MEASURES)} "
+                f"FROM supplies WHERE seller = ? AND report_id IN ({reports}) GROUP BY category, supply",
+                conn, params=[seller] + params
+            )
+        return _numeric({'key_totals': key_totals, 'supplies': supplies})
+
+    def report_aggregates(self, seller: str, date_from: str = None, date_to: str = None) -> list:
+        """
+        Суммы каждого отчета продавца за период отдельно: пары (отчет, суммы) в порядке reports.
+
+        Суммы - в том же виде, что и processor.aggregate_report; отчеты выбираются как в aggregates.
+        """
+        import pandas as pd
+
+        reports = self.reports(seller, date_from, date_to)
+        where, params = self._period_filter(seller, date_from, date_to)
+        selected = f"SELECT id FROM reports r WHERE {where}"
+        with self._connect() as conn:
+            key_totals = pd.read_sql_query(
+                f"SELECT report_id, J, K, AQ, {_quoted(KEY_MEASURES)} "
+                f"FROM key_totals WHERE seller = ? AND report_id IN ({selected})",
+                conn, params=[seller] + params
+            )
+            supplies = pd.read_sql_query(
+                f"SELECT report_id, category, supply, {_quoted(SUPPLY_MEASURES)} "
+                f"FROM supplies WHERE seller = ? AND report_id IN ({selected})",
+                conn, params=[seller] + params
+            )
+        key_totals = dict(list(key_totals.groupby('report_id', sort=False)))
+        supplies = dict(list(supplies.groupby('report_id', sort=False)))
+
+        def report_frame(frames, report_id, columns):
+            frame = frames.get(report_id)
+            if frame is None:
+                return pd.DataFrame({column: [] for column in columns})
+            return frame[columns].reset_index(drop=True)
+
+        return [
+            (report, _numeric({
+                'key_totals': report_frame(key_totals, report['id'], KEY_COLUMNS + KEY_MEASURES),
+                'supplies': report_frame(supplies, report['id'], SUPPLY_KEYS + SUPPLY_MEASURES)
+            }))
+            for report in reports
+        ]
+
+    @staticmethod
+    def _period_filter(seller: str, date_from: str = None, date_to: str = None):
+        where, params = ["r.seller = ?"], [seller]
+        if date_from:
+            where.append("r.period_start >= ?")
+            params.append(date_from)
+        if date_to:
+            where.append("r.period_end <= ?")
+            params.append(date_to)
+        return ' AND '.join(where), params
@@ -1,31 +1,69 @@
 # backend/app.py
+import time
+# Отсчет времени запуска (STARTUP) - до импорта остальных модулей
+_IMPORT_STARTED = time.perf_counter()
+
+import io
 import os
+import re
+import hmac
 import uuid
+import mimetypes
+import shutil
 import logging
-from flask import Flask, request, jsonify, send_from_directory, abort
+import zipfile
+import tempfile
+import datetime
+import functools
+import itertools
+import threading
+import contextlib
+from concurrent.futures import ThreadPoolExecutor
+from flask import Flask, Request, request, jsonify, send_file, send_from_directory, abort, stream_with_context
 from werkzeug.utils import secure_filename
+from werkzeug.exceptions import HTTPException, RequestEntityTooLarge
 from flask_cors import CORS  # Импортируем CORS
 
-# Импортируем вашу функцию обработки
-try:
-    from processor import process_wb_report_file
-    PROCESSOR_AVAILABLE = True
-except ImportError as e:
-    logging.error(f"Не удалось импортировать processor: {e}")
-    PROCESSOR_AVAILABLE = False
+from jobs import JobQueue, DONE, FAILED
+from process_pool import ProcessPool, JobTimeoutError, JobMemoryError, reset_peak_rss, peak_rss, rss
+from result_cache import ResultCache, TABLES_SUFFIX, AGGREGATES_SUFFIX, COMPRESSIBLE_SUFFIXES, write_tables, write_aggregates
+from aggregate_store import AggregateStore
+from admission import AdmissionController, AdmissionRejected, estimate_cost, combine_costs
+import metrics
+import exports
+import progress
+import profiling
+from processor_version import PROCESSOR_VERSION
+from report_schema import ReportHeaderError
+
+# Модуль обработки (pandas, numpy, openpyxl) загружается в фоне (load_processor),
+# чтобы /healthz отвечал сразу после запуска процесса
+processor = None
+PROCESSOR_AVAILABLE = False
+_processor_lock = threading.Lock()
+processor_loaded = threading.Event()
+# Время запуска процесса по этапам, секунды от начала импорта app
+STARTUP = {}
 
 # Настройка логирования
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+class UploadRequest(Request):
+    """Запрос, загружаемые файлы которого не сохраняются в UPLOAD_FOLDER."""
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return tempfile.SpooledTemporaryFile(max_size=UPLOAD_SPOOL_THRESHOLD, mode='rb+')
+
 app = Flask(__name__)
+app.request_class = UploadRequest
 
 # --- Настройка CORS ---
 # Разрешаем запросы с вашего домена GitHub Pages
 # Можно указать список origins, если нужно
 CORS(app, origins=["https://zhbimbo.github.io", "http://localhost:5173"],  # Добавил localhost для локальной разработки
      methods=["GET", "POST", "OPTIONS"], 
-     allow_headers=["Content-Type"])
+     allow_headers=["Content-Type", "X-Profiling-Token"])
 
 # --- Конфигурация ---
 # Используем переменные окружения от Render или значения по умолчанию
@@ -33,6 +71,43 @@ CORS(app, origins=["https://zhbimbo.github.io", "http://localhost:5173"],  # Д
 UPLOAD_FOLDER = os.environ.get('UPLOAD_FOLDER', '/tmp/uploads')
 RESULT_FOLDER = os.environ.get('RESULT_FOLDER', '/tmp/results')
 MAX_CONTENT_LENGTH = int(os.environ.get('MAX_CONTENT_LENGTH', 16 * 1024 * 1024)) # 16MB по умолчанию
+# Загрузки до этого размера держим в памяти, больше - во временном файле (удаляется системой при закрытии)
+UPLOAD_SPOOL_THRESHOLD = int(os.environ.get('UPLOAD_SPOOL_THRESHOLD', 2 * 1024 * 1024))
+# Очередь асинхронной обработки: файл базы SQLite и число потоков-обработчиков в процессе
+JOB_DB_PATH = os.environ.get('JOB_DB_PATH', '/tmp/wb_jobs.sqlite3')
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 2))
+# Где выполнять обработку: 'inline' - в процессе веб-сервера, 'process' - в пуле процессов
+REPORT_BACKEND = os.environ.get('REPORT_BACKEND', 'inline')
+MAX_CONCURRENT_JOBS = int(os.environ.get('MAX_CONCURRENT_JOBS', os.cpu_count() or 1))
+MAX_JOBS_PER_CHILD = int(os.environ.get('MAX_JOBS_PER_CHILD', 20))  # 0 - без перезапуска
+JOB_TIMEOUT = float(os.environ.get('JOB_TIMEOUT', 300))  # секунды, 0 - без ограничения
+JOB_MEMORY_LIMIT_MB = int(os.environ.get('JOB_MEMORY_LIMIT_MB', 0))  # 0 - без ограничения
+# Кэш результатов в RESULT_FOLDER: лимит суммарного размера и время хранения после последнего обращения
+RESULT_CACHE_MAX_MB = int(os.environ.get('RESULT_CACHE_MAX_MB', 1024))
+RESULT_CACHE_TTL_HOURS = float(os.environ.get('RESULT_CACHE_TTL_HOURS', 7 * 24))
+# Хранилище сумм отчетов по продавцам для расчетов за произвольный период
+AGGREGATE_DB_PATH = os.environ.get('AGGREGATE_DB_PATH', '/tmp/wb_aggregates.sqlite3')
+# Пакетная обработка: максимум отчетов в одном запросе и суммарный размер распакованного zip-архива
+BATCH_MAX_FILES = int(os.environ.get('BATCH_MAX_FILES', 60))
+BATCH_MAX_UNPACKED_MB = int(os.environ.get('BATCH_MAX_UNPACKED_MB', 512))
+# CSV-отчеты от этого размера разбираются по частям одновременно в нескольких процессах пула
+# (REPORT_BACKEND=process), МБ; 0 - каждый отчет обрабатывается одним процессом
+PARALLEL_MIN_MB = int(os.environ.get('PARALLEL_MIN_MB', 32))
+# Число рабочих процессов пула (REPORT_BACKEND=process), запускаемых заранее при старте
+POOL_WARM_WORKERS = int(os.environ.get('POOL_WARM_WORKERS', 1))
+# Профилирование отдельных загрузок (?profile=1 с заголовком X-Profiling-Token); пусто - выключено
+PROFILING_TOKEN = os.environ.get('PROFILING_TOKEN', '')
+# Допуск обработок по оценке стоимости: бюджет памяти процесса на одновременные обработки, МБ
+# (0 - без ограничения), их максимум, сколько обработок может ждать и сколько секунд;
+# не дождавшиеся допуска запросы получают 429 с Retry-After
+ADMISSION_MEMORY_MB = int(os.environ.get('ADMISSION_MEMORY_MB', 512))
+ADMISSION_MAX_JOBS = int(os.environ.get('ADMISSION_MAX_JOBS', MAX_CONCURRENT_JOBS))
+ADMISSION_MAX_QUEUE = int(os.environ.get('ADMISSION_MAX_QUEUE', 16))
+ADMISSION_QUEUE_TIMEOUT = float(os.environ.get('ADMISSION_QUEUE_TIMEOUT', 30))
+# Наибольшая длительность потока событий хода обработки (/api/progress), секунды
+PROGRESS_STREAM_SECONDS = float(os.environ.get('PROGRESS_STREAM_SECONDS', 600))
+# USE_X_SENDFILE=1 - файлы результатов отдает фронтенд-сервер (nginx, заголовок X-Sendfile)
+USE_X_SENDFILE = os.environ.get('USE_X_SENDFILE', '0') == '1'
 
 # Создаем директории, если они не существуют
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
@@ -41,13 +116,398 @@ os.makedirs(RESULT_FOLDER, exist_ok=True)
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['RESULT_FOLDER'] = RESULT_FOLDER
 app.config['MAX_CONTENT_LENGTH'] = MAX_CONTENT_LENGTH
+app.config['USE_X_SENDFILE'] = USE_X_SENDFILE
 
 ALLOWED_EXTENSIONS = {'xlsx', 'csv'}
+BATCH_ARCHIVE_EXTENSION = 'zip'
+# Идентификатор отслеживаемой обработки (?progress_id=), который задает клиент
+PROGRESS_ID_PATTERN = re.compile(r'[A-Za-z0-9_-]{8,64}')
+# Что можно выгрузить через /api/export: таблицы результата или строки отчета, по которым они считаются
+EXPORT_TABLES = ('summary', 'russia', 'rows')
 
 def allowed_file(filename):
     """Проверяет, разрешено ли расширение файла."""
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+def request_value(name):
+    """
+    Параметр запроса (?name=) или поле формы multipart. Тело запроса другого типа не разбирается
+    как форма: в нем может быть сам отчет (curl --data-binary отправляет его как urlencoded).
+    """
+    value = request.args.get(name)
+    if value is None and request.mimetype == 'multipart/form-data':
+        value = request.form.get(name)
+    return value or ''
+
+def is_async_request():
+    """Запрошена ли асинхронная обработка (?async=1 или поле формы async)."""
+    return request_value('async').lower() in ('1', 'true', 'yes')
+
+report_pool = None
+if REPORT_BACKEND == 'process':
+    report_pool = ProcessPool(max_workers=MAX_CONCURRENT_JOBS, max_jobs_per_child=MAX_JOBS_PER_CHILD,
+                              timeout=JOB_TIMEOUT, memory_limit_mb=JOB_MEMORY_LIMIT_MB)
+
+def load_processor():
+    """
+    Импортирует processor (один раз; параллельные вызовы ждут завершения загрузки),
+    затем запускает очередь задач и заранее запускает процессы пула.
+
+    Под gunicorn с gunicorn.conf.py библиотеки уже загружены в master-процессе,
+    и импорт в рабочем процессе занимает миллисекунды.
+    """
+    global processor, PROCESSOR_AVAILABLE
+    with _processor_lock:
+        if processor_loaded.is_set():
+            return
+        started = time.perf_counter()
+        try:
+            import processor as processor_module
+            processor = processor_module
+            PROCESSOR_AVAILABLE = True
+        except ImportError as e:
+            logger.error(f"Не удалось импортировать processor: {e}")
+        STARTUP['processor_import_seconds'] = time.perf_counter() - started
+
+        if PROCESSOR_AVAILABLE and JOB_WORKERS > 0:
+            job_queue.start()
+        if PROCESSOR_AVAILABLE and report_pool is not None and POOL_WARM_WORKERS > 0:
+            started = time.perf_counter()
+            report_pool.warm_up(POOL_WARM_WORKERS)
+            STARTUP['pool_warm_up_seconds'] = time.perf_counter() - started
+
+        STARTUP['ready_seconds'] = time.perf_counter() - _IMPORT_STARTED
+        STARTUP['rss_bytes'] = rss()
+        processor_loaded.set()
+    logger.info(f"Процесс {os.getpid()} готов за {STARTUP['ready_seconds']:.2f} с "
+                f"(импорт processor {STARTUP['processor_import_seconds']:.2f} с), "
+                f"RSS {STARTUP['rss_bytes'] / 2 ** 20:.0f} МБ")
+
+def processor_available():
+    """Дожидается загрузки processor; True, если модуль обработки доступен."""
+    if not processor_loaded.is_set():
+        load_processor()
+    return PROCESSOR_AVAILABLE
+
+progress_board = progress.ProgressBoard()
+
+def run_processing(func, *args, **kwargs):
+    """
+    Выполняет функцию обработки processor в пуле процессов или в текущем процессе (REPORT_BACKEND).
+
+    Функция получает словарь stats; после выполнения длительность этапов, число строк
+    и пиковая память процесса записываются в метрики. Если ход обработки отслеживается
+    (progress_board.tracking), stats передает его в progress_board.
+    """
+    stats = progress_board.stats()
+    try:
+        if report_pool is not None:
+            return report_pool.run(func, *args, stats=stats, **kwargs)
+        # В текущем процессе пик памяти приблизителен: его поднимают и параллельные запросы
+        reset_peak_rss()
+        try:
+            return func(*args, stats=stats, **kwargs)
+        finally:
+            stats['peak_rss_bytes'] = peak_rss()
+    finally:
+        metrics.observe_report(stats)
+
+def observe_result(result_path):
+    """Записывает в метрики размер построенного Excel-файла."""
+    metrics.RESULT_BYTES.observe(os.path.getsize(result_path))
+
+admission = AdmissionController(ADMISSION_MEMORY_MB * 1024 * 1024, max_running=ADMISSION_MAX_JOBS,
+                                max_queue=ADMISSION_MAX_QUEUE, queue_timeout=ADMISSION_QUEUE_TIMEOUT)
+
+def job_cost(source, file_format=None, size=None):
+    """
+    Оценка стоимости обработки отчета (admission.estimate_cost) по числу его строк.
+
+    size - размер непозиционируемого потока (Content-Length), из которого нельзя ничего прочитать заранее.
+    """
+    file_format = file_format or processor.report_format(source)
+    rows = processor.estimate_report_rows(source, file_format, size)
+    return estimate_cost(rows, file_format, processor.CHUNK_ROWS)
+
+def run_report(source, result_path, file_format=None, queue_timeout=-1):
+    """
+    Обрабатывает отчет в пуле процессов или в текущем процессе (REPORT_BACKEND).
+
+    source - путь к файлу или файловый объект; в пул процессов содержимое файлового
+    объекта передается целиком. Большой CSV разбирается по частям (parallel_aggregate).
+    Обработка начинается после допуска (admission), queue_timeout - сколько его ждать.
+    """
+    with admission.admit(job_cost(source, file_format), queue_timeout):
+        aggregates = parallel_aggregate(source, file_format)
+        if aggregates is not None:
+            structured_data, second_table_data = processor.build_report_tables(aggregates)
+            render_report({'structured_data': structured_data, 'second_table_data': second_table_data},
+                          result_path)
+            return structured_data, second_table_data
+
+        result = run_processing(processor.process_wb_report_file, pool_source(source), result_path, file_format)
+        observe_result(result_path)
+        return result
+
+def parallel_aggregate(source, file_format=None):
+    """
+    Суммы большого CSV-отчета, части которого разбираются одновременно в процессах пула.
+
+    Возвращает None, если отчет обрабатывается одной задачей: нет пула процессов,
+    не CSV или файл меньше PARALLEL_MIN_MB. Файловый объект для разбора по частям
+    копируется во временный файл (tempfile), который удаляется по окончании разбора. В метрики записываются суммарные по частям
+    длительности этапов и наибольшая пиковая память процесса.
+    """
+    file_format = file_format or processor.report_format(source)
+    if report_pool is None or file_format != 'csv' or PARALLEL_MIN_MB <= 0:
+        return None
+    if isinstance(source, str):
+        size = os.path.getsize(source)
+    else:
+        position = source.tell()
+        size = source.seek(0, os.SEEK_END) - position
+        source.seek(position)
+    if size < PARALLEL_MIN_MB * 1024 * 1024:
+        return None
+
+    with contextlib.ExitStack() as cleanup:
+        path = source
+        if not isinstance(source, str):
+            # Части читаются по пути к файлу: копия файлового объекта удаляется при выходе, в том числе по ошибке
+            temp_file = cleanup.enter_context(tempfile.NamedTemporaryFile(prefix='wb_parts_', suffix='.csv'))
+            shutil.copyfileobj(source, temp_file)
+            temp_file.flush()
+            source.seek(position)
+            path = temp_file.name
+        header_line, ranges = processor.csv_partitions(path, report_pool.max_workers)
+        if len(ranges) < 2:
+            return None
+        logger.info(f"Разбор CSV по частям: {len(ranges)} частей")
+        stats = progress_parts(len(ranges), processor.estimate_report_rows(path, 'csv'))
+        futures = [batch_executor.submit(report_pool.run, processor.aggregate_csv_range, path, header_line,
+                                         start, end, stats=part_stats)
+                   for (start, end), part_stats in zip(ranges, stats)]
+        # Если одна из частей не разобрана, не начатые части не нужны
+        for future in futures:
+            cleanup.callback(future.cancel)
+        # Суммы порций объединяются по порядку - как при обработке файла целиком
+        aggregates = None
+        for future in futures:
+            for partial in future.result():
+                aggregates = processor.fold_aggregates(aggregates, partial)
+
+    metrics.observe_report({
+        'parse_seconds': sum(part.get('parse_seconds', 0) for part in stats),
+        'aggregate_seconds': sum(part.get('aggregate_seconds', 0) for part in stats),
+        'rows': sum(part.get('rows', 0) for part in stats),
+        'peak_rss_bytes': max(part.get('peak_rss_bytes', 0) for part in stats)
+    })
+    return aggregates
+
+def progress_parts(parts, rows_total=None):
+    """
+    Словари stats для частей одной обработки (parallel_aggregate): если ее ход отслеживается,
+    о ходе разбора сообщается суммой строк, прочитанных всеми частями.
+    """
+    progress_id = progress_board.current()
+    if progress_id is None:
+        return [{} for _ in range(parts)]
+    rows = [0] * parts
+    lock = threading.Lock()
+
+    def publisher(index):
+        def publish(update):
+            if 'rows' not in update:
+                return
+            with lock:
+                rows[index] = update['rows']
+                progress_board.update(progress_id, {'stage': update['stage'], 'rows': sum(rows),
+                                                    'rows_total': rows_total or None})
+        return publish
+
+    return [progress.ProgressStats(publisher(index)) for index in range(parts)]
+
+def pool_source(source):
+    """Путь к файлу или копия содержимого файлового объекта, которую можно передать в другой процесс."""
+    if report_pool is None or isinstance(source, str) or isinstance(source, io.BytesIO):
+        return source
+    return io.BytesIO(source.read())
+
+def run_aggregate(source, file_format=None):
+    """Читает отчет и возвращает его суммы - в пуле процессов или в текущем процессе."""
+    return run_processing(processor.aggregate_report_file, pool_source(source), file_format)
+
+aggregate_store = AggregateStore(AGGREGATE_DB_PATH)
+
+# Отчеты пакета разбираются одновременно: с REPORT_BACKEND=process - в разных процессах
+batch_executor = ThreadPoolExecutor(max_workers=MAX_CONCURRENT_JOBS, thread_name_prefix='batch')
+
+result_cache = ResultCache(RESULT_FOLDER, PROCESSOR_VERSION, max_bytes=RESULT_CACHE_MAX_MB * 1024 * 1024,
+                           ttl_seconds=RESULT_CACHE_TTL_HOURS * 3600)
+
+def run_profiled_report(source, file_format, profile_id):
+    """
+    Обрабатывает отчет под профилировщиком (кэш результатов не используется).
+
+    Результат и артефакты профиля сохраняются в RESULT_FOLDER под именами profile_<id>.*;
+    возвращает имя файла результата.
+    """
+    profiling.remove_expired(RESULT_FOLDER, RESULT_CACHE_TTL_HOURS * 3600)
+    result_filename = f"{profiling.PROFILE_PREFIX}{profile_id}.xlsx"
+    result_path = os.path.join(RESULT_FOLDER, result_filename)
+    with admission.admit(job_cost(source, file_format)):
+        run_processing(profiling.profile_call, processor.process_wb_report_file, RESULT_FOLDER, profile_id,
+                       pool_source(source), result_path, file_format)
+    observe_result(result_path)
+    return result_filename
+
+def run_cached_report(source, file_format=None, cache_key=None, queue_timeout=-1):
+    """Возвращает (имя файла результата, взят ли он из кэша), обрабатывая файл только при промахе."""
+    cache_key = cache_key or result_cache.key_for_file(source)
+    return result_cache.get_or_create(
+        cache_key, lambda result_path: run_report(source, result_path, file_format, queue_timeout))
+
+def run_summary(source, file_format=None):
+    """Возвращает данные обеих таблиц отчета без Excel-файла - в пуле процессов или в текущем процессе."""
+    with admission.admit(job_cost(source, file_format)):
+        aggregates = parallel_aggregate(source, file_format)
+        if aggregates is not None:
+            return processor.build_report_tables(aggregates)
+        return run_processing(processor.summarize_report_file, pool_source(source), file_format)
+
+def render_report(tables, result_path):
+    """Строит Excel-файл по сохраненным таблицам результата."""
+    run_processing(processor.render_report_file, tables['structured_data'], tables['second_table_data'], result_path)
+    observe_result(result_path)
+
+def cached_summary(cache_key, summarize):
+    """
+    Возвращает (таблицы результата, взяты ли они из кэша).
+
+    При промахе summarize() возвращает (structured_data, second_table_data),
+    таблицы сохраняются в кэш результатов в JSON - Excel-файл по ним строится
+    только при первом скачивании (download_file).
+    """
+    tables_filename, cached = result_cache.get_or_create(
+        cache_key, lambda path: write_tables(path, *summarize()), suffix=TABLES_SUFFIX)
+    return result_cache.read_tables(tables_filename), cached
+
+def summarize_stream(stream):
+    """
+    Разбирает CSV прямо из входящего потока, по мере поступления данных.
+
+    Возвращает (данные обеих таблиц, ключ кэша); ключ считается попутно с разбором,
+    поэтому известен только после него: повторная загрузка того же тела разбирается
+    и сворачивается в суммы заново, из кэша берется только готовый результат.
+    Стоимость обработки оценивается по размеру тела запроса.
+    """
+    reader = result_cache.hashing_reader(stream)
+    stats = progress_board.stats()
+    with admission.admit(job_cost(stream, 'csv', request.content_length)):
+        try:
+            summary = processor.summarize_report_file(reader, 'csv', stats=stats)
+        finally:
+            metrics.observe_report(stats)
+    return summary, reader.raw.key()
+
+def summarize_upload(stream, file_format):
+    """
+    Таблицы результата загруженного файла: (таблицы, ключ кэша, взяты ли они из кэша).
+
+    CSV из тела запроса разбирается по мере поступления, ключ кэша считается попутно
+    (summarize_stream) - такой файл разбирается и при попадании в кэш.
+    """
+    if file_format == 'csv' and not stream.seekable() and report_pool is None:
+        summary, cache_key = summarize_stream(stream)
+        tables, cached = cached_summary(cache_key, lambda: summary)
+    else:
+        stream = seekable_stream(stream)
+        cache_key = result_cache.key_for_file(stream)
+        tables, cached = cached_summary(cache_key, lambda: run_summary(stream, file_format))
+    return tables, cache_key, cached
+
+def run_streamed_csv_report(stream):
+    """
+    Обрабатывает CSV прямо из входящего потока, по мере поступления данных.
+
+    Если такой файл уже обрабатывался, готовый результат переиспользуется
+    и Excel не формируется повторно. Разбор и свертка в суммы выполняются
+    в любом случае: ключ кэша известен только после чтения всего тела (summarize_stream).
+    """
+    (structured_data, second_table_data), cache_key = summarize_stream(stream)
+    return result_cache.get_or_create(
+        cache_key, lambda result_path: render_report(
+            {'structured_data': structured_data, 'second_table_data': second_table_data}, result_path))
+
+def run_report_job(job_id, input_path):
+    """
+    Обрабатывает файл задачи из очереди и возвращает имя файла результата.
+
+    Ход обработки отслеживается под идентификатором задачи (/api/jobs/<job_id>/events).
+    """
+    try:
+        with progress_board.tracking(job_id):
+            # Задача уже принята в очередь: ждет допуска сколько потребуется
+            result_filename, _ = run_cached_report(input_path, queue_timeout=None)
+            progress_board.finish(job_id, result_links(result_filename))
+    except Exception as e:
+        metrics.ERRORS.inc(exception=type(e).__name__)
+        raise
+    # Файл задачи удаляет очередь, когда задача завершается; если процесс упадет
+    # во время обработки, файл останется для повторной попытки
+    return result_filename
+
+job_queue = JobQueue(JOB_DB_PATH, handler=run_report_job, workers=JOB_WORKERS)
+
+# Метрики состояния, которые считываются в момент запроса /metrics
+metrics.Gauge('wb_job_queue_depth', 'Число задач в очереди асинхронной обработки',
+              callback=lambda: job_queue.stats()['queue_depth'])
+metrics.Gauge('wb_process_pool_in_flight', 'Число задач, выполняемых в пуле процессов',
+              callback=lambda: report_pool.in_flight if report_pool is not None else 0)
+metrics.Counter('wb_result_cache_requests_total', 'Обращения к кэшу результатов', ['result'],
+                callback=lambda: {('hit',): result_cache.hits, ('miss',): result_cache.misses})
+metrics.Gauge('wb_result_cache_bytes', 'Суммарный размер файлов в кэше результатов',
+              callback=lambda: result_cache.stats()['size_bytes'])
+metrics.Gauge('wb_startup_seconds', 'Время запуска процесса по этапам', ['phase'],
+              callback=lambda: {(name[:-len('_seconds')],): value for name, value in STARTUP.items()
+                                if name.endswith('_seconds')})
+metrics.Gauge('wb_process_resident_memory_bytes', 'Текущий RSS процесса веб-сервера', callback=rss)
+metrics.Gauge('wb_admission_memory_used_bytes', 'Оценка памяти допущенных обработок',
+              callback=lambda: admission.stats()['memory_used_bytes'])
+metrics.Gauge('wb_admission_memory_budget_bytes', 'Бюджет памяти одновременных обработок',
+              callback=lambda: admission.memory_budget)
+metrics.Gauge('wb_admission_jobs', 'Число обработок: выполняемых и ожидающих допуска', ['state'],
+              callback=lambda: {('running',): admission.stats()['running'],
+                                ('waiting',): admission.stats()['waiting']})
+metrics.Counter('wb_admission_decisions_total', 'Решения о допуске обработок', ['decision'],
+                callback=lambda: {('admitted',): admission.admitted, ('queued',): admission.queued,
+                                  ('rejected',): admission.rejected})
+
+def instrumented(endpoint):
+    """Декоратор эндпоинта: длительность, число выполняющихся запросов, коды ответа и объем загрузки."""
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            if request.method == 'OPTIONS':
+                return view(*args, **kwargs)
+
+            metrics.REQUESTS_IN_FLIGHT.inc(endpoint=endpoint)
+            started = time.perf_counter()
+            status = 500
+            try:
+                response = app.make_response(view(*args, **kwargs))
+                status = response.status_code
+                return response
+            finally:
+                metrics.REQUESTS_IN_FLIGHT.dec(endpoint=endpoint)
+                metrics.REQUEST_DURATION.observe(time.perf_counter() - started, endpoint=endpoint)
+                metrics.REQUESTS.inc(endpoint=endpoint, status=status)
+                if request.method == 'POST' and request.content_length:
+                    metrics.REQUEST_BYTES.observe(request.content_length, endpoint=endpoint)
+                    metrics.BYTES_PROCESSED.inc(request.content_length)
+        return wrapper
+    return decorator
+
 @app.route('/', methods=['GET'])
 def home():
     """Корневой эндпоинт для проверки работы API."""
@@ -58,9 +518,182 @@ def health_check():
     """Health check endpoint для Render."""
     return jsonify({"status": "healthy"}), 200
 
+@app.route('/readyz', methods=['GET'])
+def readiness_check():
+    """Готовность к обработке: 503, пока загружается processor; время запуска и память процесса."""
+    if not processor_loaded.is_set():
+        return jsonify({"status": "starting", "pid": os.getpid()}), 503
+    status = "ready" if PROCESSOR_AVAILABLE else "processor unavailable"
+    return jsonify({"status": status, "pid": os.getpid(), "startup": STARTUP, "rss_bytes": rss()}), \
+        200 if PROCESSOR_AVAILABLE else 503
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """
+    Метрики в формате Prometheus.
+
+    Метрики считаются в каждом процессе отдельно: при нескольких процессах gunicorn
+    каждый запрос /metrics попадает в один из них.
+    """
+    return app.response_class(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
+def busy_response(e):
+    """Ответ 429 на обработку, не получившую допуска (AdmissionRejected), с заголовком Retry-After."""
+    logger.warning(f"Обработка отклонена: {e}, повтор через {e.retry_after} с")
+    response = jsonify({'error': str(e), 'retry_after': e.retry_after})
+    response.status_code = 429
+    response.headers['Retry-After'] = str(e.retry_after)
+    return response
+
+def too_large_response():
+    """Ответ 413: тело запроса без Content-Length (chunked) при чтении оказалось больше MAX_CONTENT_LENGTH."""
+    logger.warning("Тело запроса превышает MAX_CONTENT_LENGTH")
+    return jsonify({'error': f'Файл слишком большой (максимум {MAX_CONTENT_LENGTH // (1024 * 1024)} МБ)'}), 413
+
+def result_links(result_filename):
+    """Имя файла результата и ссылка на его скачивание (ответы и событие завершения обработки)."""
+    return {'result_filename': result_filename, 'download_url': f"/api/download/{result_filename}"}
+
+def finish_progress(result):
+    """Отмечает завершение отслеживаемой обработки запроса (progress_tracking) с данными для клиента."""
+    progress_id = progress_board.current()
+    if progress_id is not None:
+        progress_board.finish(progress_id, result)
+
+def event_stream(events):
+    """Ответ - поток Server-Sent Events (буферизация в прокси отключается)."""
+    response = app.response_class(events, mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+class RequestError(Exception):
+    """Ошибка в параметрах или файлах запроса (возвращается клиенту с кодом status)."""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+def error_response(e, batch=False):
+    """
+    Ответ эндпоинта обработки на исключение e: код ответа и текст ошибки по типу исключения.
+
+    RequestError - его код, AdmissionRejected - 429 (busy_response), тело больше MAX_CONTENT_LENGTH - 413,
+    файл не похож на отчет - 400, превышено время обработки - 504, лимит памяти - 413, остальные - 500.
+    batch - обрабатывались несколько файлов (текст ошибки во множественном числе).
+    """
+    if isinstance(e, RequestError):
+        logger.warning(str(e))
+        return jsonify({'error': str(e)}), e.status
+    if isinstance(e, AdmissionRejected):
+        return busy_response(e)
+    if isinstance(e, RequestEntityTooLarge):
+        return too_large_response()
+    if isinstance(e, HTTPException):
+        logger.warning(f"Неверный запрос: {e}")
+        return jsonify({'error': e.description}), e.code
+
+    metrics.ERRORS.inc(exception=type(e).__name__)
+    failure = 'Ошибка обработки файлов' if batch else 'Ошибка обработки файла'
+    if isinstance(e, ReportHeaderError):
+        logger.warning(f"Файл не распознан как отчет: {e}")
+        return jsonify({'error': str(e)}), 400
+    if isinstance(e, JobTimeoutError):
+        logger.error(f"Превышено время обработки: {e}")
+        return jsonify({'error': f'{failure}: {e}'}), 504
+    if isinstance(e, JobMemoryError):
+        logger.error(f"Превышен лимит памяти при обработке: {e}")
+        too_large = 'Файлы слишком большие' if batch else 'Файл слишком большой'
+        return jsonify({'error': f'{too_large} для обработки: {e}'}), 413
+    logger.error(f"{failure} ({request.endpoint}): {e}", exc_info=e)
+    return jsonify({'error': f'{failure}: {e}'}), 500
+
+def upload_source():
+    """
+    Загруженный файл запроса: (имя файла, формат, поток с содержимым).
+
+    Файл передается полем формы 'file' (multipart) или телом запроса с именем файла
+    в параметре ?filename=. При ошибке в запросе выбрасывается RequestError.
+    """
+    if request.mimetype == 'multipart/form-data':
+        # Проверка наличия файла в запросе
+        if 'file' not in request.files:
+            raise RequestError('Файл не найден в запросе')
+
+        file = request.files['file']
+        filename = file.filename
+        stream = file.stream
+
+        # Проверка, был ли выбран файл
+        if filename == '':
+            raise RequestError('Файл не выбран')
+    else:
+        # Файл в теле запроса
+        filename = request.args.get('filename', '')
+        stream = request.stream
+        if not filename:
+            raise RequestError('Файл не найден в запросе')
+
+    # Проверка допустимого типа файла
+    if not allowed_file(filename):
+        raise RequestError('Недопустимый тип файла. Разрешены только .xlsx и .csv')
+
+    return filename, filename.rsplit('.', 1)[1].lower(), stream
+
+def profiling_requested():
+    """
+    Запрошено ли профилирование обработки (?profile=1).
+
+    Профилирование доступно только с заголовком X-Profiling-Token, равным PROFILING_TOKEN;
+    иначе выбрасывается RequestError.
+    """
+    if request.args.get('profile', '').lower() not in ('1', 'true', 'yes'):
+        return False
+    check_profiling_token()
+    return True
+
+def check_profiling_token():
+    """Проверяет заголовок X-Profiling-Token (RequestError с кодом 403, если он неверен)."""
+    token = request.headers.get('X-Profiling-Token', '')
+    if not PROFILING_TOKEN or not hmac.compare_digest(token.encode('utf-8'), PROFILING_TOKEN.encode('utf-8')):
+        raise RequestError('Профилирование не разрешено', 403)
+
+def progress_tracking():
+    """
+    Отслеживание хода обработки запроса с ?progress_id= (progress_board.tracking);
+    без параметра - пустой контекст. При неверном идентификаторе выбрасывается RequestError.
+    """
+    progress_id = request.args.get('progress_id', '')
+    if not progress_id:
+        return contextlib.nullcontext()
+    if not PROGRESS_ID_PATTERN.fullmatch(progress_id):
+        raise RequestError('Неверный progress_id: от 8 до 64 латинских букв, цифр, - и _')
+    return progress_board.tracking(progress_id)
+
+def seekable_stream(stream, copy=False):
+    """
+    Поток запроса читается один раз - для подсчета ключа и разбора xlsx нужна копия.
+
+    copy=True - копия создается и для позиционируемого потока: файлы формы закрываются
+    в конце запроса, а копию можно читать и после него (потоковый ответ).
+    """
+    if stream.seekable() and not copy:
+        return stream
+    spooled = tempfile.SpooledTemporaryFile(max_size=UPLOAD_SPOOL_THRESHOLD, mode='rb+')
+    shutil.copyfileobj(stream, spooled)
+    spooled.seek(0)
+    return spooled
+
 @app.route('/api/upload', methods=['POST', 'OPTIONS'])
+@instrumented('upload')
 def upload_file():
-    """Эндпоинт для загрузки и обработки файла."""
+    """
+    Эндпоинт для загрузки и обработки файла.
+
+    Файл передается полем формы 'file' (multipart) или телом запроса с именем файла
+    в параметре ?filename=. CSV в теле запроса разбирается по мере поступления данных.
+    С ?progress_id= ход обработки отдается потоком событий /api/progress/<progress_id>.
+    """
     # Обработка preflight OPTIONS запроса для CORS
     if request.method == 'OPTIONS':
         # Flask-CORS должен обработать это автоматически, но явно вернем 200 OK
@@ -68,93 +701,642 @@ def upload_file():
         
     logger.info("Получен запрос на загрузку файла")
     
-    if not PROCESSOR_AVAILABLE:
+    if not processor_available():
         logger.error("Модуль processor недоступен")
         return jsonify({'error': 'Сервис обработки временно недоступен'}), 500
 
-    # Проверка наличия файла в запросе
-    if 'file' not in request.files:
-        logger.warning("Файл не найден в запросе")
-        return jsonify({'error': 'Файл не найден в запросе'}), 400
+    try:
+        filename, file_format, stream = upload_source()
+        profile = profiling_requested()
+        with progress_tracking():
+            if profile:
+                profile_id = profiling.new_profile_id()
+                logger.info(f"Обработка файла с профилированием, профиль {profile_id}")
+                result_filename = run_profiled_report(seekable_stream(stream), file_format, profile_id)
+                return jsonify({
+                    'message': 'Файл успешно обработан',
+                    'result_filename': result_filename,
+                    'download_url': f"/api/download/{result_filename}",
+                    'cached': False,
+                    'profile_id': profile_id,
+                    'profile_url': f"/api/profiles/{profile_id}"
+                }), 200
 
-    file = request.files['file']
+            if file_format == 'csv' and not stream.seekable() and report_pool is None and not is_async_request():
+                logger.info("Начало потоковой обработки CSV...")
+                result_filename, cached = run_streamed_csv_report(stream)
+            else:
+                stream = seekable_stream(stream)
 
-    # Проверка, был ли выбран файл
-    if file.filename == '':
-        logger.warning("Файл не выбран")
-        return jsonify({'error': 'Файл не выбран'}), 400
+                # Тот же файл уже обрабатывался - отдаем готовый результат
+                cache_key = result_cache.key_for_file(stream)
+                result_filename = result_cache.lookup(cache_key)
+                cached = result_filename is not None
+                if cached:
+                    logger.info(f"Результат найден в кэше: {result_filename}")
 
-    # Проверка допустимого типа файла
-    if file and allowed_file(file.filename):
-        try:
-            # Генерируем уникальное имя для временного файла
-            # Используем оригинальное расширение
-            original_extension = file.filename.rsplit('.', 1)[1].lower()
-            unique_id = str(uuid.uuid4())
-            temp_filename = f"temp_{unique_id}.{original_extension}"
-            temp_file_path = os.path.join(app.config['UPLOAD_FOLDER'], temp_filename)
-            
-            # Сохраняем загруженный файл
-            file.save(temp_file_path)
-            logger.info(f"Файл сохранен как временный: {temp_file_path}")
-
-            # Определяем имя файла результата
-            result_filename = f"результат_{unique_id}.xlsx"
-            result_file_path = os.path.join(app.config['RESULT_FOLDER'], result_filename)
-            
-            logger.info("Начало обработки файла...")
-            # Вызываем вашу функцию обработки
-            # Передаем путь к временному файлу и путь для сохранения результата
-            process_wb_report_file(temp_file_path, result_file_path)
-            logger.info(f"Файл обработан, результат сохранен: {result_file_path}")
-
-            # Очистка временного загруженного файла
-            if os.path.exists(temp_file_path):
-                os.remove(temp_file_path)
-                logger.info("Временный файл удален")
+                # Асинхронный режим: сохраняем файл для очереди и сразу возвращаем идентификатор задачи
+                elif is_async_request():
+                    temp_file_path = os.path.join(app.config['UPLOAD_FOLDER'], f"temp_{uuid.uuid4()}.{file_format}")
+                    with open(temp_file_path, 'wb') as temp_file:
+                        shutil.copyfileobj(stream, temp_file)
+                    job_id = job_queue.submit(temp_file_path)
+                    logger.info(f"Файл поставлен в очередь, задача {job_id}")
+                    job_links = {
+                        'job_id': job_id,
+                        'status_url': f"/api/jobs/{job_id}",
+                        'events_url': f"/api/jobs/{job_id}/events"
+                    }
+                    finish_progress(job_links)
+                    return jsonify(dict(job_links, message='Файл поставлен в очередь на обработку')), 202
+
+                else:
+                    logger.info("Начало обработки файла...")
+                    # Одновременные загрузки того же файла дождутся одной обработки и получат общий результат
+                    result_filename, cached = run_cached_report(stream, file_format, cache_key)
+            logger.info(f"Файл обработан, результат: {result_filename}")
+            finish_progress(dict(result_links(result_filename), cached=cached))
 
             # Возвращаем успех с информацией о результате
             return jsonify({
                 'message': 'Файл успешно обработан',
                 'result_filename': result_filename,
-                'download_url': f"/api/download/{result_filename}"
+                'download_url': f"/api/download/{result_filename}",
+                'cached': cached
             }), 200
 
-        except Exception as e:
-            logger.error(f"Ошибка обработки файла: {e}", exc_info=True)
-            # Пытаемся удалить временные файлы в случае ошибки
-            if 'temp_file_path' in locals() and os.path.exists(temp_file_path):
-                try:
-                    os.remove(temp_file_path)
-                    logger.info("Временный файл удален после ошибки")
-                except Exception as remove_error:
-                    logger.error(f"Ошибка при удалении временного файла: {remove_error}")
-            return jsonify({'error': f'Ошибка обработки файла: {str(e)}'}), 500
+    except Exception as e:
+        return error_response(e)
+
+def batch_reports():
+    """
+    Собирает отчеты пакетной загрузки: файлы полей 'files'/'file' и содержимое zip-архивов.
 
-    else:
-        return jsonify({'error': 'Недопустимый тип файла. Разрешены только .xlsx и .csv'}), 400
+    Возвращает список (название периода, формат, файловый объект) в порядке загрузки,
+    отчеты из архива - в порядке имен.
+    """
+    reports = []
+    for file in request.files.getlist('files') + request.files.getlist('file'):
+        if file.filename == '':
+            continue
+        label, extension = os.path.splitext(os.path.basename(file.filename))
+        extension = extension.lstrip('.').lower()
+
+        if extension == BATCH_ARCHIVE_EXTENSION:
+            try:
+                archive = zipfile.ZipFile(file.stream)
+            except zipfile.BadZipFile:
+                raise RequestError(f'Не удалось открыть архив {file.filename}')
+            with archive:
+                members = sorted(
+                    (info for info in archive.infolist()
+                     if not info.is_dir() and not info.filename.startswith('__MACOSX/')
+                     and allowed_file(info.filename)),
+                    key=lambda info: info.filename
+                )
+                if sum(info.file_size for info in members) > BATCH_MAX_UNPACKED_MB * 1024 * 1024:
+                    raise RequestError(f'Архив {file.filename} слишком большой', 413)
+                for info in members:
+                    member_label, member_extension = os.path.splitext(os.path.basename(info.filename))
+                    reports.append((member_label, member_extension.lstrip('.').lower(),
+                                    io.BytesIO(archive.read(info))))
+        elif allowed_file(file.filename):
+            reports.append((label, extension, file.stream))
+        else:
+            raise RequestError(f'Недопустимый тип файла {file.filename}. Разрешены .xlsx, .csv и .zip')
+
+        if len(reports) > BATCH_MAX_FILES:
+            raise RequestError(f'Слишком много отчетов в запросе (максимум {BATCH_MAX_FILES})')
+    return reports
+
+def cached_aggregates(stream, file_format, cache_key=None, admitted=False):
+    """
+    Суммы отчета из кэша результатов: отчет, суммы которого уже считались (пакет, сравнение
+    периодов), повторно не разбирается. При промахе суммы сохраняются в кэш в JSON.
+
+    cache_key - ключ файла, если уже посчитан; admitted - обработка уже допущена вызывающим
+    (пакет допускается целиком), иначе разбор отчета ждет допуска (admission).
+    """
+    cache_key = cache_key or result_cache.key_for_file(stream)
+
+    def build(path):
+        with contextlib.nullcontext() if admitted else admission.admit(job_cost(stream, file_format)):
+            write_aggregates(path, run_aggregate(stream, file_format))
+
+    filename, _ = result_cache.get_or_create(cache_key, build, suffix=AGGREGATES_SUFFIX)
+    return result_cache.read_aggregates(filename)
+
+def run_batch_report(reports):
+    """
+    Строит сводный отчет по нескольким файлам и возвращает (имя файла результата, взят ли он из кэша).
+
+    Отчеты разбираются параллельно, их суммы объединяются - общее время близко
+    к времени разбора самого большого файла. Суммы отчетов сохраняются в кэш (cached_aggregates).
+    """
+    keys = [result_cache.key_for_file(stream) for _, _, stream in reports]
+    cache_key = result_cache.key_for_batch((label, key) for (label, _, _), key in zip(reports, keys))
+
+    def build(result_path):
+        # Пакет допускается целиком: отчеты разбираются параллельно в batch_executor
+        with admission.admit(combine_costs(job_cost(stream, file_format) for _, file_format, stream in reports)):
+            aggregates = list(batch_executor.map(
+                lambda report: cached_aggregates(report[2], report[1], report[3], admitted=True),
+                [report + (key,) for report, key in zip(reports, keys)]))
+            periods = [(label, processor.build_report_tables(period_aggregates)[1])
+                       for (label, _, _), period_aggregates in zip(reports, aggregates)]
+            structured_data, second_table_data = processor.build_report_tables(
+                processor.merge_aggregates(aggregates))
+            processor.create_consolidated_excel(structured_data, second_table_data, periods, result_path)
+            observe_result(result_path)
+
+    return result_cache.get_or_create(cache_key, build)
+
+def run_comparison(reports):
+    """
+    Сравнивает периоды - отчеты пакета в порядке загрузки (processor.compare_periods).
+
+    Возвращает (сравнение, имя файла Excel со сравнением, взят ли он из кэша). Суммы отчетов
+    берутся из кэша (cached_aggregates): разбираются только отчеты, которых в нем нет, -
+    параллельно, каждый после допуска (admission).
+    """
+    keys = [result_cache.key_for_file(stream) for _, _, stream in reports]
+    aggregates = list(batch_executor.map(
+        lambda report: cached_aggregates(report[2], report[1], report[3]),
+        [report + (key,) for report, key in zip(reports, keys)]))
+    comparison = processor.compare_periods([(label, period_aggregates)
+                                            for (label, _, _), period_aggregates in zip(reports, aggregates)])
+
+    def build(result_path):
+        processor.create_comparison_excel(comparison, result_path)
+        observe_result(result_path)
+
+    cache_key = result_cache.key_for_batch(((label, key) for (label, _, _), key in zip(reports, keys)), 'compare')
+    result_filename, cached = result_cache.get_or_create(cache_key, build)
+    return comparison, result_filename, cached
+
+@app.route('/api/summary', methods=['POST', 'OPTIONS'])
+@instrumented('summary')
+def upload_summary():
+    """
+    Эндпоинт обработки файла с ответом в виде таблиц (числа, без форматирования).
+
+    Файл передается так же, как в /api/upload. Excel-файл не строится: он будет
+    создан при первом обращении к download_url и затем отдаваться из кэша.
+    С ?progress_id= ход обработки отдается потоком событий /api/progress/<progress_id>.
+    """
+    if request.method == 'OPTIONS':
+        return jsonify({"status": "OK"}), 200
+
+    logger.info("Получен запрос на расчет таблиц")
+
+    if not processor_available():
+        logger.error("Модуль processor недоступен")
+        return jsonify({'error': 'Сервис обработки временно недоступен'}), 500
+
+    try:
+        filename, file_format, stream = upload_source()
+        with progress_tracking():
+            tables, cache_key, cached = summarize_upload(stream, file_format)
+            result_filename = result_cache.filename(cache_key)
+            finish_progress(dict(result_links(result_filename), cached=cached))
+        logger.info(f"Таблицы рассчитаны, результат: {result_filename}")
+        return jsonify({
+            'structured_data': tables['structured_data'],
+            'second_table_data': tables['second_table_data'],
+            'result_filename': result_filename,
+            'download_url': f"/api/download/{result_filename}",
+            'cached': cached
+        }), 200
+
+    except Exception as e:
+        return error_response(e)
+
+def export_params():
+    """Формат (?format=) и данные (?table=) выгрузки /api/export; при ошибке выбрасывается RequestError."""
+    export_format = request.args.get('format', 'csv').lower()
+    table = request.args.get('table', 'summary').lower()
+    try:
+        exports.check_format(export_format)
+    except exports.ExportFormatError as e:
+        raise RequestError(str(e), 400 if export_format not in exports.EXPORT_FORMATS else 501)
+    if table not in EXPORT_TABLES:
+        raise RequestError(f"Неизвестные данные выгрузки: {table}. Доступны: {', '.join(EXPORT_TABLES)}")
+    return export_format, table
+
+def export_rows(stream, file_format, ticket):
+    """
+    Порции строк отчета для выгрузки (processor.iter_report_rows); по окончании поток
+    закрывается, а бюджет допуска ticket (admission.acquire) освобождается.
+    """
+    try:
+        yield from processor.iter_report_rows(stream, file_format)
+    finally:
+        stream.close()
+        admission.release(ticket)
+
+@app.route('/api/export', methods=['POST', 'OPTIONS'])
+@instrumented('export')
+def export_report():
+    """
+    Эндпоинт выгрузки результата в форматах для обработки программами, без Excel.
+
+    Файл передается так же, как в /api/upload. ?format= - csv (по умолчанию), ndjson,
+    parquet или arrow; ?table= - summary (первая таблица), russia (вторая таблица)
+    или rows (строки отчета, по которым считаются таблицы). Таблицы берутся из кэша
+    результатов, строки читаются и отдаются порциями по мере кодирования.
+    """
+    if request.method == 'OPTIONS':
+        return jsonify({"status": "OK"}), 200
+
+    logger.info("Получен запрос на выгрузку")
+
+    if not processor_available():
+        logger.error("Модуль processor недоступен")
+        return jsonify({'error': 'Сервис обработки временно недоступен'}), 500
+
+    try:
+        export_format, table = export_params()
+        filename, file_format, stream = upload_source()
+        if table == 'rows':
+            # Строки читаются при отдаче ответа, после завершения запроса: CSV из тела запроса -
+            # прямо из потока, остальные файлы - из копии
+            if file_format != 'csv' or stream.seekable():
+                stream = seekable_stream(stream, copy=True)
+            # Допуск держится, пока строки отдаются клиенту
+            ticket = admission.acquire(job_cost(stream, file_format, request.content_length))
+            frames = export_rows(stream, file_format, ticket)
+            # Первая порция читается до ответа: файл, не похожий на отчет, отклоняется с кодом 400
+            frames = itertools.chain([next(frames)], frames)
+        else:
+            tables, _, _ = summarize_upload(stream, file_format)
+            if table == 'summary':
+                frames = [processor.summary_table_frame(tables['structured_data'])]
+            else:
+                frames = [processor.second_table_frame(tables['second_table_data'])]
+
+        label = os.path.splitext(secure_filename(filename))[0] or 'report'
+        export_filename = f"{label}_{table}.{exports.EXPORT_FORMATS[export_format]['extension']}"
+        logger.info(f"Выгрузка {export_filename}")
+        body = exports.iter_export(frames, export_format)
+        # Текстовые форматы сжимаются по мере отдачи, если клиент принимает gzip
+        compress = export_format not in exports.ARROW_FORMATS and accepts_gzip()
+        if compress:
+            body = exports.iter_gzip(body)
+        response = app.response_class(stream_with_context(body),
+                                      content_type=exports.EXPORT_FORMATS[export_format]['mimetype'])
+        response.headers['Content-Disposition'] = f'attachment; filename="{export_filename}"'
+        if compress:
+            response.headers['Content-Encoding'] = 'gzip'
+        if export_format not in exports.ARROW_FORMATS:
+            response.vary.add('Accept-Encoding')
+        return response
+
+    except Exception as e:
+        return error_response(e)
+
+@app.route('/api/upload/batch', methods=['POST', 'OPTIONS'])
+@instrumented('batch')
+def upload_batch():
+    """
+    Эндпоинт пакетной обработки: несколько отчетов (поля 'files') или zip-архив.
+
+    Результат - одна книга: 'Основной отчет' за все периоды вместе, лист 'Россия'
+    с итогом и отдельный лист 'Россия' для каждого отчета.
+    """
+    if request.method == 'OPTIONS':
+        return jsonify({"status": "OK"}), 200
+
+    logger.info("Получен запрос на пакетную обработку")
+
+    if not processor_available():
+        logger.error("Модуль processor недоступен")
+        return jsonify({'error': 'Сервис обработки временно недоступен'}), 500
+
+    try:
+        reports = batch_reports()
+        if not reports:
+            raise RequestError('Файлы не найдены в запросе')
+
+        logger.info(f"Начало пакетной обработки, отчетов: {len(reports)}")
+        result_filename, cached = run_batch_report(reports)
+        logger.info(f"Пакет обработан, результат: {result_filename}")
+
+        return jsonify({
+            'message': 'Файлы успешно обработаны',
+            'result_filename': result_filename,
+            'download_url': f"/api/download/{result_filename}",
+            'periods': [label for label, _, _ in reports],
+            'cached': cached
+        }), 200
+
+    except Exception as e:
+        return error_response(e, batch=True)
+
+@app.route('/api/compare', methods=['POST', 'OPTIONS'])
+@instrumented('compare')
+def upload_compare():
+    """
+    Эндпоинт сравнения периодов: несколько отчетов (поля 'files') или zip-архив, как в /api/upload/batch.
+
+    Для каждой статьи таблицы 'Россия' - суммы по периодам и изменения относительно
+    предыдущего периода (абсолютные и в процентах), для поставок 'Продажа' и 'Возврат' -
+    количество и сумма к перечислению по периодам. Отчеты, суммы которых уже считались,
+    повторно не разбираются. Те же данные - в Excel-файле по download_url.
+    """
+    if request.method == 'OPTIONS':
+        return jsonify({"status": "OK"}), 200
+
+    logger.info("Получен запрос на сравнение периодов")
+
+    if not processor_available():
+        logger.error("Модуль processor недоступен")
+        return jsonify({'error': 'Сервис обработки временно недоступен'}), 500
+
+    try:
+        reports = batch_reports()
+        if len(reports) < 2:
+            raise RequestError('Для сравнения нужно не меньше двух отчетов')
+
+        logger.info(f"Начало сравнения периодов, отчетов: {len(reports)}")
+        comparison, result_filename, cached = run_comparison(reports)
+        logger.info(f"Периоды сравнены, результат: {result_filename}")
+
+        return jsonify(dict(comparison, **{
+            'result_filename': result_filename,
+            'download_url': f"/api/download/{result_filename}",
+            'cached': cached
+        })), 200
+
+    except Exception as e:
+        return error_response(e, batch=True)
+
+def period_date(name):
+    """Дата периода из параметра запроса или поля формы (YYYY-MM-DD), None - если не указана."""
+    value = request_value(name).strip()
+    if not value:
+        return None
+    try:
+        return datetime.date.fromisoformat(value).isoformat()
+    except ValueError:
+        raise RequestError(f'Неверная дата {name}: {value}. Ожидается формат ГГГГ-ММ-ДД')
+
+@app.route('/api/sellers/<seller>/reports', methods=['POST'])
+@instrumented('seller_report')
+def add_seller_report(seller):
+    """
+    Эндпоинт добавления отчета продавца в хранилище сумм.
+
+    Файл - поле формы 'file', период отчета - date_from и date_to (ГГГГ-ММ-ДД).
+    Сохраняются только суммы отчета; повторная загрузка того же файла их заменяет.
+    """
+    logger.info(f"Получен отчет продавца {seller}")
+
+    if not processor_available():
+        logger.error("Модуль processor недоступен")
+        return jsonify({'error': 'Сервис обработки временно недоступен'}), 500
+
+    try:
+        file = request.files.get('file')
+        if file is None or file.filename == '':
+            raise RequestError('Файл не найден в запросе')
+        if not allowed_file(file.filename):
+            raise RequestError('Недопустимый тип файла. Разрешены только .xlsx и .csv')
+
+        date_from, date_to = period_date('date_from'), period_date('date_to')
+        if date_from is None or date_to is None or date_from > date_to:
+            raise RequestError('Укажите период отчета: date_from и date_to (ГГГГ-ММ-ДД)')
+
+        label, extension = os.path.splitext(file.filename)
+        report_id = result_cache.key_for_file(file.stream)
+        # Суммы того же файла уже есть - обновляем только период, отчет повторно не разбираем
+        if aggregate_store.contains(seller, report_id):
+            aggregate_store.set_period(seller, report_id, date_from, date_to, label=label)
+        else:
+            file_format = extension.lstrip('.').lower()
+            with admission.admit(job_cost(file.stream, file_format)):
+                aggregates = run_aggregate(file.stream, file_format)
+            aggregate_store.add(seller, report_id, date_from, date_to, aggregates, label=label)
+
+    except Exception as e:
+        return error_response(e)
+
+    return jsonify({
+        'message': 'Отчет добавлен',
+        'report_id': report_id,
+        'period_start': date_from,
+        'period_end': date_to
+    }), 200
+
+@app.route('/api/sellers/<seller>/reports', methods=['GET'])
+def list_seller_reports(seller):
+    """Эндпоинт списка отчетов продавца в хранилище (с фильтром по периоду date_from/date_to)."""
+    try:
+        date_from, date_to = period_date('date_from'), period_date('date_to')
+    except RequestError as e:
+        return jsonify({'error': str(e)}), e.status
+    return jsonify({'reports': aggregate_store.reports(seller, date_from, date_to)}), 200
+
+@app.route('/api/sellers/<seller>/summary', methods=['GET'])
+@instrumented('seller_summary')
+def seller_summary(seller):
+    """
+    Эндпоинт обеих таблиц отчета за период по сохраненным суммам отчетов продавца.
+
+    Учитываются отчеты, период которых целиком входит в [date_from, date_to].
+    """
+    if not processor_available():
+        logger.error("Модуль processor недоступен")
+        return jsonify({'error': 'Сервис обработки временно недоступен'}), 500
+
+    try:
+        date_from, date_to = period_date('date_from'), period_date('date_to')
+    except RequestError as e:
+        return jsonify({'error': str(e)}), e.status
+
+    reports = aggregate_store.reports(seller, date_from, date_to)
+    structured_data, second_table_data = processor.build_report_tables(aggregate_store.aggregates(seller, date_from, date_to))
+    return jsonify({
+        'reports': reports,
+        'structured_data': structured_data,
+        'second_table_data': second_table_data
+    }), 200
+
+@app.route('/api/sellers/<seller>/compare', methods=['GET'])
+@instrumented('seller_compare')
+def seller_compare(seller):
+    """
+    Эндпоинт сравнения периодов по сохраненным суммам отчетов продавца: каждый отчет - период.
+
+    Учитываются отчеты, период которых целиком входит в [date_from, date_to]; данные - как в /api/compare.
+    """
+    if not processor_available():
+        logger.error("Модуль processor недоступен")
+        return jsonify({'error': 'Сервис обработки временно недоступен'}), 500
+
+    try:
+        date_from, date_to = period_date('date_from'), period_date('date_to')
+    except RequestError as e:
+        return jsonify({'error': str(e)}), e.status
+
+    periods = aggregate_store.report_aggregates(seller, date_from, date_to)
+    if len(periods) < 2:
+        return jsonify({'error': 'Для сравнения нужно не меньше двух отчетов за период'}), 400
+
+    comparison = processor.compare_periods(
+        [(report['label'] or f"{report['period_start']} - {report['period_end']}", aggregates)
+         for report, aggregates in periods])
+    return jsonify(dict(comparison, reports=[report for report, _ in periods])), 200
+
+@app.route('/api/jobs', methods=['GET'])
+def jobs_stats():
+    """Эндпоинт состояния очереди: глубина очереди и время ожидания."""
+    return jsonify(job_queue.stats()), 200
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    """Эндпоинт состояния задачи асинхронной обработки."""
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Задача не найдена'}), 404
+
+    response = {
+        'job_id': job['id'],
+        'status': job['status'],
+        'wait_time': job['wait_time']
+    }
+    if 'queue_position' in job:
+        response['queue_position'] = job['queue_position']
+    if 'run_time' in job:
+        response['run_time'] = job['run_time']
+    if job['status'] == DONE:
+        response['result_filename'] = job['result_filename']
+        response['download_url'] = f"/api/download/{job['result_filename']}"
+    elif job['status'] == FAILED:
+        response['error'] = f"Ошибка обработки файла: {job['error']}"
+    return jsonify(response), 200
+
+@app.route('/api/jobs/<job_id>/events', methods=['GET'])
+def job_events(job_id):
+    """
+    Эндпоинт хода задачи асинхронной обработки - поток Server-Sent Events (progress_events).
+
+    Ход этапов виден, если задачу выполняет этот процесс; иначе по состоянию в очереди
+    отдается только событие завершения.
+    """
+    if job_queue.get(job_id) is None:
+        return jsonify({'error': 'Задача не найдена'}), 404
+
+    def finished():
+        job = job_queue.get(job_id)
+        if job is None:
+            return progress.UNKNOWN, {'error': 'Задача не найдена'}
+        if job['status'] == DONE:
+            return progress.DONE, {'result': result_links(job['result_filename'])}
+        if job['status'] == FAILED:
+            return progress.ERROR, {'error': f"Ошибка обработки файла: {job['error']}"}
+        return None
+
+    return event_stream(progress_board.events(job_id, status=finished, limit=PROGRESS_STREAM_SECONDS))
+
+@app.route('/api/progress/<progress_id>', methods=['GET'])
+def progress_events(progress_id):
+    """
+    Эндпоинт хода обработки запроса с ?progress_id= - поток Server-Sent Events.
+
+    Поток можно открыть до отправки файла. События: progress - этап ('parse' - строк прочитано,
+    'aggregate' - категорий посчитано, 'render' - строк записано в Excel) со счетчиками
+    всех этапов, done - завершение с ссылкой на результат, error - ошибка, unknown - обработка
+    не началась за отведенное время. Ход виден в том процессе, который выполняет обработку.
+    """
+    if not PROGRESS_ID_PATTERN.fullmatch(progress_id):
+        return jsonify({'error': 'Неверный progress_id'}), 400
+    return event_stream(progress_board.events(progress_id, limit=PROGRESS_STREAM_SECONDS))
+
+@app.route('/api/cache', methods=['GET'])
+def cache_stats():
+    """Эндпоинт состояния кэша результатов: попадания, промахи, размер."""
+    return jsonify(result_cache.stats()), 200
+
+@app.route('/api/admission', methods=['GET'])
+def admission_stats():
+    """Эндпоинт состояния допуска обработок: занятый бюджет памяти, выполняемые и ожидающие."""
+    return jsonify(admission.stats()), 200
+
+@app.route('/api/profiles/<profile_id>', methods=['GET'])
+def profile_report(profile_id):
+    """
+    Эндпоинт профиля обработки (загрузка с ?profile=1): текстовый отчет,
+    с ?format=pstats - статистика cProfile для pstats/snakeviz. Требует X-Profiling-Token.
+    """
+    try:
+        check_profiling_token()
+    except RequestError as e:
+        return jsonify({'error': str(e)}), e.status
+
+    suffix = profiling.PSTATS_SUFFIX if request.args.get('format') == 'pstats' else profiling.REPORT_SUFFIX
+    path = profiling.profile_path(RESULT_FOLDER, profile_id, suffix)
+    if not profiling.is_profile_id(profile_id) or not os.path.isfile(path):
+        return jsonify({'error': 'Профиль не найден'}), 404
+    if suffix == profiling.PSTATS_SUFFIX:
+        return send_from_directory(RESULT_FOLDER, os.path.basename(path), as_attachment=True)
+    return send_from_directory(RESULT_FOLDER, os.path.basename(path), mimetype='text/plain')
+
+def accepts_gzip():
+    """Принимает ли клиент ответ, сжатый gzip (Accept-Encoding)."""
+    return request.accept_encodings['gzip'] > 0
 
 @app.route('/api/download/<filename>')
+@instrumented('download')
 def download_file(filename):
-    """Эндпоинт для скачивания результата обработки."""
+    """
+    Эндпоинт для скачивания результата обработки.
+
+    ETag - отпечаток содержимого файла, Last-Modified - время его построения: повторный
+    запрос с If-None-Match получает 304, докачка - часть файла по Range (с If-Range).
+    Файл отдается через wsgi.file_wrapper (sendfile в gunicorn) или X-Sendfile (USE_X_SENDFILE),
+    текстовые результаты - сжатой копией, если клиент принимает gzip.
+    """
     logger.info(f"Запрос на скачивание файла: {filename}")
     try:
         # Защита от path traversal - используем только базовое имя файла
         safe_filename = os.path.basename(filename)
-        file_path = os.path.join(app.config['RESULT_FOLDER'], safe_filename)
-        
-        # Проверяем, существует ли файл и является ли он файлом (а не директорией)
-        if os.path.exists(file_path) and os.path.isfile(file_path):
-            logger.info(f"Файл найден, отправляем: {file_path}")
-            # Отправляем файл как вложение
-            return send_from_directory(app.config['RESULT_FOLDER'], safe_filename, as_attachment=True)
-        else:
-            logger.warning(f"Файл не найден или не является файлом: {file_path}")
+        validators = result_cache.validators(safe_filename)
+
+        # Файла еще нет, но есть таблицы результата (/api/summary) - строим его сейчас
+        cache_key = result_cache.key_from_filename(safe_filename)
+        if (validators is None and cache_key and result_cache.lookup(cache_key, TABLES_SUFFIX)
+                and processor_available()):
+            logger.info(f"Построение файла по сохраненным таблицам: {safe_filename}")
+            tables = result_cache.read_tables(result_cache.filename(cache_key, TABLES_SUFFIX))
+            result_cache.get_or_create(cache_key, lambda result_path: render_report(tables, result_path))
+            validators = result_cache.validators(safe_filename)
+
+        if validators is None:
+            logger.warning(f"Файл не найден или не является файлом: {safe_filename}")
             return jsonify({'error': 'Файл не найден'}), 404
+
+        digest, built_at = validators
+        result_cache.touch(safe_filename)
+        file_path = os.path.join(app.config['RESULT_FOLDER'], safe_filename)
+        compressed_path = result_cache.compressed(safe_filename) if accepts_gzip() else None
+        mimetype = mimetypes.guess_type(safe_filename)[0] or 'application/octet-stream'
+        # Сжатая копия - другое представление файла: у нее свой ETag
+        response = send_file(compressed_path or file_path, mimetype=mimetype, as_attachment=True,
+                             download_name=safe_filename, conditional=True,
+                             etag=f"{digest}-gzip" if compressed_path else digest, last_modified=built_at)
+        if compressed_path:
+            response.headers['Content-Encoding'] = 'gzip'
+        if safe_filename.endswith(COMPRESSIBLE_SUFFIXES):
+            response.vary.add('Accept-Encoding')
+        return response
     except Exception as e:
+        metrics.ERRORS.inc(exception=type(e).__name__)
         logger.error(f"Ошибка скачивания файла: {e}", exc_info=True)
         return jsonify({'error': 'Ошибка при скачивании файла'}), 500
 
+STARTUP['app_import_seconds'] = time.perf_counter() - _IMPORT_STARTED
+threading.Thread(target=load_processor, name='load-processor', daemon=True).start()
+
 # --- Для разработки: раздача статики из React build ---
 # (Позже фронтенд будет на отдельном порту или сервере)
 # FRONTEND_BUILD_DIR = '../frontend/build' # Путь к сборке React
@@ -0,0 +1 @@
+"""Генератор синтетических отчетов и бенчмарки этапов обработки"""
@@ -0,0 +1,63 @@
+# backend/benchmarks/compare.py
+"""
+Сравнение двух файлов результатов run_benchmarks.
+
+Для каждого этапа, размера и формата выводит медианное время и пик памяти
+до и после, отмечая замедления больше порога. Код возврата 1, если они есть -
+сравнение можно использовать как проверку в CI.
+
+Использование:
+    python -m benchmarks.compare до.json после.json --threshold 0.1
+"""
+import sys
+import json
+import argparse
+
+
+def load(path: str) -> tuple:
+    """Окружение и результаты из файла: (этап, строк, формат) -> результат"""
+    with open(path, encoding='utf-8') as source:
+        data = json.load(source)
+    return data['environment'], {(r['stage'], r['rows'], r['format']): r for r in data['results']}
+
+
+def compare(baseline_path: str, current_path: str, threshold: float = 0.1) -> list:
+    """Печатает сравнение и возвращает список замедлившихся этапов"""
+    baseline_env, baseline = load(baseline_path)
+    current_env, current = load(current_path)
+
+    for name in ('pandas', 'numpy', 'openpyxl', 'python', 'processor_version'):
+        if baseline_env.get(name) != current_env.get(name):
+            print(f"{name}: {baseline_env.get(name)} -> {current_env.get(name)}")
+
+    regressions = []
+    print(f"{'формат':>6} {'строк':>9} {'этап':<28} {'было, с':>9} {'стало, с':>9} {'изм.':>7} {'память, МБ':>16}")
+    for key in sorted(baseline.keys() & current.keys(), key=lambda key: (key[2], key[1], key[0])):
+        stage, rows, file_format = key
+        before, after = baseline[key]['median'], current[key]['median']
+        change = (after - before) / before if before else 0.0
+        memory = ''
+        if 'peak_memory_bytes' in baseline[key] and 'peak_memory_bytes' in current[key]:
+            memory = (f"{baseline[key]['peak_memory_bytes'] / 2 ** 20:.1f} -> "
+                      f"{current[key]['peak_memory_bytes'] / 2 ** 20:.1f}")
+        mark = ' !' if change > threshold else ''
+        print(f"{file_format:>6} {rows:>9} {stage:<28} {before:>9.4f} {after:>9.4f} {change:>+7.1%} {memory:>16}{mark}")
+        if change > threshold:
+            regressions.append(key)
+
+    if regressions:
+        print(f"Замедление больше {threshold:.0%}: {len(regressions)} этапов")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Сравнение результатов бенчмарков")
+    parser.add_argument('baseline', help="Результаты до изменения (JSON)")
+    parser.add_argument('current', help="Результаты после изменения (JSON)")
+    parser.add_argument('--threshold', type=float, default=0.1, help="Допустимое замедление (0.1 = 10%%)")
+    args = parser.parse_args(argv)
+    sys.exit(1 if compare(args.baseline, args.current, args.threshold) else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,197 @@
+# backend/benchmarks/generate_report.py
+"""
+Генератор синтетических еженедельных отчетов Wildberries (.xlsx и .csv) для бенчмарков.
+
+Заголовки и порядок столбцов - как в отчете о реализации (столбцы COLUMN_MAPPING
+стоят на своих буквах), распределения значений J/K/AQ и число поставок близки
+к реальным отчетам. Данные генерируются порциями, поэтому даже 5 млн строк
+не требуют держать весь отчет в памяти.
+
+Использование:
+    python -m benchmarks.generate_report 100000 отчет.csv
+    python -m benchmarks.generate_report 100000 отчет.xlsx --seed 1
+"""
+import os
+import sys
+import argparse
+
+import numpy as np
+import pandas as pd
+from openpyxl import Workbook
+from openpyxl.utils import column_index_from_string
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from processor import COLUMN_MAPPING, ADVERTISING_AQ  # noqa: E402
+
+# Заголовки отчета о реализации по столбцам A..BK
+REPORT_HEADERS = [
+    '№', 'Номер поставки', 'Предмет', 'Код номенклатуры', 'Бренд', 'Артикул поставщика', 'Название',
+    'Размер', 'Баркод', 'Тип документа', 'Обоснование для оплаты', 'Дата заказа покупателем', 'Дата продажи',
+    'Кол-во', 'Цена розничная', 'Вайлдберриз реализовал Товар (Пр)', 'Согласованный продуктовый дисконт, %',
+    'Промокод %', 'Итоговая согласованная скидка, %', 'Цена розничная с учетом согласованной скидки',
+    'Размер снижения кВВ из-за рейтинга, %', 'Размер изменения кВВ из-за акции, %',
+    'Скидка постоянного Покупателя (СПП), %', 'Размер кВВ, %', 'Размер  кВВ без НДС, % Базовый',
+    'Итоговый кВВ без НДС, %', 'Вознаграждение с продаж до вычета услуг поверенного, без НДС',
+    'Возмещение за выдачу и возврат товаров на ПВЗ', 'Эквайринг/Комиссии за организацию платежей',
+    'Размер комиссии за эквайринг/Комиссии за организацию платежей, %',
+    'Тип платежа за Эквайринг/Комиссии за организацию платежей', 'Вознаграждение Вайлдберриз (ВВ), без НДС',
+    'НДС с Вознаграждения Вайлдберриз', 'К перечислению Продавцу за реализованный Товар', 'Количество доставок',
+    'Количество возврата', 'Услуги по доставке товара покупателю', 'Дата начала действия фиксации',
+    'Дата конца действия фиксации', 'Признак услуги платной доставки', 'Общая сумма штрафов',
+    'Корректировка Вознаграждения Вайлдберриз (ВВ)', 'Виды логистики, штрафов и корректировок ВВ',
+    'Стикер МП', 'Наименование банка-эквайера', 'Номер офиса', 'Наименование офиса доставки', 'ИНН партнера',
+    'Партнер', 'Склад', 'Страна', 'Тип коробов', 'Номер таможенной декларации', 'Номер сборочного задания',
+    'Код маркировки', 'ШК', 'Srid', 'Организатор перевозки', 'Фиксированный коэффициент склада по поставке',
+    'Хранение', 'Удержания', 'Платная приемка',
+    'Возмещение издержек по перевозке/по складским операциям с товаром'
+]
+assert all(REPORT_HEADERS[column_index_from_string(letter) - 1] == name for name, letter in COLUMN_MAPPING.items())
+
+# Сочетания (Тип документа, Обоснование для оплаты) и их доли в строках отчета
+OPERATIONS = [
+    ('Продажа', 'Продажа', 0.46),
+    ('Возврат', 'Возврат', 0.04),
+    (None, 'Логистика', 0.38),
+    (None, 'Хранение', 0.05),
+    (None, 'Удержание', 0.02),
+    (None, 'Коррекция логистики', 0.01),
+    (None, 'Возмещение издержек по перевозке/по складским операциям с товаром', 0.015),
+    (None, 'Штраф', 0.005),
+    ('Продажа', 'Компенсация ущерба', 0.004),
+    ('Возврат', 'Добровольная компенсация при возврате', 0.003),
+    (None, 'Платная приемка', 0.008),
+    (None, None, 0.005)  # пустые строки в конце отчета
+]
+_OPERATION_SHARES = np.array([share for _, _, share in OPERATIONS])
+_OPERATION_SHARES = _OPERATION_SHARES / _OPERATION_SHARES.sum()
+
+# Значения AQ по обоснованию для оплаты
+LOGISTICS_AQ = ['К клиенту при продаже', 'От клиента при возврате', 'К клиенту при отмене',
+                'От клиента при отмене', 'Возврат брака (К продавцу)']
+RETENTION_AQ = [ADVERTISING_AQ, 'Предоставление услуг по подписке «Джем»', 'Стоимость участия в программе лояльности']
+FINE_AQ = ['Самовыкуп', 'Недовложение', 'Подмена товара', 'Нарушение правил маркировки']
+
+SUBJECTS = ['Платья', 'Футболки', 'Джинсы', 'Кроссовки', 'Сумки', 'Куртки', 'Носки', 'Рюкзаки']
+WAREHOUSES = ['Коледино', 'Подольск', 'Электросталь', 'Казань', 'Краснодар', 'Новосибирск', 'Тула']
+
+# Максимум строк данных на листе Excel
+XLSX_MAX_ROWS = 1048575
+CHUNK_ROWS = 100000
+
+
+def supply_count(rows: int) -> int:
+    """Число поставок за неделю: растет с размером отчета, но остается в пределах сотен-тысяч"""
+    return int(min(max(rows // 400, 5), 5000))
+
+
+def generate_chunk(rng: np.random.Generator, start: int, rows: int, supplies: np.ndarray) -> pd.DataFrame:
+    """Порция строк отчета с номерами строк (№) начиная со start + 1"""
+    operation = rng.choice(len(OPERATIONS), rows, p=_OPERATION_SHARES)
+    doc_type = np.array([j for j, _, _ in OPERATIONS], dtype=object)[operation]
+    reason = np.array([k for _, k, _ in OPERATIONS], dtype=object)[operation]
+
+    def is_reason(*names):
+        return np.isin(reason, names)
+
+    is_sale = is_reason('Продажа', 'Возврат', 'Компенсация ущерба', 'Добровольная компенсация при возврате')
+    is_logistics = is_reason('Логистика', 'Коррекция логистики')
+    is_empty = pd.isna(reason)
+
+    qty = np.where(is_sale, rng.integers(1, 3, rows), 0)
+    qty = np.where(is_reason('Возмещение издержек по перевозке/по складским операциям с товаром'),
+                   rng.integers(0, 2, rows), qty)
+    price = np.where(is_sale, np.round(rng.gamma(2.0, 900.0, rows), 2), 0.0)
+    commission = np.where(is_sale, rng.choice([15.0, 17.5, 19.5, 22.0, 25.5], rows), 0.0)
+
+    def money(mask, scale):
+        return np.where(mask, np.round(rng.gamma(1.5, scale, rows), 2), 0.0)
+
+    aq = np.full(rows, None, dtype=object)
+    aq[is_logistics] = rng.choice(LOGISTICS_AQ, is_logistics.sum(), p=[0.8, 0.1, 0.05, 0.03, 0.02])
+    retention = is_reason('Удержание')
+    aq[retention] = rng.choice(RETENTION_AQ, retention.sum(), p=[0.7, 0.2, 0.1])
+    fines = is_reason('Штраф')
+    aq[fines] = rng.choice(FINE_AQ, fines.sum())
+
+    supply = rng.choice(supplies, rows).astype(np.float64)
+    supply[~is_sale & (rng.random(rows) < 0.7)] = np.nan
+
+    frame = {name: np.full(rows, None, dtype=object) for name in REPORT_HEADERS}
+    frame.update({
+        '№': np.arange(start + 1, start + rows + 1),
+        'Номер поставки': supply,
+        'Предмет': rng.choice(SUBJECTS, rows),
+        'Код номенклатуры': rng.integers(10 ** 7, 3 * 10 ** 8, rows),
+        'Бренд': 'Бренд',
+        'Тип документа': doc_type,
+        'Обоснование для оплаты': reason,
+        'Дата продажи': '2024-01-08',
+        'Кол-во': qty,
+        'Цена розничная': price,
+        'Размер кВВ, %': commission,
+        'Эквайринг/Комиссии за организацию платежей': np.round(price * qty * 0.015, 2),
+        'К перечислению Продавцу за реализованный Товар': np.round(price * qty * (1 - commission / 100), 2),
+        'Услуги по доставке товара покупателю': money(is_logistics, 40.0),
+        'Общая сумма штрафов': money(fines, 500.0),
+        'Виды логистики, штрафов и корректировок ВВ': aq,
+        'Склад': rng.choice(WAREHOUSES, rows),
+        'Страна': 'Россия',
+        'Srid': [f"{start + i:x}.0.0" for i in range(rows)],
+        'Хранение': money(is_reason('Хранение'), 60.0),
+        'Удержания': money(retention, 300.0),
+        'Платная приемка': money(is_reason('Платная приемка'), 150.0),
+        'Возмещение издержек по перевозке/по складским операциям с товаром':
+            money(is_reason('Возмещение издержек по перевозке/по складским операциям с товаром'), 30.0)
+    })
+    df = pd.DataFrame(frame, columns=REPORT_HEADERS)
+    # Пустые строки - все значения пустые
+    df.loc[is_empty, REPORT_HEADERS[1:]] = None
+    return df
+
+
+def iter_chunks(rows: int, seed: int = 0, chunk_rows: int = CHUNK_ROWS):
+    """Порции отчета из rows строк; один и тот же seed дает один и тот же отчет"""
+    rng = np.random.default_rng(seed)
+    supplies = rng.integers(10 ** 7, 4 * 10 ** 7, supply_count(rows))
+    for start in range(0, rows, chunk_rows):
+        yield generate_chunk(rng, start, min(chunk_rows, rows - start), supplies)
+
+
+def generate_report(path: str, rows: int, seed: int = 0, file_format: str = None) -> str:
+    """
+    Записывает синтетический отчет из rows строк в path (.csv или .xlsx).
+
+    Возвращает путь к файлу. Для xlsx размер ограничен числом строк листа Excel.
+    """
+    file_format = file_format or os.path.splitext(path)[1].lstrip('.').lower()
+    if file_format == 'csv':
+        with open(path, 'w', encoding='utf-8', newline='') as target:
+            for i, chunk in enumerate(iter_chunks(rows, seed)):
+                chunk.to_csv(target, index=False, header=(i == 0))
+    elif file_format == 'xlsx':
+        if rows > XLSX_MAX_ROWS:
+            raise ValueError(f"В xlsx помещается не более {XLSX_MAX_ROWS} строк, запрошено {rows}")
+        wb = Workbook(write_only=True)
+        ws = wb.create_sheet('Sheet1')
+        ws.append(REPORT_HEADERS)
+        for chunk in iter_chunks(rows, seed):
+            chunk = chunk.astype(object).where(chunk.notna(), None)
+            for values in chunk.itertuples(index=False, name=None):
+                ws.append(values)
+        wb.save(path)
+    else:
+        raise ValueError("Файл должен быть в формате .xlsx или .csv")
+    return path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Генератор синтетических отчетов Wildberries")
+    parser.add_argument('rows', type=int, help="Число строк отчета")
+    parser.add_argument('path', help="Путь к файлу (.csv или .xlsx)")
+    parser.add_argument('--seed', type=int, default=0, help="Начальное значение генератора")
+    args = parser.parse_args(argv)
+    print(f"Отчет сохранен: {generate_report(args.path, args.rows, args.seed)}")
+
+
+if __name__ == '__main__':
+    main()
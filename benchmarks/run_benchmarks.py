@@ -0,0 +1,161 @@
+# backend/benchmarks/run_benchmarks.py
+"""
+Бенчмарк этапов обработки отчета на синтетических отчетах (generate_report).
+
+Для каждого размера и формата отчета замеряются этапы read_wb_report,
+create_summary_data, create_second_table_data и create_excel_with_grouping:
+время (несколько повторов) и пик выделенной памяти (tracemalloc, отдельным
+прогоном, чтобы трассировка не искажала время). Результаты пишутся в JSON
+вместе с версиями библиотек - два файла сравниваются benchmarks.compare.
+
+Использование:
+    python -m benchmarks.run_benchmarks --sizes 1000,100000 --formats csv,xlsx --output bench.json
+"""
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import tempfile
+import statistics
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+import openpyxl
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import processor  # noqa: E402
+from benchmarks.generate_report import generate_report, XLSX_MAX_ROWS  # noqa: E402
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+DEFAULT_SIZES = [1000, 10000, 100000]
+DEFAULT_FORMATS = ['csv', 'xlsx']
+STAGES = ['read_wb_report', 'create_summary_data', 'create_second_table_data', 'create_excel_with_grouping']
+
+
+def report_path(data_dir: str, rows: int, file_format: str, seed: int) -> str:
+    """Синтетический отчет нужного размера (генерируется один раз и переиспользуется)"""
+    path = os.path.join(data_dir, f"wb_report_{rows}_{seed}.{file_format}")
+    if not os.path.exists(path):
+        print(f"Генерация отчета {path}...", file=sys.stderr)
+        generate_report(path + '.tmp', rows, seed, file_format)
+        os.replace(path + '.tmp', path)
+    return path
+
+
+def stage_calls(path: str, output_path: str) -> list:
+    """Этапы обработки: (название, функция без аргументов); входные данные этапов готовятся заранее"""
+    df = processor.read_wb_report(path)
+    structured_data, second_table_data = processor.create_summary_data(df)
+    aggregates = processor.aggregate_report(df)
+    category_totals = processor.summarize_categories(aggregates)
+    return [
+        ('read_wb_report', lambda: processor.read_wb_report(path)),
+        ('create_summary_data', lambda: processor.create_summary_data(df)),
+        ('create_second_table_data',
+         lambda: processor.create_second_table_data(aggregates['key_totals'], category_totals)),
+        ('create_excel_with_grouping',
+         lambda: processor.create_excel_with_grouping(structured_data, second_table_data, output_path))
+    ]
+
+
+def measure(func, repeat: int, memory: bool) -> dict:
+    """Время выполнения по повторам и пик памяти за отдельный прогон"""
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - started)
+
+    result = {
+        'times': times,
+        'min': min(times),
+        'median': statistics.median(times)
+    }
+    if memory:
+        tracemalloc.start()
+        try:
+            func()
+            result['peak_memory_bytes'] = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    return result
+
+
+def environment() -> dict:
+    """Версии Python и библиотек, от которых зависит скорость обработки"""
+    return {
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'numpy': np.__version__,
+        'openpyxl': openpyxl.__version__,
+        'processor_version': processor.PROCESSOR_VERSION,
+        'chunk_rows': processor.CHUNK_ROWS,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z')
+    }
+
+
+def run(sizes, formats, repeat: int = 3, memory: bool = True, data_dir: str = None, seed: int = 0) -> dict:
+    """Выполняет бенчмарк и возвращает результаты в виде словаря"""
+    data_dir = data_dir or os.path.join(tempfile.gettempdir(), 'wb_benchmarks')
+    os.makedirs(data_dir, exist_ok=True)
+    output_path = os.path.join(data_dir, 'benchmark_result.xlsx')
+
+    results = []
+    for file_format in formats:
+        for rows in sizes:
+            if file_format == 'xlsx' and rows > XLSX_MAX_ROWS:
+                print(f"Пропуск xlsx на {rows} строк: больше, чем помещается на листе", file=sys.stderr)
+                continue
+            path = report_path(data_dir, rows, file_format, seed)
+            for stage, func in stage_calls(path, output_path):
+                result = measure(func, repeat, memory)
+                result.update({'stage': stage, 'rows': rows, 'format': file_format,
+                               'file_bytes': os.path.getsize(path)})
+                results.append(result)
+                memory_note = f", пик памяти {result['peak_memory_bytes'] / 2 ** 20:.1f} МБ" if memory else ''
+                print(f"{file_format:>4} {rows:>9} {stage:<28} {result['median']:.4f} с{memory_note}", file=sys.stderr)
+
+    peak_rss = None
+    if resource is not None:
+        # ru_maxrss - в килобайтах в Linux и в байтах в macOS
+        peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        peak_rss = peak_rss if sys.platform == 'darwin' else peak_rss * 1024
+    return {'environment': environment(), 'repeat': repeat, 'peak_rss_bytes': peak_rss, 'results': results}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Бенчмарк этапов обработки отчета Wildberries")
+    parser.add_argument('--sizes', default=','.join(map(str, DEFAULT_SIZES)),
+                        help="Размеры отчетов в строках через запятую (от 1000 до 5000000)")
+    parser.add_argument('--formats', default=','.join(DEFAULT_FORMATS), help="Форматы: csv, xlsx")
+    parser.add_argument('--repeat', type=int, default=3, help="Число замеров времени каждого этапа")
+    parser.add_argument('--no-memory', action='store_true', help="Не замерять память (быстрее)")
+    parser.add_argument('--data-dir', help="Каталог для сгенерированных отчетов")
+    parser.add_argument('--seed', type=int, default=0, help="Начальное значение генератора отчетов")
+    parser.add_argument('--output', default='benchmark_results.json', help="Файл результатов (JSON)")
+    args = parser.parse_args(argv)
+
+    results = run(
+        sizes=[int(size) for size in args.sizes.split(',')],
+        formats=[file_format.strip().lower() for file_format in args.formats.split(',')],
+        repeat=args.repeat,
+        memory=not args.no_memory,
+        data_dir=args.data_dir,
+        seed=args.seed
+    )
+    with open(args.output, 'w', encoding='utf-8') as target:
+        json.dump(results, target, ensure_ascii=False, indent=2)
+    print(f"Результаты сохранены: {args.output}", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
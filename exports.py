@@ -0,0 +1,164 @@
+# backend/exports.py
+"""
+Выгрузка таблиц и строк отчета в форматах для обработки программами (без Excel).
+
+    csv     - текст UTF-8 с заголовком, разделитель - запятая
+    ndjson  - по одному JSON-объекту на строку
+    parquet - колоночный формат, каждая порция строк - отдельная группа строк (row group)
+    arrow   - Arrow IPC (потоковый формат), каждая порция - отдельный пакет (record batch)
+
+Данные передаются порциями (DataFrame) и кодируются по одной: выгрузка отдается
+частями (iter_export), поэтому занятая память зависит от размера порции, а не отчета.
+parquet и arrow требуют pyarrow; он импортируется только при выгрузке в эти форматы.
+"""
+import io
+import json
+import zlib
+import importlib.util
+
+# Форматы выгрузки: расширение файла и тип ответа
+EXPORT_FORMATS = {
+    'csv': {'extension': 'csv', 'mimetype': 'text/csv; charset=utf-8'},
+    'ndjson': {'extension': 'ndjson', 'mimetype': 'application/x-ndjson; charset=utf-8'},
+    'parquet': {'extension': 'parquet', 'mimetype': 'application/vnd.apache.parquet'},
+    'arrow': {'extension': 'arrows', 'mimetype': 'application/vnd.apache.arrow.stream'}
+}
+# Форматы, для которых нужен pyarrow
+ARROW_FORMATS = ('parquet', 'arrow')
+# Сколько строк порции кодируется за раз в csv и ndjson (текст порции целиком не собирается)
+TEXT_BATCH_ROWS = 10000
+# Степень сжатия gzip при отдаче текстовых форматов (iter_gzip)
+GZIP_LEVEL = 6
+
+
+class ExportFormatError(ValueError):
+    """Неизвестный формат выгрузки или для него не установлен pyarrow"""
+
+
+def pyarrow_available() -> bool:
+    return importlib.util.find_spec('pyarrow') is not None
+
+
+def check_format(export_format: str):
+    """Проверяет, что выгрузка в export_format возможна (иначе ExportFormatError)"""
+    if export_format not in EXPORT_FORMATS:
+        raise ExportFormatError(
+            f"Неизвестный формат выгрузки: {export_format}. Доступны: {', '.join(EXPORT_FORMATS)}")
+    if export_format in ARROW_FORMATS and not pyarrow_available():
+        raise ExportFormatError(f"Выгрузка в {export_format} недоступна: не установлен pyarrow")
+
+
+def iter_export(frames, export_format: str):
+    """
+    Кодирует порции данных (DataFrame с одинаковыми столбцами) в export_format.
+
+    Генератор байтов: каждая порция кодируется и отдается сразу, заголовок
+    (csv) или схема (parquet, arrow) берутся из первой порции.
+    """
+    check_format(export_format)
+    if export_format == 'csv':
+        return _iter_csv(frames)
+    if export_format == 'ndjson':
+        return _iter_ndjson(frames)
+    return _iter_arrow(frames, export_format)
+
+
+def iter_gzip(chunks, level: int = GZIP_LEVEL):
+    """Сжимает поток байтов в формат gzip по мере поступления частей"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def _text_batches(frames):
+    """Порции, разбитые на части по TEXT_BATCH_ROWS строк (первая часть отдается и для пустой порции)"""
+    for frame in frames:
+        for start in range(0, max(len(frame), 1), TEXT_BATCH_ROWS):
+            yield frame.iloc[start:start + TEXT_BATCH_ROWS]
+
+
+def _iter_csv(frames):
+    header = True
+    for batch in _text_batches(frames):
+        if len(batch) or header:
+            yield batch.to_csv(index=False, header=header, lineterminator='\n').encode('utf-8')
+            header = False
+
+
+def _iter_ndjson(frames):
+    encoder = json.JSONEncoder(ensure_ascii=False)
+    for batch in _text_batches(frames):
+        columns = [str(column) for column in batch.columns]
+        # NaN пишется как null, числа numpy - как числа JSON (tolist), без потери точности
+        values = [batch[column].astype(object).where(batch[column].notna(), None).tolist()
+                  for column in batch.columns]
+        lines = [encoder.encode(dict(zip(columns, row))) for row in zip(*values)]
+        if lines:
+            yield ('\n'.join(lines) + '\n').encode('utf-8')
+
+
+class _ChunkSink(io.RawIOBase):
+    """Поток записи для pyarrow: записанные байты забираются частями (take)"""
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def take(self) -> bytes:
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def _arrow_schema(frame):
+    """Схема Arrow по первой порции: текстовые (category, object) столбцы - строки, числовые - как в numpy"""
+    import pyarrow as pa
+
+    fields = []
+    for name, dtype in frame.dtypes.items():
+        if dtype.kind in 'iufb':
+            fields.append(pa.field(str(name), pa.from_numpy_dtype(dtype)))
+        else:
+            fields.append(pa.field(str(name), pa.string()))
+    return pa.schema(fields)
+
+
+def _iter_arrow(frames, export_format: str):
+    import pyarrow as pa
+
+    sink = _ChunkSink()
+    writer = None
+    try:
+        for frame in frames:
+            if writer is None:
+                schema = _arrow_schema(frame)
+                if export_format == 'parquet':
+                    import pyarrow.parquet as pq
+                    writer = pq.ParquetWriter(sink, schema)
+                else:
+                    writer = pa.ipc.new_stream(sink, schema)
+            # Столбцы category каждой порции - словари со своим набором значений, приводятся к строкам
+            table = pa.Table.from_pandas(frame, preserve_index=False).cast(schema)
+            writer.write_table(table)
+            yield sink.take()
+    finally:
+        if writer is not None:
+            writer.close()
+    data = sink.take()
+    if data:
+        yield data
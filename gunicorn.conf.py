@@ -0,0 +1,35 @@
+# backend/gunicorn.conf.py
+"""
+Настройки gunicorn (файл читается автоматически при запуске из этого каталога).
+
+Тяжелые библиотеки обработки (pandas, numpy, openpyxl) импортируются один раз
+в master-процессе: рабочие процессы получают их при fork уже загруженными
+(страницы памяти общие, пока не изменены), поэтому запускаются быстро.
+Само приложение в master не загружается (preload_app): оно запускает потоки
+очереди задач, которые не переживают fork.
+"""
+import os
+import time
+
+preload_app = False
+# Запросы обрабатываются потоками: поток событий хода обработки (/api/progress) занимает
+# свой поток на все время обработки, не блокируя остальные запросы процесса
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 8))
+# Файлы результатов (/api/download) отдаются системным вызовом sendfile, без копирования через процесс
+sendfile = True
+
+# PRELOAD_PROCESSOR=0 - не загружать библиотеки в master (например, чтобы проверить холодный запуск)
+PRELOAD_PROCESSOR = os.environ.get('PRELOAD_PROCESSOR', '1') == '1'
+
+
+def on_starting(server):
+    if not PRELOAD_PROCESSOR:
+        return
+    started = time.perf_counter()
+    try:
+        import processor  # noqa: F401
+    except ImportError as e:
+        server.log.error(f"Не удалось загрузить processor в master-процессе: {e}")
+        return
+    server.log.info(f"processor загружен в master-процессе за {time.perf_counter() - started:.2f} с")
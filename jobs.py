@@ -0,0 +1,294 @@
+# backend/jobs.py
+"""Локальная очередь задач обработки отчетов с хранением состояния в SQLite"""
+import os
+import time
+import uuid
+import socket
+import sqlite3
+import logging
+import threading
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Состояния задачи
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    input_path TEXT NOT NULL,
+    result_filename TEXT,
+    error TEXT,
+    owner TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    heartbeat_at REAL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_status_created ON jobs (status, created_at);
+"""
+
+
+def _remove_input(input_path: str):
+    """Удаляет входной файл завершенной задачи, если он еще есть"""
+    try:
+        os.remove(input_path)
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        logger.warning(f"Не удалось удалить файл задачи {input_path}: {e}")
+
+
+class JobQueue:
+    """
+    Очередь задач на SQLite с ограниченным пулом потоков-обработчиков.
+
+    Состояние задач хранится в файле базы, поэтому очередь переживает перезапуск
+    процесса: задачи упавшего обработчика (без heartbeat дольше lease_seconds)
+    снова ставятся в очередь. Одну базу могут разделять несколько процессов gunicorn.
+    Входной файл задачи удаляется, когда задача завершается (DONE или FAILED).
+    """
+
+    def __init__(self, db_path: str, handler, workers: int = 2, lease_seconds: float = 60,
+                 max_attempts: int = 3, poll_interval: float = 1.0, retention_seconds: float = 7 * 24 * 3600,
+                 purge_interval: float = 3600):
+        """
+        Args:
+            db_path (str): Путь к файлу базы SQLite
+            handler: Функция handler(job_id, input_path) -> result_filename, выполняющая задачу
+            workers (int): Число потоков-обработчиков в этом процессе
+            lease_seconds (float): Через сколько секунд без heartbeat задача считается брошенной
+            max_attempts (int): Сколько раз задачу можно начать, прежде чем признать ее неуспешной
+            poll_interval (float): Период опроса базы в ожидании новых задач
+            retention_seconds (float): Сколько хранить записи о завершенных задачах
+            purge_interval (float): Как часто обработчики удаляют устаревшие записи, секунды
+        """
+        self.db_path = db_path
+        self.handler = handler
+        self.workers = workers
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.poll_interval = poll_interval
+        self.retention_seconds = retention_seconds
+        self.purge_interval = purge_interval
+        self._purged_at = 0.0
+        # Уникальный владелец для задач, взятых этим экземпляром очереди
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._threads = []
+        self._lock = threading.Lock()
+
+        with self._connect() as conn:
+            conn.executescript(_SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        """Соединение с базой очереди в режиме autocommit, закрывается при выходе"""
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            conn.execute('PRAGMA journal_mode=WAL')
+            yield conn
+        finally:
+            conn.close()
+
+    def start(self):
+        """Запускает потоки-обработчики и heartbeat (повторный вызов ничего не делает)"""
+        with self._lock:
+            if self._threads:
+                return
+            # После fork (gunicorn) у процесса новый pid - берем нового владельца
+            self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+            self._purge_finished()
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._worker_loop, name=f"job-worker-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+            thread = threading.Thread(target=self._heartbeat_loop, name="job-heartbeat", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        logger.info(f"Очередь задач запущена: {self.workers} обработчиков, база {self.db_path}")
+
+    def stop(self):
+        """Останавливает обработчики после завершения текущих задач"""
+        self._stopping.set()
+        self._wakeup.set()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def submit(self, input_path: str) -> str:
+        """Ставит файл в очередь на обработку и возвращает идентификатор задачи"""
+        job_id = uuid.uuid4().hex
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO jobs (id, status, input_path, created_at) VALUES (?, ?, ?, ?)",
+                (job_id, QUEUED, input_path, time.time())
+            )
+        self._wakeup.set()
+        return job_id
+
+    def get(self, job_id: str):
+        """Возвращает состояние задачи в виде словаря или None, если задачи нет"""
+        with self._connect() as conn:
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if row is None:
+                return None
+            job = dict(row)
+            if job['status'] == QUEUED:
+                # Позиция в очереди: сколько задач ждут дольше этой
+                job['queue_position'] = conn.execute(
+                    "SELECT COUNT(*) FROM jobs WHERE status = ? AND created_at < ?",
+                    (QUEUED, job['created_at'])
+                ).fetchone()[0] + 1
+
+        now = time.time()
+        job['wait_time'] = (job['started_at'] or now) - job['created_at']
+        if job['started_at'] is not None:
+            job['run_time'] = (job['finished_at'] or now) - job['started_at']
+        return job
+
+    def stats(self) -> dict:
+        """Глубина очереди, число выполняемых задач и время ожидания"""
+        now = time.time()
+        with self._connect() as conn:
+            counts = dict(conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+            oldest = conn.execute(
+                "SELECT MIN(created_at) FROM jobs WHERE status = ?", (QUEUED,)
+            ).fetchone()[0]
+            # Среднее ожидание по задачам, начатым за последний час
+            avg_wait = conn.execute(
+                "SELECT AVG(started_at - created_at) FROM jobs WHERE started_at >= ?", (now - 3600,)
+            ).fetchone()[0]
+        return {
+            'queue_depth': counts.get(QUEUED, 0),
+            'running': counts.get(RUNNING, 0),
+            'done': counts.get(DONE, 0),
+            'failed': counts.get(FAILED, 0),
+            'oldest_wait_time': now - oldest if oldest is not None else 0,
+            'avg_wait_time': avg_wait or 0,
+            'workers': self.workers
+        }
+
+    def _claim(self):
+        """Атомарно забирает самую старую задачу из очереди"""
+        with self._connect() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                failed_inputs = self._requeue_abandoned(conn)
+                row = conn.execute(
+                    "SELECT id, input_path FROM jobs WHERE status = ? ORDER BY created_at LIMIT 1", (QUEUED,)
+                ).fetchone()
+                if row is not None:
+                    now = time.time()
+                    conn.execute(
+                        "UPDATE jobs SET status = ?, owner = ?, started_at = ?, heartbeat_at = ?, "
+                        "attempts = attempts + 1 WHERE id = ?",
+                        (RUNNING, self.owner, now, now, row['id'])
+                    )
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+        for input_path in failed_inputs:
+            _remove_input(input_path)
+        return row
+
+    def _requeue_abandoned(self, conn: sqlite3.Connection) -> list:
+        """
+        Возвращает в очередь задачи, обработчик которых перестал подавать heartbeat.
+
+        Задачи, исчерпавшие max_attempts, завершаются с ошибкой; возвращает их входные файлы,
+        которые нужно удалить после фиксации транзакции.
+        """
+        deadline = time.time() - self.lease_seconds
+        exhausted = (RUNNING, deadline, self.max_attempts)
+        failed_inputs = [row['input_path'] for row in conn.execute(
+            "SELECT input_path FROM jobs WHERE status = ? AND heartbeat_at < ? AND attempts >= ?", exhausted)]
+        conn.execute(
+            "UPDATE jobs SET status = ?, error = 'Превышено число попыток обработки', finished_at = ? "
+            "WHERE status = ? AND heartbeat_at < ? AND attempts >= ?",
+            (FAILED, time.time()) + exhausted
+        )
+        abandoned = conn.execute(
+            "UPDATE jobs SET status = ?, owner = NULL, started_at = NULL WHERE status = ? AND heartbeat_at < ?",
+            (QUEUED, RUNNING, deadline)
+        ).rowcount
+        if abandoned:
+            logger.warning(f"Возвращено в очередь брошенных задач: {abandoned}")
+        if failed_inputs:
+            logger.warning(f"Брошенных задач, исчерпавших попытки обработки: {len(failed_inputs)}")
+        return failed_inputs
+
+    def _finish(self, job_id: str, input_path: str, status: str, result_filename: str = None, error: str = None):
+        """
+        Записывает итог задачи и удаляет ее входной файл. Если задачу уже забрал другой
+        обработчик (истек lease), итог не записывается, а файл остается для его попытки.
+        """
+        with self._connect() as conn:
+            finished = conn.execute(
+                "UPDATE jobs SET status = ?, result_filename = ?, error = ?, finished_at = ? "
+                "WHERE id = ? AND owner = ?",
+                (status, result_filename, error, time.time(), job_id, self.owner)
+            ).rowcount
+        if finished:
+            _remove_input(input_path)
+
+    def _purge_finished(self):
+        """Удаляет записи о давно завершенных задачах и оставшиеся от них входные файлы"""
+        self._purged_at = time.time()
+        with self._connect() as conn:
+            expired = (DONE, FAILED, self._purged_at - self.retention_seconds)
+            input_paths = [row['input_path'] for row in conn.execute(
+                "SELECT input_path FROM jobs WHERE status IN (?, ?) AND finished_at < ?", expired)]
+            conn.execute("DELETE FROM jobs WHERE status IN (?, ?) AND finished_at < ?", expired)
+        for input_path in input_paths:
+            _remove_input(input_path)
+
+    def _worker_loop(self):
+        while not self._stopping.is_set():
+            try:
+                job = self._claim()
+            except sqlite3.Error as e:
+                logger.error(f"Ошибка чтения очереди задач: {e}")
+                job = None
+
+            if job is None:
+                # Без задач - заодно удаляем устаревшие записи (не чаще раза в purge_interval)
+                if time.time() - self._purged_at >= self.purge_interval:
+                    try:
+                        self._purge_finished()
+                    except sqlite3.Error as e:
+                        logger.error(f"Ошибка удаления завершенных задач: {e}")
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+                continue
+
+            logger.info(f"Начало обработки задачи {job['id']}")
+            try:
+                result_filename = self.handler(job['id'], job['input_path'])
+            except Exception as e:
+                logger.error(f"Ошибка обработки задачи {job['id']}: {e}", exc_info=True)
+                self._finish(job['id'], job['input_path'], FAILED, error=str(e))
+            else:
+                logger.info(f"Задача {job['id']} выполнена: {result_filename}")
+                self._finish(job['id'], job['input_path'], DONE, result_filename=result_filename)
+
+    def _heartbeat_loop(self):
+        interval = max(self.lease_seconds / 4, 1)
+        while not self._stopping.wait(interval):
+            try:
+                with self._connect() as conn:
+                    conn.execute(
+                        "UPDATE jobs SET heartbeat_at = ? WHERE status = ? AND owner = ?",
+                        (time.time(), RUNNING, self.owner)
+                    )
+            except sqlite3.Error as e:
+                logger.error(f"Ошибка обновления heartbeat задач: {e}")
@@ -0,0 +1,222 @@
+# backend/metrics.py
+"""Метрики сервиса в текстовом формате Prometheus (без внешних зависимостей)"""
+import math
+import time
+import bisect
+import threading
+
+# Тип ответа эндпоинта /metrics
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Границы гистограмм по умолчанию: длительности в секундах
+DURATION_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+# Размеры в байтах: от 16 КБ до 1 ГБ
+SIZE_BUCKETS = tuple(16 * 1024 * 4 ** power for power in range(9))
+# Число строк отчета
+ROW_BUCKETS = (1000, 5000, 10000, 50000, 100000, 250000, 500000, 1000000, 2500000, 5000000)
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(labels: dict) -> str:
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + '}'
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return '+Inf'
+    if value == int(value) and abs(value) < 1e15:
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    """
+    Метрика с набором меток; значения хранятся по кортежу значений меток.
+
+    Если задан callback, значение вычисляется при каждом чтении метрик:
+    callback() возвращает число или словарь {кортеж значений меток: число}.
+    """
+
+    kind = None
+
+    def __init__(self, name: str, documentation: str, labelnames=(), registry=None, callback=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.callback = callback
+        self._values = {}
+        self._lock = threading.Lock()
+        (REGISTRY if registry is None else registry).register(self)
+
+    def _key(self, labels: dict) -> tuple:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"Метрика {self.name}: ожидаются метки {self.labelnames}, переданы {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _labels(self, key: tuple) -> dict:
+        return dict(zip(self.labelnames, key))
+
+    def samples(self):
+        """Строки значений метрики: (имя, метки, значение)"""
+        if self.callback is not None:
+            values = self.callback()
+            items = values.items() if isinstance(values, dict) else [((), values)]
+        else:
+            with self._lock:
+                items = list(self._values.items())
+        for key, value in items:
+            yield self.name, self._labels(key), value
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(f"{name}{_format_labels(labels)} {_format_value(value)}" for name, labels, value in self.samples())
+        return '\n'.join(lines)
+
+
+class Counter(_Metric):
+    """Монотонно растущий счетчик"""
+
+    kind = 'counter'
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    """Текущее значение"""
+
+    kind = 'gauge'
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    """Распределение значений по корзинам (с суммой и количеством)"""
+
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames=(), registry=None, buckets=DURATION_BUCKETS):
+        super().__init__(name, documentation, labelnames, registry)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def time(self, **labels):
+        """Контекстный менеджер: наблюдает длительность блока в секундах"""
+        return _Timer(self, labels)
+
+    def samples(self):
+        with self._lock:
+            items = [(key, (list(counts), total, count)) for key, (counts, total, count) in self._values.items()]
+        for key, (counts, total, count) in items:
+            labels = self._labels(key)
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                yield f"{self.name}_bucket", dict(labels, le=_format_value(bound)), cumulative
+            yield f"{self.name}_sum", labels, total
+            yield f"{self.name}_count", labels, count
+
+
+class _Timer:
+    def __init__(self, histogram: Histogram, labels: dict):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.started, **self.labels)
+
+
+class Registry:
+    """Набор метрик, отдаваемых эндпоинтом /metrics"""
+
+    def __init__(self):
+        self._metrics = []
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric):
+        with self._lock:
+            if any(existing.name == metric.name for existing in self._metrics):
+                raise ValueError(f"Метрика {metric.name} уже зарегистрирована")
+            self._metrics.append(metric)
+
+    def render(self) -> str:
+        """Все метрики в текстовом формате Prometheus"""
+        with self._lock:
+            metrics = list(self._metrics)
+        return '\n'.join(metric.render() for metric in metrics) + '\n'
+
+
+REGISTRY = Registry()
+
+# --- Метрики обработки отчетов ---
+REQUEST_DURATION = Histogram(
+    'wb_request_duration_seconds', 'Длительность обработки запроса', ['endpoint'])
+REQUESTS = Counter(
+    'wb_requests_total', 'Число запросов по эндпоинтам и кодам ответа', ['endpoint', 'status'])
+REQUESTS_IN_FLIGHT = Gauge(
+    'wb_requests_in_flight', 'Число выполняющихся запросов', ['endpoint'])
+REQUEST_BYTES = Histogram(
+    'wb_request_bytes', 'Размер загруженных данных', ['endpoint'], buckets=SIZE_BUCKETS)
+STAGE_DURATION = Histogram(
+    'wb_stage_duration_seconds', 'Длительность этапов обработки отчета (parse, aggregate, render)', ['stage'])
+REPORT_ROWS = Histogram(
+    'wb_report_rows', 'Число строк в обработанных отчетах', buckets=ROW_BUCKETS)
+ROWS_PROCESSED = Counter(
+    'wb_rows_processed_total', 'Всего обработано строк отчетов')
+BYTES_PROCESSED = Counter(
+    'wb_bytes_processed_total', 'Всего загружено байт отчетов')
+RESULT_BYTES = Histogram(
+    'wb_result_file_bytes', 'Размер построенных Excel-файлов', buckets=SIZE_BUCKETS)
+JOB_PEAK_RSS = Histogram(
+    'wb_job_peak_rss_bytes', 'Пиковый RSS процесса во время обработки отчета', buckets=SIZE_BUCKETS)
+ERRORS = Counter(
+    'wb_processing_errors_total', 'Ошибки обработки по типу исключения', ['exception'])
+
+
+def observe_report(stats: dict):
+    """Записывает показатели одной обработки (словарь stats, заполненный processor и пулом процессов)"""
+    for stage in ('parse', 'aggregate', 'render'):
+        if f'{stage}_seconds' in stats:
+            STAGE_DURATION.observe(stats[f'{stage}_seconds'], stage=stage)
+    if 'rows' in stats:
+        REPORT_ROWS.observe(stats['rows'])
+        ROWS_PROCESSED.inc(stats['rows'])
+    if stats.get('peak_rss_bytes'):
+        JOB_PEAK_RSS.observe(stats['peak_rss_bytes'])
+
+
+def render() -> str:
+    """Все метрики в текстовом формате Prometheus"""
+    return REGISTRY.render()
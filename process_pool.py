@@ -0,0 +1,278 @@
+# backend/process_pool.py
+"""Пул процессов для обработки отчетов с перезапуском рабочих процессов"""
+import os
+import time
+import queue
+import pickle
+import atexit
+import logging
+import threading
+import multiprocessing
+from multiprocessing.reduction import ForkingPickler
+
+logger = logging.getLogger(__name__)
+
+# Как часто проверять готовность результата и память рабочего процесса, секунды
+_POLL_INTERVAL = 0.2
+
+
+class JobTimeoutError(Exception):
+    """Задача не уложилась в отведенное время"""
+
+
+class JobMemoryError(MemoryError):
+    """Задача превысила лимит памяти"""
+
+
+class WorkerCrashedError(Exception):
+    """Рабочий процесс завершился аварийно во время выполнения задачи"""
+
+
+def _process_rss(pid, field: str = 'VmRSS') -> int:
+    """Текущий (VmRSS) или пиковый (VmHWM) RSS процесса в байтах (0, если /proc недоступен)"""
+    try:
+        with open(f"/proc/{pid}/status") as status:
+            for line in status:
+                if line.startswith(field + ':'):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return 0
+
+
+def reset_peak_rss():
+    """Сбрасывает пиковый RSS текущего процесса до текущего значения (Linux)"""
+    try:
+        with open('/proc/self/clear_refs', 'w') as clear_refs:
+            clear_refs.write('5')
+    except OSError:
+        pass
+
+
+def rss() -> int:
+    """Текущий RSS текущего процесса, байты (0, если неизвестен)"""
+    return _process_rss('self')
+
+
+def peak_rss() -> int:
+    """Пиковый RSS текущего процесса с последнего reset_peak_rss, байты (0, если неизвестен)"""
+    return _process_rss('self', 'VmHWM')
+
+
+def _worker_main(conn):
+    """Цикл рабочего процесса: получает задачи из канала и отправляет результаты"""
+    while True:
+        try:
+            task = conn.recv()
+        except EOFError:
+            break
+        if task is None:
+            break
+
+        func, args, kwargs = task
+        # Ход задачи (progress.ProgressStats) пересылается вызывающему, пока она выполняется
+        if hasattr(kwargs.get('stats'), 'publish'):
+            kwargs['stats'].publish = lambda update: conn.send(('progress', update))
+        reset_peak_rss()
+        try:
+            message = ('ok', func(*args, **kwargs))
+        except BaseException as e:
+            # Исключение может не сериализоваться - тогда передаем его текст
+            try:
+                pickle.dumps(e)
+                message = ('error', e)
+            except Exception:
+                message = ('error', RuntimeError(f"{type(e).__name__}: {e}"))
+
+        # Словарь stats задачи возвращается вызывающему вместе с пиковой памятью процесса
+        stats = kwargs.get('stats')
+        if isinstance(stats, dict):
+            stats['peak_rss_bytes'] = peak_rss()
+        conn.send(message + (stats,))
+
+
+def _crashed(worker) -> WorkerCrashedError:
+    """Ошибка для аварийно завершившегося рабочего процесса (с кодом завершения)"""
+    worker.process.join(timeout=1)
+    return WorkerCrashedError(f"Рабочий процесс {worker.process.pid} завершился с кодом {worker.process.exitcode}")
+
+
+class _Worker:
+    """Рабочий процесс пула и канал связи с ним"""
+
+    def __init__(self, context):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=_worker_main, args=(child_conn,), daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.jobs_done = 0
+
+    def stop(self):
+        """Штатно останавливает процесс, при необходимости - принудительно"""
+        try:
+            self.conn.send(None)
+        except (OSError, ValueError):
+            pass
+        self.process.join(timeout=5)
+        self.kill()
+
+    def kill(self):
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+        self.conn.close()
+
+
+class ProcessPool:
+    """
+    Пул рабочих процессов для тяжелой обработки (pandas, openpyxl).
+
+    Задачи выполняются вне процесса веб-сервера, поэтому не держат его GIL, а память,
+    фрагментированная после больших отчетов, освобождается при перезапуске процесса
+    через max_jobs_per_child задач. Зависшая или раздувшаяся задача завершается
+    вместе со своим процессом, не затрагивая остальные.
+    """
+
+    def __init__(self, max_workers: int = None, max_jobs_per_child: int = 20, timeout: float = 300,
+                 memory_limit_mb: int = 0, start_method: str = 'forkserver', preload=('processor',)):
+        """
+        Args:
+            max_workers (int): Максимум одновременно выполняемых задач (по умолчанию - число ядер)
+            max_jobs_per_child (int): Сколько задач выполняет процесс до перезапуска (0 - без ограничения)
+            timeout (float): Ограничение времени выполнения задачи, секунды (0 - без ограничения)
+            memory_limit_mb (int): Ограничение RSS процесса во время задачи, МБ (0 - без ограничения)
+            start_method (str): Способ запуска процессов multiprocessing
+            preload: Модули, импортируемые заранее при запуске через forkserver
+        """
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.max_jobs_per_child = max_jobs_per_child
+        self.timeout = timeout
+        self.memory_limit = memory_limit_mb * 1024 * 1024
+        self.context = multiprocessing.get_context(start_method)
+        if start_method == 'forkserver' and preload:
+            self.context.set_forkserver_preload(list(preload))
+
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(self.max_workers)
+        self._lock = threading.Lock()
+        self._workers = set()
+        self.in_flight = 0
+        atexit.register(self.shutdown)
+
+    def warm_up(self, workers: int = 1):
+        """
+        Запускает рабочие процессы заранее, чтобы первая задача не ждала запуска
+        forkserver и импорта модулей preload.
+        """
+        for _ in range(min(workers, self.max_workers)):
+            worker = _Worker(self.context)
+            with self._lock:
+                self._workers.add(worker)
+            self._idle.put(worker)
+
+    def run(self, func, *args, timeout: float = None, **kwargs):
+        """
+        Выполняет func(*args, **kwargs) в рабочем процессе и возвращает результат.
+
+        Блокирует вызывающий поток, пока не освободится место в пуле и задача не завершится.
+        Исключение задачи пробрасывается вызывающему. Превышение времени или памяти приводит
+        к JobTimeoutError / JobMemoryError, падение процесса - к WorkerCrashedError. Если задачу
+        нельзя передать в процесс (аргументы не сериализуются), пробрасывается ошибка сериализации.
+        Если среди kwargs есть словарь stats, изменения, сделанные в нем задачей, переносятся
+        в словарь вызывающего, а peak_rss_bytes - пиковая память рабочего процесса за задачу.
+        Если у stats есть publish (progress.ProgressStats), ход задачи передается в него
+        по мере выполнения.
+        """
+        timeout = self.timeout if timeout is None else timeout
+        with self._slots:
+            worker = self._acquire_worker()
+            with self._lock:
+                self.in_flight += 1
+            try:
+                result = self._execute(worker, func, args, kwargs, timeout)
+            except BaseException:
+                # Процесс мог остаться посреди задачи (превышение лимитов, ошибка в publish) - он не переиспользуется
+                self._discard(worker)
+                raise
+            finally:
+                with self._lock:
+                    self.in_flight -= 1
+
+            worker.jobs_done += 1
+            if self.max_jobs_per_child and worker.jobs_done >= self.max_jobs_per_child:
+                logger.info(f"Перезапуск рабочего процесса {worker.process.pid} после {worker.jobs_done} задач")
+                self._discard(worker, graceful=True)
+            else:
+                self._idle.put(worker)
+
+        status, value, stats = result
+        if stats is not None:
+            kwargs['stats'].update(stats)
+        if status == 'error':
+            raise value
+        return value
+
+    def _acquire_worker(self) -> _Worker:
+        while True:
+            try:
+                worker = self._idle.get_nowait()
+            except queue.Empty:
+                worker = _Worker(self.context)
+                with self._lock:
+                    self._workers.add(worker)
+                return worker
+            if worker.process.is_alive():
+                return worker
+            self._discard(worker)
+
+    def _execute(self, worker: _Worker, func, args, kwargs, timeout: float):
+        pid = worker.process.pid
+        try:
+            payload = ForkingPickler.dumps((func, args, kwargs))
+        except Exception as e:
+            # Задача не сериализуется - процесс ее не получил и остается свободным
+            return ('error', e, None)
+        try:
+            worker.conn.send_bytes(payload)
+        except (OSError, ValueError):
+            raise WorkerCrashedError(f"Рабочий процесс {pid} недоступен")
+        deadline = time.monotonic() + timeout if timeout else None
+
+        while True:
+            if worker.conn.poll(_POLL_INTERVAL):
+                try:
+                    message = worker.conn.recv()
+                except EOFError:
+                    raise _crashed(worker)
+                if message[0] != 'progress':
+                    return message
+                # Ход задачи - в publish словаря stats вызывающего
+                publish = getattr(kwargs.get('stats'), 'publish', None)
+                if publish is not None:
+                    publish(message[1])
+            elif not worker.process.is_alive():
+                raise _crashed(worker)
+            if deadline is not None and time.monotonic() > deadline:
+                logger.error(f"Задача в процессе {pid} превысила лимит времени {timeout} с")
+                raise JobTimeoutError(f"Обработка не уложилась в {timeout:g} с")
+            if self.memory_limit:
+                rss = _process_rss(pid)
+                if rss > self.memory_limit:
+                    logger.error(f"Задача в процессе {pid} превысила лимит памяти: {rss // (1024 * 1024)} МБ")
+                    raise JobMemoryError(f"Обработка превысила лимит памяти {self.memory_limit // (1024 * 1024)} МБ")
+
+    def _discard(self, worker: _Worker, graceful: bool = False):
+        with self._lock:
+            self._workers.discard(worker)
+        if graceful:
+            worker.stop()
+        else:
+            worker.kill()
+
+    def shutdown(self):
+        """Останавливает все рабочие процессы"""
+        with self._lock:
+            workers = list(self._workers)
+            self._workers.clear()
+        for worker in workers:
+            worker.stop()
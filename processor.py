@@ -1,10 +1,194 @@
 
+import io
+import os
+import re
+import csv
+import time
+import zlib
+import zipfile
+import itertools
+from contextlib import contextmanager
+import xml.etree.ElementTree as ET
 import pandas as pd
 import numpy as np
 from openpyxl import Workbook
-from openpyxl.styles import Font, Border, Side, Alignment, PatternFill
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font, Border, Side, Alignment, PatternFill, NamedStyle
 from openpyxl.utils import get_column_letter
 
+from processor_version import PROCESSOR_VERSION  # noqa: F401 - ключ кэша результатов
+from report_schema import COLUMN_MAPPING, ReportHeaderError, resolve_header  # noqa: F401
+
+
+# Текстовые столбцы отчета с небольшим числом различных значений - хранятся как category,
+# остальные столбцы из COLUMN_MAPPING - числовые (float64)
+TEXT_COLUMNS = [
+    'Тип документа',
+    'Обоснование для оплаты',
+    'Виды логистики, штрафов и корректировок ВВ'
+]
+
+# Размер порции, строк: отчет сворачивается в суммы по порциям (aggregate_report), CSV и читается
+# порциями (aggregate_csv_chunks) - пик памяти зависит от размера порции, а не файла. 0 - без порций
+CHUNK_ROWS = int(os.environ.get('WB_CHUNK_ROWS', 200000))
+
+# Значение столбца AQ для расходов на рекламу
+ADVERTISING_AQ = 'Оказание услуг «ВБ.Продвижение»'
+
+# Показатели строки первой таблицы
+SUMMARY_FIELDS = ['qty', 'retail_price', 'to_seller', 'retention', 'storage',
+                  'logistics', 'fines', 'acceptance', 'acquiring']
+# Заголовки первой таблицы: название строки и показатели SUMMARY_FIELDS
+SUMMARY_HEADERS = ['Названия строк', 'Кол-во продаж', 'Розничная Цена', 'Сумма к перечислению продавцу',
+                   'Удержание', 'Хранение товара', 'Логистика', 'Штрафы', 'Приемка платная', 'Эквайринг']
+# Заголовки второй таблицы при выгрузке (second_table_frame)
+SECOND_TABLE_HEADERS = ['Статья', 'Сумма', '%']
+
+# Числовые форматы и рамка ячеек Excel-отчета
+QTY_FORMAT = '#,##0'
+MONEY_FORMAT = '#,##0.00" ₽"'
+SUPPLY_FORMAT = '0'
+PERCENT_FORMAT = '0.00%'
+# Сравнение периодов: категории с движением по номерам поставок и сравниваемые суммы поставок
+COMPARISON_CATEGORIES = ['Продажа', 'Возврат']
+COMPARISON_SUPPLY_MEASURES = {'qty': 'N', 'to_seller': 'AH'}
+REPORT_BORDER = Border(
+    left=Side(style='thin'),
+    right=Side(style='thin'),
+    top=Side(style='thin'),
+    bottom=Side(style='thin')
+)
+
+# Столбцы, по сочетаниям значений которых суммируются показатели отчета
+KEY_COLUMNS = ['J', 'K', 'AQ']
+
+# Категории для обработки.
+# measures - из каких сумм aggregate_by_keys берутся показатели категории,
+# отсутствующие в measures показатели равны нулю
+REPORT_CATEGORIES = [
+    {
+        'name': 'Возврат',
+        'type': 'both',  # Изменено на both - проверка и J и K
+        'value_j': 'Возврат',
+        'value_k': 'Возврат',
+        'has_details': True,
+        'measures': {'qty': 'N', 'retail_price': 'NO', 'to_seller': 'AH', 'acquiring': 'AC'}
+    },
+    {
+        'name': 'Логистика',
+        'type': 'direct',
+        'column': 'AK',
+        'has_details': False,
+        'measures': {'logistics': 'AK'}
+    },
+    {
+        'name': 'Продажа',
+        'type': 'both',  # Новый тип - проверка и J и K
+        'value_j': 'Продажа',
+        'value_k': 'Продажа',
+        'has_details': True,
+        'measures': {'qty': 'N', 'retail_price': 'NO', 'to_seller': 'AH', 'acquiring': 'AC'}
+    },
+    {
+        'name': 'Возмещение издержек по перевозке/по складским операциям с товаром',
+        'type': 'K',
+        'value': 'Возмещение издержек по перевозке/по складским операциям с товаром',
+        'has_details': False,
+        'column': 'BK',
+        'measures': {'qty': 'N', 'logistics': 'BK'}
+    },
+    {
+        'name': 'Хранение',
+        'type': 'direct',
+        'column': 'BH',
+        'has_details': False,
+        'measures': {'storage': 'BH'}
+    },
+    {
+        'name': 'Удержание',
+        'type': 'direct',
+        'column': 'BI', 
+        'has_details': False,
+        'measures': {'retention': 'BI'}
+    },
+    {
+        'name': 'Коррекция логистики',
+        'type': 'K',
+        'value': 'Коррекция логистики',
+        'has_details': False,
+        'column': 'AK',
+        'measures': {'logistics': 'AK'}
+    },
+    {
+        'name': 'Штраф',
+        'type': 'direct',
+        'column': 'AO',
+        'has_details': False,
+        'measures': {'fines': 'AO'}
+    },
+    {
+        'name': 'Компенсация ущерба',
+        'type': 'K',
+        'value': 'Компенсация ущерба',
+        'has_details': False,
+        'measures': {'qty': 'N', 'to_seller': 'AH'}
+    },
+    {
+        'name': 'Добровольная компенсация при возврате',
+        'type': 'K',
+        'value': 'Добровольная компенсация при возврате',
+        'has_details': False,
+        'measures': {'qty': 'N', 'to_seller': 'AH'}
+    }
+]
+
+@contextmanager
+def stage_timer(stats: dict, stage: str):
+    """
+    Добавляет длительность блока в stats['<stage>_seconds'] (если stats не None).
+
+    Если у stats есть метод stage_finished (профилирование, profiling.ProfileStats),
+    он вызывается в конце этапа, пока его данные еще в памяти.
+    """
+    if stats is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        stats[f'{stage}_seconds'] = stats.get(f'{stage}_seconds', 0) + time.perf_counter() - started
+        if hasattr(stats, 'stage_finished'):
+            stats.stage_finished(stage)
+
+# Как часто в построчных циклах (разбор xlsx, запись Excel) сообщать о ходе обработки, строки
+PROGRESS_ROWS = 1000
+
+def report_progress(stats: dict, stage: str, **counts):
+    """
+    Сообщает о ходе этапа (счетчики counts), если у stats есть метод progress
+    (progress.ProgressStats); обычный словарь stats ничего не получает.
+    """
+    if stats is not None and hasattr(stats, 'progress'):
+        stats.progress(stage, **counts)
+
+def _expected_rows(stats: dict, file_path, file_format: str = None):
+    """Оценка числа строк отчета для сообщений о ходе разбора (None - ход не отслеживается или оценки нет)"""
+    if stats is None or not hasattr(stats, 'progress'):
+        return None
+    return estimate_report_rows(file_path, file_format) or None
+
+def _reported_rows(rows, stats: dict, stage: str, rows_total: int = None):
+    """Строки rows без изменений; каждые PROGRESS_ROWS строк - сообщение о ходе этапа"""
+    if stats is None or not hasattr(stats, 'progress'):
+        yield from rows
+        return
+    count = 0
+    for batch in iter(lambda: list(itertools.islice(rows, PROGRESS_ROWS)), []):
+        yield from batch
+        count += len(batch)
+        stats.progress(stage, rows=count, rows_total=rows_total)
+
 def format_currency(value: float) -> str:
     """Форматирует число в валюту с рублями"""
     if pd.isna(value) or value == 0:
@@ -28,248 +212,761 @@ def format_percentage(value: float) -> str:
         # Оставляем как есть, но убираем нули в конце
         return f"{value:.10g}%"
 
-def read_wb_report(file_path: str) -> pd.DataFrame:
-    """Читает файл отчета Wildberries (xlsx или csv)"""
-    if file_path.endswith('.xlsx'):
-        df = pd.read_excel(file_path)
-    elif file_path.endswith('.csv'):
-        df = pd.read_csv(file_path)
+def _xlsx_first_sheet_path(archive: zipfile.ZipFile) -> str:
+    """Возвращает путь к первому листу внутри xlsx-архива"""
+    try:
+        workbook = ET.fromstring(archive.read('xl/workbook.xml'))
+        sheet = workbook.find('{*}sheets/{*}sheet')
+        rel_id = next(value for key, value in sheet.attrib.items() if key.endswith('}id'))
+        rels = ET.fromstring(archive.read('xl/_rels/workbook.xml.rels'))
+        for rel in rels.findall('{*}Relationship'):
+            if rel.get('Id') == rel_id:
+                target = rel.get('Target')
+                # Путь может быть абсолютным внутри пакета или относительным к xl/
+                return target.lstrip('/') if target.startswith('/') else 'xl/' + target
+    except (KeyError, StopIteration, AttributeError):
+        pass
+    return 'xl/worksheets/sheet1.xml'
+
+def _iter_xlsx_shared_strings(archive: zipfile.ZipFile):
+    """Потоково читает таблицу общих строк xlsx-файла"""
+    try:
+        source = archive.open('xl/sharedStrings.xml')
+    except KeyError:
+        return
+    
+    with source:
+        for _, elem in ET.iterparse(source):
+            if elem.tag.endswith('}si'):
+                # Строка может состоять из нескольких фрагментов (rich text), фонетику rPh пропускаем
+                parts = []
+                for child in elem:
+                    if child.tag.endswith('}t'):
+                        parts.append(child.text or '')
+                    elif child.tag.endswith('}r'):
+                        parts.extend(t.text or '' for t in child if t.tag.endswith('}t'))
+                yield ''.join(parts)
+                elem.clear()
+
+class _SharedStrings:
+    """
+    Таблица общих строк xlsx-файла, читаемая по мере обращения.
+
+    Заголовок отчета обычно ссылается на первые строки таблицы - его можно
+    проверить, не разбирая всю таблицу.
+    """
+
+    def __init__(self, archive: zipfile.ZipFile):
+        self._strings = []
+        self._source = _iter_xlsx_shared_strings(archive)
+
+    def __getitem__(self, index: int) -> str:
+        strings = self._strings
+        while len(strings) <= index:
+            try:
+                strings.append(next(self._source))
+            except StopIteration:
+                raise IndexError(f"Нет общей строки с номером {index}") from None
+        return strings[index]
+
+def _iter_xlsx_rows(file_path, columns):
+    """
+    Потоково читает первый лист xlsx-файла, возвращая только нужные столбцы.
+    
+    Первая строка листа считается заголовком и сопоставляется со столбцами columns
+    (resolve_header) до разбора остальных строк. Первым значением генератор отдает
+    список найденных столбцов (названия из columns), затем - кортежи значений этих
+    столбцов по строкам. Ячейки остальных столбцов не разбираются.
+    
+    Файл, который не читается как книга xlsx (не zip-архив, нет листа, испорченный XML),
+    отклоняется так же, как файл без нужных столбцов - ReportHeaderError.
+    """
+    try:
+        yield from _iter_xlsx_sheet_rows(file_path, columns)
+    except (zipfile.BadZipFile, zlib.error, KeyError, ET.ParseError) as e:
+        raise ReportHeaderError(f"Файл не читается как книга Excel (.xlsx): {e}") from e
+
+def _iter_xlsx_sheet_rows(file_path, columns):
+    """_iter_xlsx_rows без проверки, что файл - книга xlsx"""
+    with zipfile.ZipFile(file_path) as archive:
+        shared_strings = _SharedStrings(archive)
+        with archive.open(_xlsx_first_sheet_path(archive)) as source:
+            context = ET.iterparse(source, events=('start', 'end'))
+            
+            # Пространство имен берем из корневого элемента листа
+            _, root = next(context)
+            ns = root.tag[:root.tag.index('}') + 1] if root.tag.startswith('{') else ''
+            row_tag, cell_tag, value_tag = ns + 'row', ns + 'c', ns + 'v'
+            inline_tag, text_tag, sheet_data_tag = ns + 'is', ns + 't', ns + 'sheetData'
+            
+            sheet_data = root
+            wanted = None  # буквы столбца -> позиция в результате
+            header = {}
+            values = {}
+            position = 0
+            
+            for event, elem in context:
+                tag = elem.tag
+                if event == 'start':
+                    if tag == sheet_data_tag:
+                        sheet_data = elem
+                    elif tag == row_tag:
+                        values = {}
+                        position = 0
+                    continue
+                
+                if tag == cell_tag:
+                    ref = elem.get('r')
+                    if ref is None:
+                        # Ссылка на ячейку необязательна - тогда ячейки идут подряд
+                        position += 1
+                        letters = get_column_letter(position)
+                    else:
+                        letters = ref.rstrip('0123456789')
+                    
+                    if wanted is None or letters in wanted:
+                        cell_type = elem.get('t')
+                        if cell_type == 'inlineStr':
+                            inline = elem.find(inline_tag)
+                            value = ''.join(t.text or '' for t in inline.iter(text_tag)) if inline is not None else None
+                        else:
+                            raw = elem.findtext(value_tag)
+                            if raw is None:
+                                value = None
+                            elif cell_type == 's':
+                                value = shared_strings[int(raw)]
+                            elif cell_type in ('str', 'd'):
+                                value = raw
+                            elif cell_type == 'b':
+                                value = raw == '1'
+                            elif cell_type == 'e':
+                                value = None
+                            else:
+                                value = float(raw)
+                        values[letters] = value
+                
+                elif tag == row_tag:
+                    if wanted is None:
+                        # Первая строка - заголовок: сопоставляем имена столбцов с буквами
+                        _, names = resolve_header(list(values.values()), columns)
+                        for letters, name in values.items():
+                            if isinstance(name, str) and name in names and names[name] not in header:
+                                header[names[name]] = letters
+                        wanted = {letters: name for name, letters in header.items()}
+                        yield list(header)
+                    elif values:
+                        yield tuple(values.get(letters) for letters in header.values())
+                    sheet_data.clear()
+            
+            if wanted is None:
+                # Пустой лист - заголовка нет
+                resolve_header([], columns)
+
+def read_xlsx_columns(file_path, columns=COLUMN_MAPPING, stats: dict = None) -> pd.DataFrame:
+    """
+    Читает из xlsx-отчета (путь или позиционируемый файловый объект) только указанные столбцы.
+    
+    Разбор идет построчно (iterparse), без загрузки всей книги в память,
+    числовые столбцы сразу собираются в массивы float64. О ходе разбора
+    сообщается в stats (report_progress).
+    """
+    rows_total = _expected_rows(stats, file_path, 'xlsx')
+    rows = _iter_xlsx_rows(file_path, columns)
+    names = next(rows)
+    return _xlsx_frame(names, _reported_rows(rows, stats, 'parse', rows_total))
+
+def iter_xlsx_chunks(file_path, chunk_rows: int, columns=COLUMN_MAPPING):
+    """
+    Читает xlsx-отчет порциями по chunk_rows строк (DataFrame со столбцами как у read_xlsx_columns).
+    
+    Лист разбирается потоково (_iter_xlsx_rows): в памяти только строки текущей порции
+    и уже встреченные общие строки книги. Если в отчете нет строк, отдается одна пустая порция.
+    """
+    rows = _iter_xlsx_rows(file_path, columns)
+    names = next(rows)
+    batch = list(itertools.islice(rows, chunk_rows))
+    yield _xlsx_frame(names, batch)
+    while len(batch) == chunk_rows:
+        batch = list(itertools.islice(rows, chunk_rows))
+        if not batch:
+            break
+        yield _xlsx_frame(names, batch)
+
+def _xlsx_frame(names: list, rows) -> pd.DataFrame:
+    """DataFrame из строк _iter_xlsx_rows: текстовые столбцы - category, числовые - float64"""
+    data = list(zip(*rows)) if names else []
+    if not data:
+        data = [()] * len(names)
+    
+    frame = {}
+    for name, column in zip(names, data):
+        if name in TEXT_COLUMNS:
+            frame[name] = pd.Categorical(np.array(column, dtype=object))
+        else:
+            try:
+                frame[name] = np.array(column, dtype=np.float64)
+            except (TypeError, ValueError):
+                # Встречаются текстовые значения в числовом столбце - приводим к NaN
+                frame[name] = pd.to_numeric(pd.Series(column, dtype=object), errors='coerce').to_numpy(np.float64)
+    
+    return pd.DataFrame(frame, columns=names)
+
+def report_dtypes(names) -> dict:
+    """Схема типов для столбцов отчета: текстовые - category, остальные - float64"""
+    return {name: 'category' if name in TEXT_COLUMNS else 'float64' for name in names}
+
+def _csv_dtypes(names: dict) -> dict:
+    """
+    Типы столбцов при разборе CSV ({название в файле: название столбца}): текстовые - category,
+    тип числовых определяет pandas, затем они приводятся к float64 (_numeric_columns).
+    """
+    return {name: 'category' for name, column in names.items() if column in TEXT_COLUMNS}
+
+def _numeric_columns(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Приводит числовые столбцы отчета к float64. Текстовые значения в них становятся NaN -
+    так же, как при разборе xlsx (_xlsx_frame), а не прерывают разбор ошибкой.
+    """
+    for name in df.columns:
+        if name not in TEXT_COLUMNS and df[name].dtype != np.float64:
+            df[name] = pd.to_numeric(df[name], errors='coerce').astype(np.float64)
+    return df
+
+# Наибольшая длина первой строки CSV-отчета, байты: без перевода строки в ней файл - не отчет
+CSV_HEADER_MAX_BYTES = 64 * 1024
+
+class _PrefixedStream(io.RawIOBase):
+    """Поток, который сначала отдает уже прочитанное начало (prefix), затем остаток stream"""
+
+    def __init__(self, prefix: bytes, stream):
+        self._prefix = memoryview(prefix)
+        self._stream = stream
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        if self._prefix:
+            size = min(len(buffer), len(self._prefix))
+            buffer[:size] = self._prefix[:size]
+            self._prefix = self._prefix[size:]
+            return size
+        data = self._stream.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+def _csv_header(file_path) -> tuple:
+    """
+    Заголовок CSV-отчета (первая строка) и источник для разбора всего файла.
+    
+    Из непозиционируемого потока первая строка читается один раз и затем
+    возвращается разбору вместе с остатком потока.
+    """
+    if isinstance(file_path, (str, os.PathLike)):
+        with open(file_path, 'rb') as source:
+            first_line = source.readline(CSV_HEADER_MAX_BYTES)
+    elif file_path.seekable():
+        position = file_path.tell()
+        first_line = file_path.readline(CSV_HEADER_MAX_BYTES)
+        file_path.seek(position)
+    else:
+        first_line = file_path.readline(CSV_HEADER_MAX_BYTES)
+        file_path = io.BufferedReader(_PrefixedStream(first_line, file_path))
+    
+    if isinstance(first_line, str):
+        first_line = first_line.encode('utf-8')
+    if not first_line.endswith(b'\n') and len(first_line) >= CSV_HEADER_MAX_BYTES:
+        return [], file_path
+    header = next(csv.reader([first_line.decode('utf-8-sig', errors='replace')]), [])
+    return header, file_path
+
+def read_csv_columns(file_path, columns=COLUMN_MAPPING) -> pd.DataFrame:
+    """
+    Читает из csv-отчета только указанные столбцы: текстовые - category, числовые - float64.
+    
+    Сначала по первой строке определяется, в каких столбцах файла находятся нужные
+    (resolve_header) - файл без них отклоняется до разбора данных.
+    
+    Args:
+        file_path: Путь к csv-файлу или файловый объект (в том числе непозиционируемый поток)
+        columns: Имена нужных столбцов
+    """
+    header, file_path = _csv_header(file_path)
+    _, names = resolve_header(header, columns)
+    
+    # Лишние столбцы отбрасываются по имени прямо при разборе
+    df = pd.read_csv(file_path, usecols=list(names), dtype=_csv_dtypes(names))
+    return _numeric_columns(df.rename(columns=names))
+
+def iter_csv_chunks(file_path, chunk_rows: int, columns=COLUMN_MAPPING):
+    """
+    Читает csv-отчет порциями по chunk_rows строк (DataFrame со столбцами как у read_csv_columns).
+    
+    Если в отчете нет строк, отдается одна пустая порция.
+    """
+    header, file_path = _csv_header(file_path)
+    _, names = resolve_header(header, columns)
+    
+    empty = True
+    with pd.read_csv(file_path, usecols=list(names), dtype=_csv_dtypes(names), chunksize=chunk_rows) as reader:
+        for chunk in reader:
+            empty = False
+            yield _numeric_columns(chunk.rename(columns=names))
+    if empty:
+        dtypes = report_dtypes(names.values())
+        yield pd.DataFrame({name: pd.Series(dtype=dtypes[name]) for name in names.values()})
+
+# Размер блока при поиске границ записей CSV-файла (csv_partitions), байты
+_SCAN_BLOCK_BYTES = 16 * 1024 * 1024
+
+class _FileRange(io.RawIOBase):
+    """Поток байтов файла с позиции start до end"""
+
+    def __init__(self, file_path, start: int, end: int):
+        self._file = open(file_path, 'rb')
+        self._file.seek(start)
+        self._remaining = end - start
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        size = min(len(buffer), self._remaining)
+        if size <= 0:
+            return 0
+        read = self._file.readinto(memoryview(buffer)[:size])
+        self._remaining -= read
+        return read
+
+    def close(self):
+        self._file.close()
+        super().close()
+
+_QUOTE, _LF = b'"', b'\n'
+_FIELD_STARTS = np.frombuffer(b',\n\r', dtype=np.uint8)
+
+def _quote_toggles(data: np.ndarray, previous_byte: bytes, in_quotes: bool) -> tuple:
+    """
+    Позиции блока, в которых начинается или заканчивается значение в кавычках, по правилам pandas.
+    
+    Кавычка открывает значение только в начале поля (после разделителя, перевода строки или
+    в начале части), иначе это обычный символ. Внутри значения пара кавычек - символ,
+    одиночная закрывает значение. Поэтому серия из k кавычек подряд меняет состояние, только
+    если k нечетно: в начале поля - всегда, в середине поля - только внутри значения (закрывает его).
+    Состояние перед каждой серией считается векторно: четность числа серий первого вида
+    после последней серии второго вида. Серия кавычек не должна делиться между блоками.
+    in_quotes - внутри ли значения в начале блока; возвращает (позиции, in_quotes в конце блока).
+    """
+    quotes = np.flatnonzero(data == ord('"'))
+    if not len(quotes):
+        return quotes, in_quotes
+    run_starts = np.flatnonzero(np.diff(quotes, prepend=-2) != 1)
+    odd = np.diff(run_starts, append=len(quotes)) % 2 == 1
+    runs = quotes[run_starts[odd]]
+    if not len(runs):
+        return runs, in_quotes
+    
+    previous = np.where(runs > 0, data[np.maximum(runs - 1, 0)], previous_byte[0])
+    field_start = np.isin(previous, _FIELD_STARTS)
+    index = np.arange(len(runs))
+    # Последняя серия в середине поля перед каждой серией: после нее значение всегда закрыто
+    last_closing = np.maximum.accumulate(np.where(field_start, -1, index))
+    last_closing = np.concatenate(([-1], last_closing[:-1]))
+    toggling = np.cumsum(field_start)
+    toggling_before = toggling - field_start
+    since_closing = toggling_before - np.where(last_closing >= 0, toggling[np.maximum(last_closing, 0)], 0)
+    inside = (np.where(last_closing >= 0, 0, int(in_quotes)) + since_closing) % 2 == 1
+    
+    flips = field_start | inside
+    in_quotes = bool(field_start[-1] and not inside[-1])
+    return runs[flips], in_quotes
+
+def csv_record_offsets(file_path, every: int, start: int = 0):
+    """
+    Смещения начала записей CSV-файла с номерами every, 2*every, ... (считая от 0 с позиции start).
+    
+    Перевод строки внутри значения в кавычках запись не завершает; кавычки учитываются так же,
+    как при разборе pandas (_quote_toggles), пустые строки, как и там, записями не считаются.
+    Поиск векторный (numpy), файл читается блоками.
+    Возвращает None, если в файле есть одиночный \r: pandas считает его концом записи,
+    и границы записей здесь не определить.
+    """
+    offsets = []
+    records = 0
+    in_quotes = False
+    record_start = start
+    position = start
+    # Часть начинается с начала записи - как после перевода строки
+    last_byte = _LF
+    with open(file_path, 'rb') as source:
+        source.seek(start)
+        block = source.read(_SCAN_BLOCK_BYTES)
+        following = source.read(_SCAN_BLOCK_BYTES)
+        while block:
+            # Серия кавычек не делится между блоками
+            while block.endswith(_QUOTE) and following.startswith(_QUOTE):
+                run = len(following) - len(following.lstrip(_QUOTE))
+                block, following = block + following[:run], following[run:] or source.read(_SCAN_BLOCK_BYTES)
+            
+            data = np.frombuffer(block, dtype=np.uint8)
+            returns = np.flatnonzero(data == ord('\r'))
+            if len(returns):
+                inner = returns[returns + 1 < len(data)]
+                if (data[inner + 1] != ord('\n')).any() or (returns[-1] == len(data) - 1 and following[:1] != _LF):
+                    return None
+            
+            ends = np.flatnonzero(data == ord('\n'))
+            started_in_quotes = in_quotes
+            toggles, in_quotes = _quote_toggles(data, last_byte, in_quotes)
+            if len(toggles) or started_in_quotes:
+                ends = ends[(started_in_quotes + np.searchsorted(toggles, ends)) % 2 == 0]
+            if len(ends):
+                # Пустая строка: перевод строки сразу после начала записи (или после \r в ее начале)
+                length = ends - np.concatenate(([record_start - position], ends[:-1] + 1))
+                previous = np.where(ends > 0, data[np.maximum(ends - 1, 0)], last_byte[0])
+                blank = (length == 0) | ((length == 1) & (previous == ord('\r')))
+                record_start = position + int(ends[-1]) + 1
+                ends = ends[~blank]
+                wanted = np.arange(every - 1 - records % every, len(ends), every)
+                offsets.extend((position + ends[wanted] + 1).tolist())
+                records += len(ends)
+            position += len(block)
+            last_byte = block[-1:]
+            block, following = following, source.read(_SCAN_BLOCK_BYTES)
+    return [offset for offset in offsets if offset < position]
+
+def csv_partitions(file_path, partitions: int, chunk_rows: int = None) -> tuple:
+    """
+    Делит CSV-файл на partitions частей по границам порций из chunk_rows записей (CHUNK_ROWS).
+    
+    Возвращает (строка заголовка в байтах, [(начало, конец), ...] - смещения частей в файле).
+    Части можно разбирать независимо (aggregate_csv_range): порции в них те же, что и при
+    чтении файла целиком порциями, поэтому и суммы после объединения по порядку совпадают.
+    Если границы записей не определить (csv_record_offsets), часть одна - весь файл.
+    Заголовок проверяется (resolve_header) до поиска границ.
+    """
+    chunk_rows = chunk_rows or CHUNK_ROWS
+    with open(file_path, 'rb') as source:
+        header_line = source.readline(CSV_HEADER_MAX_BYTES)
+    header, _ = _csv_header(file_path)
+    resolve_header(header)
+    
+    size = os.path.getsize(file_path)
+    offsets = csv_record_offsets(file_path, chunk_rows, len(header_line))
+    if offsets is None:
+        return header_line, [(len(header_line), size)]
+    boundaries = [len(header_line)] + offsets + [size]
+    chunks = len(boundaries) - 1
+    partitions = max(1, min(partitions, chunks))
+    # Части - из целого числа порций, числа порций в частях отличаются не больше чем на одну
+    cuts = [boundaries[chunks * part // partitions] for part in range(partitions)] + [size]
+    return header_line, [(cuts[part], cuts[part + 1]) for part in range(partitions)]
+
+def report_format(file_path) -> str:
+    """Формат отчета ('xlsx' или 'csv') по имени файла или атрибуту name файлового объекта"""
+    name = file_path if isinstance(file_path, (str, os.PathLike)) else getattr(file_path, 'name', None)
+    if not isinstance(name, (str, os.PathLike)):
+        return ''
+    return os.path.splitext(os.fspath(name))[1].lstrip('.').lower()
+
+# Оценка числа строк без разбора (estimate_report_rows): сколько байт начала файла смотреть
+# и типичный размер строки, если его не по чему определить
+ROW_SNIFF_BYTES = 64 * 1024
+CSV_ROW_BYTES = 130
+XLSX_XML_ROW_BYTES = 700
+_XLSX_DIMENSION = re.compile(rb'<(?:\w+:)?dimension\s+ref="(?:[A-Z]+\d+:)?[A-Z]+(\d+)"')
+
+def estimate_report_rows(file_path, file_format: str = None, size: int = None) -> int:
+    """
+    Быстрая оценка числа строк отчета без его разбора (для оценки стоимости обработки).
+    
+    xlsx - по размеру листа из элемента <dimension>, а если его нет - по объему XML листа;
+    CSV - по размеру файла и средней длине строки в его первых ROW_SNIFF_BYTES байтах.
+    Позиция файлового объекта не меняется. Из непозиционируемого потока (CSV в теле запроса)
+    ничего не читается: оценка по размеру size (например, Content-Length) и CSV_ROW_BYTES.
+    """
+    file_format = file_format or report_format(file_path)
+    is_path = isinstance(file_path, (str, os.PathLike))
+    if not is_path and not file_path.seekable():
+        return (size or 0) // CSV_ROW_BYTES
+    position = None if is_path else file_path.tell()
+    try:
+        if file_format == 'xlsx':
+            with zipfile.ZipFile(file_path) as archive:
+                sheet_path = _xlsx_first_sheet_path(archive)
+                with archive.open(sheet_path) as sheet:
+                    match = _XLSX_DIMENSION.search(sheet.read(ROW_SNIFF_BYTES))
+                if match:
+                    return max(int(match.group(1)) - 1, 0)
+                return archive.getinfo(sheet_path).file_size // XLSX_XML_ROW_BYTES
+        
+        if is_path:
+            size = os.path.getsize(file_path)
+            with open(file_path, 'rb') as source:
+                sample = source.read(ROW_SNIFF_BYTES)
+        else:
+            size = file_path.seek(0, os.SEEK_END) - position
+            file_path.seek(position)
+            sample = file_path.read(ROW_SNIFF_BYTES)
+        lines = sample.count(b'\n')
+        if len(sample) >= size:
+            return max(lines - 1, 0)
+        return size * lines // len(sample) if lines else size // CSV_ROW_BYTES
+    except (zipfile.BadZipFile, KeyError, OSError):
+        return (size or 0) // CSV_ROW_BYTES
+    finally:
+        if position is not None:
+            file_path.seek(position)
+
+def read_wb_report(file_path, file_format: str = None, stats: dict = None) -> pd.DataFrame:
+    """
+    Читает файл отчета Wildberries (xlsx или csv)
+    
+    Args:
+        file_path: Путь к файлу или файловый объект с содержимым отчета
+        file_format (str): 'xlsx' или 'csv'; если не указан - определяется по имени файла
+        stats (dict): Куда сообщать о ходе разбора xlsx (report_progress)
+    """
+    file_format = file_format or report_format(file_path)
+    if file_format == 'xlsx':
+        df = read_xlsx_columns(file_path, stats=stats)
+    elif file_format == 'csv':
+        df = read_csv_columns(file_path)
     else:
         raise ValueError("Файл должен быть в формате .xlsx или .csv")
     
     return df
 
-def create_summary_data(df: pd.DataFrame) -> tuple:
-    """Создает структурированные данные для отчета"""
+def aggregate_by_keys(df: pd.DataFrame, col_indices: dict) -> pd.DataFrame:
+    """
+    Суммирует показатели отчета за один проход по строкам.
     
-    # Определение индексов столбцов
-    col_indices = {}
-    column_mapping = {
-        'Тип документа': 'J',
-        'Обоснование для оплаты': 'K', 
-        'Кол-во': 'N',
-        'Цена розничная': 'O',
-        'К перечислению Продавцу за реализованный Товар': 'AH',
-        'Удержания': 'BI',
-        'Хранение': 'BH',
-        'Услуги по доставке товара покупателю': 'AK',
-        'Общая сумма штрафов': 'AO',
-        'Эквайринг/Комиссии за организацию платежей': 'AC',
-        'Платная приемка': 'BJ',
-        'Номер поставки': 'B',
-        'Возмещение издержек по перевозке/по складским операциям с товаром': 'BK',
-        'Размер кВВ, %': 'X',
-        'Виды логистики, штрафов и корректировок ВВ': 'AQ'  # Добавлен новый столбец
-    }
+    Строки группируются по сочетаниям значений J, K и AQ (таких сочетаний немного),
+    для каждой группы считаются суммы N, N*O, AH, AC, AK, BH, BI, AO, BJ, BK и N*O*X/100.
+    Показатели обеих таблиц затем берутся из этого небольшого результата.
     
-    for col_name, col_letter in column_mapping.items():
-        for idx, name in enumerate(df.columns):
-            if name == col_name:
-                col_indices[col_letter] = idx
-                break
+    Разбиение на группы строится один раз, столбцы суммируются по одному прямо из df -
+    копия всех показателей в отдельной таблице не создается. Пустые строки (без J и K)
+    попадают в одну группу, которая отбрасывается уже после суммирования.
+    """
+    def column(letter):
+        return df.iloc[:, col_indices[letter]]
     
-    # Фильтрация пустых строк
-    df_filtered = df.dropna(subset=[df.columns[col_indices['J']], df.columns[col_indices['K']]], how='all')
-    df_filtered = df_filtered.copy()
-    df_filtered['Номер поставки'] = df_filtered.iloc[:, col_indices['B']]
+    grouped = column('N').groupby([column('J'), column('K'), column('AQ')],
+                                  observed=True, dropna=False, sort=False)
+    qty_totals = grouped.sum()
+    # Номер группы каждой строки: остальные столбцы суммируются по нему в том же порядке групп
+    group_ids = grouped.ngroup().to_numpy()
     
-    # Создание структурированных данных для первой таблицы
-    structured_data = []
+    def group_sum(values: pd.Series) -> np.ndarray:
+        return values.groupby(group_ids, sort=False).sum().to_numpy()
     
-    # Категории для обработки
-    categories = [
-        {
-            'name': 'Возврат',
-            'type': 'both',  # Изменено на both - проверка и J и K
-            'value_j': 'Возврат',
-            'value_k': 'Возврат',
-            'has_details': True
-        },
-        {
-            'name': 'Логистика',
-            'type': 'direct',
-            'column': 'AK',
-            'has_details': False
-        },
-        {
-            'name': 'Продажа',
-            'type': 'both',  # Новый тип - проверка и J и K
-            'value_j': 'Продажа',
-            'value_k': 'Продажа',
-            'has_details': True
-        },
-        {
-            'name': 'Возмещение издержек по перевозке/по складским операциям с товаром',
-            'type': 'K',
-            'value': 'Возмещение издержек по перевозке/по складским операциям с товаром',
-            'has_details': False,
-            'column': 'BK'
-        },
-        {
-            'name': 'Хранение',
-            'type': 'direct',
-            'column': 'BH',
-            'has_details': False
-        },
-        {
-            'name': 'Удержание',
-            'type': 'direct',
-            'column': 'BI', 
-            'has_details': False
-        },
-        {
-            'name': 'Коррекция логистики',
-            'type': 'K',
-            'value': 'Коррекция логистики',
-            'has_details': False,
-            'column': 'AK'
-        },
-        {
-            'name': 'Штраф',
-            'type': 'direct',
-            'column': 'AO',
-            'has_details': False
-        },
-        {
-            'name': 'Компенсация ущерба',
-            'type': 'K',
-            'value': 'Компенсация ущерба',
-            'has_details': False
-        },
+    retail = column('N') * column('O')
+    totals = {'N': qty_totals.to_numpy(), 'NO': group_sum(retail)}
+    for letter in ('AH', 'AC', 'AK', 'BH', 'BI', 'AO', 'BJ', 'BK'):
+        totals[letter] = group_sum(column(letter))
+    totals['NOX'] = group_sum(retail * column('X') / 100)  # Процент с продаж Wildberries
+    
+    key_totals = pd.DataFrame(totals, index=qty_totals.index.set_names(KEY_COLUMNS)).reset_index()
+    empty = key_totals['J'].isna() & key_totals['K'].isna()
+    return key_totals[~empty].reset_index(drop=True) if empty.any() else key_totals
+
+def _key_mask(key_totals: pd.DataFrame, j=None, k=None) -> np.ndarray:
+    """Маска групп aggregate_by_keys с заданными значениями J и K"""
+    mask = np.ones(len(key_totals), dtype=bool)
+    if j is not None:
+        mask &= (key_totals['J'] == j).to_numpy()
+    if k is not None:
+        mask &= (key_totals['K'] == k).to_numpy()
+    return mask
+
+def _category_mask(key_totals: pd.DataFrame, category: dict) -> np.ndarray:
+    """Маска групп aggregate_by_keys, относящихся к категории"""
+    if category['type'] == 'J':
+        return _key_mask(key_totals, j=category['value'])
+    elif category['type'] == 'K':
+        return _key_mask(key_totals, k=category['value'])
+    elif category['type'] == 'both':
+        return _key_mask(key_totals, j=category['value_j'], k=category['value_k'])
+    return _key_mask(key_totals)
+
+def _supply_numbers(values: pd.Index) -> list:
+    """Номера поставок в числовом формате без десятичных"""
+    if values.dtype.kind in 'fiu':
+        return values.astype(np.int64).tolist()
+    return [int(value) for value in values]
+
+def aggregate_supplies(df: pd.DataFrame, col_indices: dict) -> pd.DataFrame:
+    """
+    Суммирует показатели категорий с детализацией по номерам поставок.
+    
+    Для каждой пары (категория, номер поставки) хранятся суммы N, AH, AC и сумма
+    с количеством непустых значений O - средняя розничная цена считается из них,
+    поэтому результаты нескольких отчетов можно просто сложить (merge_aggregates).
+    Строки без номера поставки образуют отдельную группу: детализации для них нет,
+    но категория с такими строками все равно считается непустой.
+    """
+    def column(letter):
+        return df.iloc[:, col_indices[letter]]
+    
+    parts = []
+    for category in REPORT_CATEGORIES:
+        if not category.get('has_details', False):
+            continue
+        mask = (column('J') == category['value_j']) & (column('K') == category['value_k'])
+        price = column('O')[mask]
+        parts.append(pd.DataFrame({
+            'category': category['name'],
+            'supply': column('B')[mask],
+            'N': column('N')[mask],
+            'O_sum': price,
+            'O_count': price.notna().astype(np.int64),
+            'AH': column('AH')[mask],
+            'AC': column('AC')[mask]
+        }))
+    
+    supplies = pd.concat(parts, ignore_index=True)
+    return supplies.groupby(['category', 'supply'], dropna=False, sort=False).sum().reset_index()
+
+def aggregate_report(df: pd.DataFrame, chunk_rows: int = None) -> dict:
+    """
+    Сворачивает прочитанный отчет в суммы, из которых строятся обе таблицы.
+    
+    Возвращает словарь {'key_totals': суммы по сочетаниям J, K, AQ (aggregate_by_keys),
+    'supplies': суммы по номерам поставок (aggregate_supplies)}. Суммы нескольких
+    отчетов объединяются функцией merge_aggregates.
+    
+    Строки сворачиваются порциями по chunk_rows (по умолчанию CHUNK_ROWS) в том же
+    порядке, что и при чтении CSV порциями (aggregate_csv_chunks), поэтому результат
+    обоих способов совпадает до последнего знака.
+    """
+    chunk_rows = CHUNK_ROWS if chunk_rows is None else chunk_rows
+    if not chunk_rows or len(df) <= chunk_rows:
+        return _aggregate_chunk(df)
+    aggregates = None
+    for start in range(0, len(df), chunk_rows):
+        aggregates = fold_aggregates(aggregates, _aggregate_chunk(df.iloc[start:start + chunk_rows]))
+    return aggregates
+
+def _aggregate_chunk(df: pd.DataFrame) -> dict:
+    """Суммы одной порции строк отчета (см. aggregate_report)"""
+    # Определение индексов столбцов (названия уже приведены к COLUMN_MAPPING при чтении)
+    positions = {}
+    for idx, name in enumerate(df.columns):
+        positions.setdefault(name, idx)
+    col_indices = {col_letter: positions[col_name] for col_name, col_letter in COLUMN_MAPPING.items()
+                   if col_name in positions}
+    
+    # Пустые строки (без J и K) не копируются в отдельную таблицу: aggregate_by_keys
+    # отбрасывает их группу, а в aggregate_supplies они не проходят по маске категории
+    return {
+        'key_totals': aggregate_by_keys(df, col_indices),
+        'supplies': aggregate_supplies(df, col_indices)
+    }
+
+def fold_aggregates(aggregates, partial: dict) -> dict:
+    """Добавляет суммы порции partial к накопленным aggregates (None - сумм еще нет)"""
+    return partial if aggregates is None else merge_aggregates([aggregates, partial])
+
+def merge_aggregates(aggregates_list: list) -> dict:
+    """Объединяет суммы нескольких отчетов (aggregate_report) в суммы за весь период"""
+    # Значения J, K, AQ в разных отчетах - разные наборы категорий (или пустой столбец float64),
+    # сравниваем как строки
+    key_totals = pd.concat([aggregates['key_totals'].astype({name: object for name in KEY_COLUMNS})
+                            for aggregates in aggregates_list], ignore_index=True)
+    supplies = pd.concat([aggregates['supplies'] for aggregates in aggregates_list], ignore_index=True)
+    return {
+        'key_totals': key_totals.groupby(KEY_COLUMNS, dropna=False, sort=False).sum().reset_index(),
+        'supplies': supplies.groupby(['category', 'supply'], dropna=False, sort=False).sum().reset_index()
+    }
+
+def create_supply_rows(supplies: pd.DataFrame, first_row_number: int) -> list:
+    """
+    Создает строки детализации категории по номерам поставок.
+    
+    Строки идут по возрастанию номера поставки, розничная цена строки -
+    кол-во * средняя цена (сумма цен / число непустых цен) - считается целыми столбцами.
+    """
+    supplies = supplies.dropna(subset=['supply']).sort_values('supply')
+    
+    qty = supplies['N'].to_numpy()
+    counts = supplies['O_count'].to_numpy()
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean_price = supplies['O_sum'].to_numpy() / counts
+    retail = np.where(counts == 0, 0, qty * mean_price)
+    
+    return [
         {
-            'name': 'Добровольная компенсация при возврате',
-            'type': 'K',
-            'value': 'Добровольная компенсация при возврате',
-            'has_details': False
+            'level': 1,
+            'name': supply_number,
+            'qty': article_qty,
+            'retail_price': article_retail,
+            'to_seller': to_seller,
+            'retention': 0,
+            'storage': 0,
+            'logistics': 0,
+            'fines': 0,
+            'acceptance': 0,
+            'acquiring': acquiring,
+            'row_number': row_number,
+            'has_children': False
         }
+        for row_number, supply_number, article_qty, article_retail, to_seller, acquiring in zip(
+            range(first_row_number, first_row_number + len(supplies)),
+            _supply_numbers(pd.Index(supplies['supply'])),
+            qty.tolist(),
+            retail.tolist(),
+            supplies['AH'].tolist(),
+            supplies['AC'].tolist()
+        )
     ]
+
+def create_summary_data(df: pd.DataFrame) -> tuple:
+    """Создает структурированные данные для отчета"""
+    return build_report_tables(aggregate_report(df))
+
+def summarize_categories(aggregates: dict) -> dict:
+    """Итоги категорий REPORT_CATEGORIES (и суммы по поставкам для детализации) по суммам отчета"""
+    key_totals = aggregates['key_totals']
+    supplies = aggregates['supplies']
     
     # Сбор данных по категориям (только общие суммы, без детализации)
     category_totals = {}
     
-    for category in categories:
-        if category['type'] == 'J':
-            filtered_data = df_filtered[df_filtered.iloc[:, col_indices['J']] == category['value']]
-        elif category['type'] == 'K':
-            filtered_data = df_filtered[df_filtered.iloc[:, col_indices['K']] == category['value']]
-        elif category['type'] == 'both':  # Новая логика для возврата и продажи
-            filtered_data = df_filtered[
-                (df_filtered.iloc[:, col_indices['J']] == category['value_j']) & 
-                (df_filtered.iloc[:, col_indices['K']] == category['value_k'])
-            ]
-        elif category['type'] == 'direct':
-            filtered_data = df_filtered
-            
-        # Расчет значений для категории
-        if category['name'] in ['Возврат', 'Продажа']:
-            qty = filtered_data.iloc[:, col_indices['N']].sum()
-            retail_price = (filtered_data.iloc[:, col_indices['N']] * filtered_data.iloc[:, col_indices['O']]).sum()
-            to_seller = filtered_data.iloc[:, col_indices['AH']].sum()
-            acquiring = filtered_data.iloc[:, col_indices['AC']].sum()
-            retention = 0
-            storage = 0
-            logistics = 0
-            fines = 0
-            acceptance = 0
-        elif category['name'] == 'Логистика':
-            qty = 0
-            retail_price = 0
-            to_seller = 0
-            acquiring = 0
-            logistics = filtered_data.iloc[:, col_indices['AK']].sum()
-            retention = 0
-            storage = 0
-            fines = 0
-            acceptance = 0
-        elif category['name'] == 'Хранение':
-            qty = 0
-            retail_price = 0
-            to_seller = 0
-            acquiring = 0
-            storage = filtered_data.iloc[:, col_indices['BH']].sum()
-            retention = 0
-            logistics = 0
-            fines = 0
-            acceptance = 0
-        elif category['name'] == 'Удержание':
-            qty = 0
-            retail_price = 0
-            to_seller = 0
-            acquiring = 0
-            retention = filtered_data.iloc[:, col_indices['BI']].sum()
-            storage = 0
-            logistics = 0
-            fines = 0
-            acceptance = 0
-        elif category['name'] == 'Коррекция логистики':
-            qty = 0
-            retail_price = 0
-            to_seller = 0
-            acquiring = 0
-            logistics = filtered_data.iloc[:, col_indices['AK']].sum()
-            retention = 0
-            storage = 0
-            fines = 0
-            acceptance = 0
-        elif category['name'] == 'Штраф':
-            qty = 0
-            retail_price = 0
-            to_seller = 0
-            acquiring = 0
-            fines = filtered_data.iloc[:, col_indices['AO']].sum()
-            retention = 0
-            storage = 0
-            logistics = 0
-            acceptance = 0
-        elif category['name'] == 'Возмещение издержек по перевозке/по складским операциям с товаром':
-            qty = filtered_data.iloc[:, col_indices['N']].sum()
-            retail_price = 0
-            to_seller = 0
-            acquiring = 0
-            logistics = filtered_data.iloc[:, col_indices['BK']].sum()
-            retention = 0
-            storage = 0
-            fines = 0
-            acceptance = 0
-        elif category['name'] in ['Компенсация ущерба', 'Добровольная компенсация при возврате']:
-            qty = filtered_data.iloc[:, col_indices['N']].sum()
-            retail_price = 0
-            to_seller = filtered_data.iloc[:, col_indices['AH']].sum()
-            acquiring = 0
-            retention = 0
-            storage = 0
-            logistics = 0
-            fines = 0
-            acceptance = 0
-        else:
-            qty = 0
-            retail_price = 0
-            to_seller = 0
-            acquiring = 0
-            retention = 0
-            storage = 0
-            logistics = 0
-            fines = 0
-            acceptance = 0
-            
-        category_totals[category['name']] = {
-            'qty': qty,
-            'retail_price': retail_price,
-            'to_seller': to_seller,
-            'retention': retention,
-            'storage': storage,
-            'logistics': logistics,
-            'fines': fines,
-            'acceptance': acceptance,
-            'acquiring': acquiring,
-            'data': filtered_data,  # Сохраняем данные для детализации
-            'raw_data': df_filtered  # Сохраняем все данные для второй таблицы
+    for category in REPORT_CATEGORIES:
+        totals = key_totals[_category_mask(key_totals, category)]
+        measures = category.get('measures', {})
+        category_data = {
+            field: totals[measures[field]].sum() if field in measures else 0
+            for field in SUMMARY_FIELDS
         }
+        
+        # Суммы по номерам поставок нужны только для детализации
+        if category.get('has_details', False):
+            category_data['supplies'] = supplies[(supplies['category'] == category['name']).to_numpy()]
+        category_totals[category['name']] = category_data
+    
+    return category_totals
+
+def build_report_tables(aggregates: dict, stats: dict = None) -> tuple:
+    """
+    Создает данные обеих таблиц отчета из сумм aggregate_report / merge_aggregates.
+    
+    О числе посчитанных категорий сообщается в stats (report_progress).
+    """
+    key_totals = aggregates['key_totals']
+    
+    # Создание структурированных данных для первой таблицы
+    structured_data = []
+    categories = REPORT_CATEGORIES
+    category_totals = summarize_categories(aggregates)
     
     # Добавление строк категорий
     row_counter = 0
-    for category in categories:
+    for number, category in enumerate(categories, 1):
+        report_progress(stats, 'aggregate', categories=number, categories_total=len(categories))
         category_data = category_totals[category['name']]
+        has_children = category.get('has_details', False) and len(category_data['supplies']) > 0
         
         # Добавление основной строки категории
         category_row = {
@@ -285,46 +982,17 @@ def create_summary_data(df: pd.DataFrame) -> tuple:
             'acceptance': category_data['acceptance'],
             'acquiring': category_data['acquiring'],
             'row_number': row_counter,
-            'has_children': category.get('has_details', False) and len(category_data['data']) > 0
+            'has_children': has_children
         }
         
         structured_data.append(category_row)
         row_counter += 1
         
         # Добавление детализации по номерам поставок
-        if category.get('has_details', False) and len(category_data['data']) > 0:
-            grouped = category_data['data'].groupby('Номер поставки').agg({
-                df.columns[col_indices['N']]: 'sum',
-                df.columns[col_indices['O']]: 'mean',
-                df.columns[col_indices['AH']]: 'sum',
-                df.columns[col_indices['AC']]: 'sum'
-            }).reset_index()
-            
-            for _, row in grouped.iterrows():
-                article_qty = row[df.columns[col_indices['N']]]
-                article_retail = article_qty * row[df.columns[col_indices['O']]] if not pd.isna(row[df.columns[col_indices['O']]]) else 0
-                
-                # Номер поставки в числовом формате без десятичных
-                supply_number = int(row['Номер поставки']) if not pd.isna(row['Номер поставки']) else str(row['Номер поставки'])
-                
-                detail_row = {
-                    'level': 1,
-                    'name': supply_number,
-                    'qty': article_qty,
-                    'retail_price': article_retail,
-                    'to_seller': row[df.columns[col_indices['AH']]],
-                    'retention': 0,
-                    'storage': 0,
-                    'logistics': 0,
-                    'fines': 0,
-                    'acceptance': 0,
-                    'acquiring': row[df.columns[col_indices['AC']]],
-                    'row_number': row_counter,
-                    'has_children': False
-                }
-                
-                structured_data.append(detail_row)
-                row_counter += 1
+        if has_children:
+            detail_rows = create_supply_rows(category_data['supplies'], row_counter)
+            structured_data.extend(detail_rows)
+            row_counter += len(detail_rows)
     
     # Расчет общего итога (только по основным категориям)
     total_qty = sum(category_totals[cat['name']]['qty'] for cat in categories if cat['name'] in category_totals)
@@ -357,12 +1025,12 @@ def create_summary_data(df: pd.DataFrame) -> tuple:
     structured_data.append(total_row)
     
     # Создание данных для второй таблицы
-    second_table_data = create_second_table_data(df_filtered, col_indices, category_totals)
+    second_table_data = create_second_table_data(key_totals, category_totals)
     
     return structured_data, second_table_data
 
-def create_second_table_data(df_filtered, col_indices, category_totals):
-    """Создает данные для второй таблицы"""
+def create_second_table_data(key_totals, category_totals):
+    """Создает данные для второй таблицы из сумм aggregate_by_keys и итогов по категориям"""
     
     # Получаем данные для разных категорий
     sales_data = category_totals.get('Продажа', {})
@@ -377,13 +1045,7 @@ def create_second_table_data(df_filtered, col_indices, category_totals):
     vb_compensates_damage = voluntary_compensation_data.get('to_seller', 0)
     
     # Процент с продаж Wildberries (N * O * X/100) - теперь делим на 100
-    sales_rows = df_filtered[
-        (df_filtered.iloc[:, col_indices['J']] == 'Продажа') & 
-        (df_filtered.iloc[:, col_indices['K']] == 'Продажа')
-    ]
-    wb_commission = (sales_rows.iloc[:, col_indices['N']] * 
-                     sales_rows.iloc[:, col_indices['O']] * 
-                     sales_rows.iloc[:, col_indices['X']] / 100).sum()  # Делим на 100
+    wb_commission = key_totals.loc[_key_mask(key_totals, j='Продажа', k='Продажа'), 'NOX'].sum()
     
     # Эквайринг (из продаж)
     acquiring = sales_data.get('acquiring', 0)
@@ -397,8 +1059,8 @@ def create_second_table_data(df_filtered, col_indices, category_totals):
     logistics += category_totals.get('Возмещение издержек по перевозке/по складским операциям с товаром', {}).get('logistics', 0)
     
     # Реклама (строки с "Оказание услуг «ВБ.Продвижение»" в AQ, значение из BI)
-    advertising_rows = df_filtered[df_filtered.iloc[:, col_indices['AQ']] == 'Оказание услуг «ВБ.Продвижение»']
-    advertising = advertising_rows.iloc[:, col_indices['BI']].sum()
+    is_advertising = (key_totals['AQ'] == ADVERTISING_AQ).to_numpy()
+    advertising = key_totals.loc[is_advertising, 'BI'].sum()
     
     # Хранение
     storage = category_totals.get('Хранение', {}).get('storage', 0)
@@ -407,14 +1069,10 @@ def create_second_table_data(df_filtered, col_indices, category_totals):
     fines = category_totals.get('Штраф', {}).get('fines', 0)
     
     # Платная приемка (сумма по всем строкам столбца BJ)
-    paid_acceptance = df_filtered.iloc[:, col_indices['BJ']].sum()
+    paid_acceptance = key_totals['BJ'].sum()
     
     # Удержание (строки с "Удержание" в K, но не "Оказание услуг «ВБ.Продвижение»" в AQ)
-    retention_rows = df_filtered[
-        (df_filtered.iloc[:, col_indices['K']] == 'Удержание') & 
-        (df_filtered.iloc[:, col_indices['AQ']] != 'Оказание услуг «ВБ.Продвижение»')
-    ]
-    retention = retention_rows.iloc[:, col_indices['BI']].sum()
+    retention = key_totals.loc[_key_mask(key_totals, k='Удержание') & ~is_advertising, 'BI'].sum()
     
     # Компенсация ущерба
     compensation_damage = compensation_damage_data.get('to_seller', 0)
@@ -459,206 +1117,588 @@ def create_second_table_data(df_filtered, col_indices, category_totals):
     
     return second_table
 
-def create_excel_with_grouping(structured_data_list, second_table_data_list, output_path: str):
-    """Создает Excel файл с двумя листами и группировкой строк"""
-    
-    wb = Workbook()
+def _report_style(wb: Workbook, styles: dict, number_format: str = 'General', header: bool = False,
+                  total: bool = False, bold: bool = False, indent: int = 0, centered: bool = False) -> str:
+    """
+    Возвращает имя именованного стиля ячейки отчета.
     
-    # Первый лист - основная таблица
-    ws1 = wb.active
-    ws1.title = "Основной отчет"
+    Стиль регистрируется в книге при первом обращении, затем переиспользуется
+    всеми ячейками с тем же оформлением.
+    """
+    key = (number_format, header, total, bold, indent, centered)
+    name = styles.get(key)
+    if name is None:
+        name = f"wb_report_{len(styles) + 1}"
+        style = NamedStyle(name=name, border=REPORT_BORDER, number_format=number_format)
+        if header:
+            style.font = Font(bold=True, color="FFFFFF")
+            style.fill = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
+        elif total:
+            style.font = Font(bold=True)
+            style.fill = PatternFill(start_color="D9D9D9", end_color="D9D9D9", fill_type="solid")
+        elif bold:
+            style.font = Font(bold=True)
+        if centered:
+            style.alignment = Alignment(horizontal="center", vertical="center")
+        elif indent:
+            style.alignment = Alignment(indent=indent)
+        wb.add_named_style(style)
+        styles[key] = name
+    return name
+
+def _styled_cell(ws, value, style: str) -> WriteOnlyCell:
+    """Создает ячейку для потоковой записи с именованным стилем"""
+    cell = WriteOnlyCell(ws, value=value)
+    cell.style = style
+    return cell
+
+def _summary_row_values(item: dict) -> list:
+    """Значения строки первой таблицы в том виде, в котором они пишутся в Excel"""
+    values = [item['name'], format_currency_numeric(item['qty']) if item['name'] != 'Общий итог' else item['qty']]
+    values.extend(format_currency_numeric(item[field]) for field in SUMMARY_FIELDS[1:])
+    return values
+
+def _second_table_row_values(item: dict) -> list:
+    """Значения строки второй таблицы в том виде, в котором они пишутся в Excel"""
+    # Для налогов и себестоимости, а также нулевых сумм - пустые значения
+    if item['name'] in ['Налоги', 'Себестоимость продукта']:
+        return [item['name'], "-   ₽", 0]
+    amount = item['amount'] if item['amount'] != 0 else "-   ₽"
+    return [item['name'], amount, item['percent'] / 100]  # Делим на 100 для правильного отображения
+
+def _column_widths(rows, columns: int) -> list:
+    """Ширина столбцов по самому длинному значению (не более 30 символов)"""
+    max_lengths = [0] * columns
+    for values in rows:
+        for col, value in enumerate(values):
+            if value:
+                length = len(str(value))
+                if length > max_lengths[col]:
+                    max_lengths[col] = length
+    return [min(length + 3, 30) for length in max_lengths]
+
+def _write_summary_sheet(wb: Workbook, styles: dict, structured_data_list, stats: dict = None):
+    """Пишет лист 'Основной отчет' с группировкой строк детализации (о числе записанных строк - в stats)"""
+    ws1 = wb.create_sheet("Основной отчет")
     
     # Заголовки
-    headers = ['Названия строк', 'Кол-во продаж', 'Розничная Цена', 'Сумма к перечислению продавцу', 
-               'Удержание', 'Хранение товара', 'Логистика', 'Штрафы', 'Приемка платная', 'Эквайринг']
-    
-    # Стили
-    header_font = Font(bold=True, color="FFFFFF")
-    header_fill = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
-    total_font = Font(bold=True)
-    total_fill = PatternFill(start_color="D9D9D9", end_color="D9D9D9", fill_type="solid")
-    
-    border = Border(
-        left=Side(style='thin'),
-        right=Side(style='thin'),
-        top=Side(style='thin'),
-        bottom=Side(style='thin')
-    )
+    headers = SUMMARY_HEADERS
     
-    # Добавление заголовков на первый лист
-    for col, header in enumerate(headers, 1):
-        cell = ws1.cell(row=1, column=col, value=header)
-        cell.font = header_font
-        cell.fill = header_fill
-        cell.border = border
-        cell.alignment = Alignment(horizontal="center", vertical="center")
+    # Автоширина колонок и закрепление заголовков задаются до записи строк
+    widths = _column_widths([headers] + [_summary_row_values(item) for item in structured_data_list], len(headers))
+    for col, width in enumerate(widths, 1):
+        ws1.column_dimensions[get_column_letter(col)].width = width
+    ws1.freeze_panes = 'A2'
+    
+    header_style = _report_style(wb, styles, header=True, centered=True)
+    ws1.append([_styled_cell(ws1, header, header_style) for header in headers])
     
     # Добавление данных на первый лист
     for i, item in enumerate(structured_data_list):
         row_num = i + 2  # +2 потому что первая строка - заголовки
+        if i % PROGRESS_ROWS == 0:
+            report_progress(stats, 'render', rows=i, rows_total=len(structured_data_list))
+        values = _summary_row_values(item)
         
-        # Преобразование данных для Excel (числовые значения)
-        qty = format_currency_numeric(item['qty'])
-        retail_price = format_currency_numeric(item['retail_price'])
-        to_seller = format_currency_numeric(item['to_seller'])
-        retention = format_currency_numeric(item['retention'])
-        storage = format_currency_numeric(item['storage'])
-        logistics = format_currency_numeric(item['logistics'])
-        fines = format_currency_numeric(item['fines'])
-        acceptance = format_currency_numeric(item['acceptance'])
-        acquiring = format_currency_numeric(item['acquiring'])
-        
-        # Добавление данных в строку
-        name_cell = ws1.cell(row=row_num, column=1, value=item['name'])
-        qty_cell = ws1.cell(row=row_num, column=2, value=qty if item['name'] != 'Общий итог' else item['qty'])
-        retail_cell = ws1.cell(row=row_num, column=3, value=retail_price)
-        seller_cell = ws1.cell(row=row_num, column=4, value=to_seller)
-        retention_cell = ws1.cell(row=row_num, column=5, value=retention)
-        storage_cell = ws1.cell(row=row_num, column=6, value=storage)
-        logistics_cell = ws1.cell(row=row_num, column=7, value=logistics)
-        fines_cell = ws1.cell(row=row_num, column=8, value=fines)
-        acceptance_cell = ws1.cell(row=row_num, column=9, value=acceptance)
-        acquiring_cell = ws1.cell(row=row_num, column=10, value=acquiring)
-        
-        # Применение стилей
-        cells = [name_cell, qty_cell, retail_cell, seller_cell, retention_cell, 
-                storage_cell, logistics_cell, fines_cell, acceptance_cell, acquiring_cell]
+        if item.get('is_total', False):
+            row_style = {'total': True}
+        elif item['level'] == 1:  # Детализация
+            row_style = {'indent': 2}  # Отступ для вложенных строк
+        else:
+            row_style = {}
         
-        for cell in cells:
-            cell.border = border
-            if item.get('is_total', False):
-                cell.font = total_font
-                cell.fill = total_fill
-            elif item['level'] == 1:  # Детализация
-                cell.alignment = Alignment(indent=2)  # Отступ для вложенных строк
+        # Номер поставки - числовой формат без десятичных, количество и деньги - только для ненулевых значений
+        cells = [_styled_cell(ws1, values[0], _report_style(
+            wb, styles, SUPPLY_FORMAT if item['level'] == 1 else 'General', **row_style))]
+        for col, value in enumerate(values[1:], 2):
+            if value is not None and value != 0:
+                number_format = QTY_FORMAT if col == 2 else MONEY_FORMAT
+            else:
+                number_format = 'General'
+            cells.append(_styled_cell(ws1, value, _report_style(wb, styles, number_format, **row_style)))
         
-        # Установка уровня группировки
-        if item['level'] == 1:  # Детализация (дочерние строки)
+        # Установка уровня группировки: детализация скрыта по умолчанию.
+        # Размеры строки нужны только в момент записи, поэтому сразу удаляются
+        if item['level'] == 1:
             ws1.row_dimensions[row_num].outline_level = 1
-            ws1.row_dimensions[row_num].hidden = True  # Скрыты по умолчанию
-    
-    # Форматирование числовых столбцов на первом листе
-    for row in range(2, ws1.max_row + 1):
-        # Кол-во продаж - числовой формат
-        qty_cell = ws1.cell(row=row, column=2)
-        if qty_cell.value is not None and qty_cell.value != 0:
-            qty_cell.number_format = '#,##0'
-        
-        # Номер поставки - числовой формат без десятичных
-        name_cell = ws1.cell(row=row, column=1)
-        if len(structured_data_list) > row-2 and structured_data_list[row-2]['level'] == 1:  # Только для детализации
-            name_cell.number_format = '0'
-        
-        # Денежные столбцы
-        money_columns = [3, 4, 5, 6, 7, 8, 9, 10]  # Розничная Цена и далее
-        for col in money_columns:
-            cell = ws1.cell(row=row, column=col)
-            if cell.value is not None and cell.value != 0:
-                cell.number_format = '#,##0.00" ₽"'
-    
-    # Автоширина колонок на первом листе
-    for col in range(1, 11):
-        column_letter = get_column_letter(col)
-        max_length = 0
-        for row in range(1, ws1.max_row + 1):
-            cell_value = ws1.cell(row=row, column=col).value
-            if cell_value:
-                max_length = max(max_length, len(str(cell_value)))
-        adjusted_width = min(max_length + 3, 30)
-        ws1.column_dimensions[column_letter].width = adjusted_width
-    
-    # Закрепление заголовков на первом листе
-    ws1.freeze_panes = 'A2'
+            ws1.row_dimensions[row_num].hidden = True
+            ws1.append(cells)
+            del ws1.row_dimensions[row_num]
+        else:
+            ws1.append(cells)
+    report_progress(stats, 'render', rows=len(structured_data_list), rows_total=len(structured_data_list))
+
+def _write_second_table_sheet(wb: Workbook, styles: dict, title: str, second_table_data_list):
+    """Пишет лист с таблицей 'Россия'"""
+    ws2 = wb.create_sheet(title)
     
-    # Второй лист - таблица Россия
-    ws2 = wb.create_sheet("Россия")
+    second_table_rows = [_second_table_row_values(item) for item in second_table_data_list]
+    for col, width in enumerate(_column_widths([["", "", "%"]] + second_table_rows, 3), 1):
+        ws2.column_dimensions[get_column_letter(col)].width = width
     
     # Заголовки для второй таблицы
-    ws2.cell(row=1, column=1, value="").font = header_font
-    ws2.cell(row=1, column=1, value="").fill = header_fill
-    ws2.cell(row=1, column=1, value="").border = border
-    ws2.cell(row=1, column=2, value="").font = header_font
-    ws2.cell(row=1, column=2, value="").fill = header_fill
-    ws2.cell(row=1, column=2, value="").border = border
-    ws2.cell(row=1, column=3, value="%").font = header_font
-    ws2.cell(row=1, column=3, value="%").fill = header_fill
-    ws2.cell(row=1, column=3, value="%").border = border
+    header_style = _report_style(wb, styles, header=True)
+    ws2.append([_styled_cell(ws2, value, header_style) for value in ["", "", "%"]])
     
     # Добавление данных на второй лист
-    for i, item in enumerate(second_table_data_list):
-        row_num = i + 2
-        name_cell = ws2.cell(row=row_num, column=1, value=item['name'])
-        amount_cell = ws2.cell(row=row_num, column=2, value=item['amount'])
-        percent_cell = ws2.cell(row=row_num, column=3, value=item['percent']/100)  # Делим на 100 для правильного отображения
-        
-        # Применение стилей
-        name_cell.border = border
-        amount_cell.border = border
-        percent_cell.border = border
-        
-        if item['name'] == 'Итого:':
-            name_cell.font = Font(bold=True)
-            amount_cell.font = Font(bold=True)
-            percent_cell.font = Font(bold=True)
-        
-        # Форматирование
-        # Для налогов и себестоимости - пустые значения
-        if item['name'] in ['Налоги', 'Себестоимость продукта']:
-            amount_cell.value = "-   ₽"
-            percent_cell.value = 0
-            percent_cell.number_format = '0%'
-        elif item['amount'] != 0:
-            amount_cell.number_format = '#,##0.00" ₽"'
-        else:
-            amount_cell.value = "-   ₽"
-            
-        if item['percent'] != 0:
-            percent_cell.number_format = '0.00%'  # Будет отображаться правильно
-        else:
-            percent_cell.number_format = '0%'
-    
-    # Автоширина колонок на втором листе
-    for col in range(1, 4):
-        column_letter = get_column_letter(col)
-        max_length = 0
-        for row in range(1, ws2.max_row + 1):
-            cell_value = ws2.cell(row=row, column=col).value
-            if cell_value:
-                if isinstance(cell_value, str):
-                    max_length = max(max_length, len(cell_value))
-                else:
-                    max_length = max(max_length, len(str(cell_value)))
-        adjusted_width = min(max_length + 3, 30)
-        ws2.column_dimensions[column_letter].width = adjusted_width
+    for item, (name, amount, percent) in zip(second_table_data_list, second_table_rows):
+        bold = item['name'] == 'Итого:'
+        amount_format = MONEY_FORMAT if not isinstance(amount, str) else 'General'
+        percent_format = '0.00%' if item['percent'] != 0 else '0%'  # Будет отображаться правильно
+        ws2.append([
+            _styled_cell(ws2, name, _report_style(wb, styles, bold=bold)),
+            _styled_cell(ws2, amount, _report_style(wb, styles, amount_format, bold=bold)),
+            _styled_cell(ws2, percent, _report_style(wb, styles, percent_format, bold=bold))
+        ])
+
+def _period_sheet_title(label: str, used: set) -> str:
+    """Уникальное имя листа 'Россия' для периода (не длиннее 31 символа, без запрещенных знаков)"""
+    label = ''.join('_' if char in '[]:*?/\\' else char for char in str(label))
+    base = f"Россия {label}"[:31]
+    title, number = base, 1
+    while title in used:
+        number += 1
+        suffix = f" ({number})"
+        title = base[:31 - len(suffix)] + suffix
+    used.add(title)
+    return title
+
+def create_excel_with_grouping(structured_data_list, second_table_data_list, output_path: str,
+                               stats: dict = None):
+    """
+    Создает Excel файл с двумя листами и группировкой строк.
+    
+    Книга пишется в потоковом режиме (write_only): ширина столбцов считается
+    заранее по данным, строки сразу уходят в файл, оформление задается общими
+    именованными стилями. О числе записанных строк сообщается в stats (report_progress).
+    """
+    
+    wb = Workbook(write_only=True)
+    styles = {}
+    
+    # Первый лист - основная таблица
+    _write_summary_sheet(wb, styles, structured_data_list, stats)
+    
+    # Второй лист - таблица Россия
+    _write_second_table_sheet(wb, styles, "Россия", second_table_data_list)
+    
+    wb.save(output_path)
+    print(f"Файл сохранен: {output_path}")
+
+def create_consolidated_excel(structured_data_list, second_table_data_list, periods, output_path: str):
+    """
+    Создает сводный Excel файл по нескольким отчетам.
+    
+    Args:
+        structured_data_list: Первая таблица по всем отчетам вместе (build_report_tables)
+        second_table_data_list: Вторая таблица по всем отчетам вместе
+        periods: Список пар (название периода, вторая таблица периода)
+        output_path (str): Путь для сохранения результата
+    """
+    wb = Workbook(write_only=True)
+    styles = {}
+    
+    _write_summary_sheet(wb, styles, structured_data_list)
+    _write_second_table_sheet(wb, styles, "Россия", second_table_data_list)
+    
+    # Таблица Россия для каждого периода отдельно
+    used_titles = {"Основной отчет", "Россия"}
+    for label, period_table in periods:
+        _write_second_table_sheet(wb, styles, _period_sheet_title(label, used_titles), period_table)
+    
+    wb.save(output_path)
+    print(f"Файл сохранен: {output_path}")
+
+def _period_deltas(values: np.ndarray) -> tuple:
+    """
+    Изменения значений (строки x периоды) относительно предыдущего периода: абсолютные и в процентах.
+    
+    У первого периода изменений нет, у нулевого предыдущего значения нет изменения в процентах (NaN).
+    """
+    deltas = np.full(values.shape, np.nan)
+    deltas[:, 1:] = values[:, 1:] - values[:, :-1]
+    previous = np.full(values.shape, np.nan)
+    previous[:, 1:] = np.abs(values[:, :-1])
+    with np.errstate(invalid='ignore', divide='ignore'):
+        percents = np.where(previous > 0, deltas / previous * 100, np.nan)
+    return deltas, percents
+
+def _nullable(values: np.ndarray) -> list:
+    """Значения строки для JSON: NaN - None"""
+    return [None if value != value else value for value in values.tolist()]
+
+def _comparison_supplies(periods) -> list:
+    """Движение по номерам поставок категорий COMPARISON_CATEGORIES по периодам (см. compare_periods)"""
+    supplies = pd.concat([aggregates['supplies'].assign(period=position)
+                          for position, (_, aggregates) in enumerate(periods)], ignore_index=True)
+    keep = supplies['category'].isin(COMPARISON_CATEGORIES).to_numpy() & supplies['supply'].notna().to_numpy()
+    if not keep.any():
+        return []
+    supplies = supplies[keep].astype({'category': pd.CategoricalDtype(COMPARISON_CATEGORIES, ordered=True),
+                                      'supply': np.float64})
+    
+    # Сводная таблица: строки - (категория, поставка), столбцы - суммы по периодам
+    letters = list(COMPARISON_SUPPLY_MEASURES.values())
+    pivot = (supplies.groupby(['category', 'supply', 'period'], observed=True)[letters].sum()
+             .unstack('period', fill_value=0)
+             .reindex(columns=pd.MultiIndex.from_product([letters, range(len(periods))]), fill_value=0))
+    
+    columns = {}
+    for field, letter in COMPARISON_SUPPLY_MEASURES.items():
+        values = pivot[letter].to_numpy(dtype=np.float64)
+        deltas, percents = _period_deltas(values)
+        columns[field] = values.tolist()
+        columns[f'{field}_deltas'] = [_nullable(row) for row in deltas]
+        columns[f'{field}_delta_percents'] = [_nullable(row) for row in percents]
+    
+    categories = pivot.index.get_level_values('category').astype(str).tolist()
+    supply_numbers = _supply_numbers(pivot.index.get_level_values('supply'))
+    return [
+        dict({'category': category, 'supply': supply}, **{field: values[row] for field, values in columns.items()})
+        for row, (category, supply) in enumerate(zip(categories, supply_numbers))
+    ]
+
+def compare_periods(periods) -> dict:
+    """
+    Сравнение периодов по суммам отчетов.
+    
+    periods - пары (название периода, суммы aggregate_report / merge_aggregates) в порядке сравнения.
+    Для каждого периода считается вторая таблица, строки сводятся в массив строки x периоды,
+    изменения относительно предыдущего периода (абсолютные и в процентах) считаются целыми
+    массивами. Так же сравниваются суммы по номерам поставок 'Продажа' и 'Возврат'.
+    
+    Возвращает {'periods': названия периодов,
+    'second_table': строки {'name', 'amounts', 'percents', 'deltas', 'delta_percents'},
+    'supplies': строки {'category', 'supply', 'qty', 'to_seller' и их '_deltas', '_delta_percents'}};
+    значения - списки по периодам, изменений для первого периода нет (None).
+    """
+    tables = [create_second_table_data(aggregates['key_totals'], summarize_categories(aggregates))
+              for _, aggregates in periods]
+    amounts = np.array([[item['amount'] for item in table] for table in tables], dtype=np.float64).T
+    percents = np.array([[item['percent'] for item in table] for table in tables], dtype=np.float64).T
+    deltas, delta_percents = _period_deltas(amounts)
+    
+    second_table = [
+        {
+            'name': item['name'],
+            'amounts': amounts[row].tolist(),
+            'percents': percents[row].tolist(),
+            'deltas': _nullable(deltas[row]),
+            'delta_percents': _nullable(delta_percents[row])
+        }
+        for row, item in enumerate(tables[0])
+    ]
+    return {
+        'periods': [str(label) for label, _ in periods],
+        'second_table': second_table,
+        'supplies': _comparison_supplies(periods)
+    }
+
+# Столбцы листов сравнения: (поле значений, поле изменений, поле изменений в процентах или None,
+# формат, заголовок значения, заголовок изменения, заголовок изменения в процентах)
+SECOND_TABLE_COMPARISON = [
+    ('amounts', 'deltas', 'delta_percents', MONEY_FORMAT, 'Сумма', 'Изменение', 'Изменение, %')
+]
+SUPPLY_COMPARISON = [
+    ('qty', 'qty_deltas', None, QTY_FORMAT, 'Кол-во', 'Изменение кол-ва', None),
+    ('to_seller', 'to_seller_deltas', 'to_seller_delta_percents', MONEY_FORMAT,
+     'К перечислению', 'Изменение к перечислению', 'Изменение к перечислению, %')
+]
+
+def _comparison_headers(periods, fields) -> list:
+    """Заголовки столбцов периодов: показатели периода, для всех периодов кроме первого - и их изменения"""
+    headers = []
+    for position, label in enumerate(periods):
+        headers.extend(f"{field[4]} {label}" for field in fields)
+        if position:
+            for _, _, percent_field, _, _, delta_header, percent_header in fields:
+                headers.append(delta_header)
+                if percent_field:
+                    headers.append(percent_header)
+    return headers
+
+def _comparison_cells(item: dict, fields) -> list:
+    """Значения строки сравнения в порядке _comparison_headers: пары (значение, формат ячейки)"""
+    def money(value, number_format):
+        # Нулевые суммы - прочерком, как во второй таблице
+        if value is None:
+            return None, 'General'
+        if value == 0 and number_format == MONEY_FORMAT:
+            return "-   ₽", 'General'
+        return value, number_format
+    
+    cells = []
+    for position in range(len(item[fields[0][0]])):
+        cells.extend(money(item[field[0]][position], field[3]) for field in fields)
+        if position:
+            for _, delta_field, percent_field, number_format, _, _, _ in fields:
+                cells.append(money(item[delta_field][position], number_format))
+                if percent_field:
+                    percent = item[percent_field][position]
+                    cells.append((percent / 100 if percent is not None else None, PERCENT_FORMAT))
+    return cells
+
+def _write_comparison_sheet(wb: Workbook, styles: dict, title: str, headers: list, rows, frozen_columns: int):
+    """Пишет лист сравнения: rows - пары (ячейки строки - пары (значение, формат), выделять ли строку)"""
+    ws = wb.create_sheet(title)
+    rows = list(rows)
+    widths = _column_widths([headers] + [[value for value, _ in cells] for cells, _ in rows], len(headers))
+    for col, width in enumerate(widths, 1):
+        ws.column_dimensions[get_column_letter(col)].width = width
+    ws.freeze_panes = f"{get_column_letter(frozen_columns + 1)}2"
+    
+    header_style = _report_style(wb, styles, header=True, centered=True)
+    ws.append([_styled_cell(ws, header, header_style) for header in headers])
+    for cells, bold in rows:
+        ws.append([_styled_cell(ws, value, _report_style(wb, styles, number_format, bold=bold))
+                   for value, number_format in cells])
+
+def create_comparison_excel(comparison: dict, output_path: str):
+    """
+    Создает Excel файл сравнения периодов (compare_periods).
+    
+    Лист 'Сравнение' - статьи второй таблицы по периодам с изменениями относительно
+    предыдущего периода, лист 'Поставки' - количество и сумма к перечислению по номерам
+    поставок 'Продажа' и 'Возврат'.
+    """
+    wb = Workbook(write_only=True)
+    styles = {}
+    periods = comparison['periods']
+    
+    _write_comparison_sheet(
+        wb, styles, "Сравнение",
+        [SECOND_TABLE_HEADERS[0]] + _comparison_headers(periods, SECOND_TABLE_COMPARISON),
+        (([(item['name'], 'General')] + _comparison_cells(item, SECOND_TABLE_COMPARISON), item['name'] == 'Итого:')
+         for item in comparison['second_table']),
+        frozen_columns=1
+    )
+    _write_comparison_sheet(
+        wb, styles, "Поставки",
+        ['Категория', 'Номер поставки'] + _comparison_headers(periods, SUPPLY_COMPARISON),
+        (([(item['category'], 'General'), (item['supply'], SUPPLY_FORMAT)]
+          + _comparison_cells(item, SUPPLY_COMPARISON), False)
+         for item in comparison['supplies']),
+        frozen_columns=2
+    )
     
     wb.save(output_path)
     print(f"Файл сохранен: {output_path}")
 
-def process_wb_report_file(file_path: str, output_path: str = "результат_с_группировкой.xlsx"):
+def iter_report_rows(file_path, file_format: str = None, chunk_rows: int = None):
+    """
+    Строки отчета, по которым считаются таблицы (есть J или K), порциями по chunk_rows строк.
+    
+    Порции - DataFrame со столбцами COLUMN_MAPPING в порядке файла. CSV и xlsx читаются
+    порциями (iter_csv_chunks, iter_xlsx_chunks): память зависит от размера порции, а не файла.
+    Без размера порции (CHUNK_ROWS=0) файл читается целиком.
+    Отдается хотя бы одна порция, в том числе пустая.
+    """
+    chunk_rows = chunk_rows or CHUNK_ROWS or None
+    file_format = file_format or report_format(file_path)
+    if file_format == 'csv' and chunk_rows:
+        chunks = iter_csv_chunks(file_path, chunk_rows)
+    elif file_format == 'xlsx' and chunk_rows:
+        chunks = iter_xlsx_chunks(file_path, chunk_rows)
+    else:
+        df = read_wb_report(file_path, file_format=file_format)
+        step = chunk_rows or max(len(df), 1)
+        chunks = (df.iloc[start:start + step] for start in range(0, max(len(df), 1), step))
+    
+    doc_type, reason = [name for name, letter in COLUMN_MAPPING.items() if letter in ('J', 'K')]
+    for chunk in chunks:
+        keep = (chunk[doc_type].notna() | chunk[reason].notna()).to_numpy()
+        yield chunk if keep.all() else chunk[keep]
+
+def summary_table_frame(structured_data_list) -> pd.DataFrame:
+    """
+    Первая таблица (build_report_tables) для выгрузки: значения без округления,
+    уровень строки (0 - категория или итог, 1 - номер поставки) и названия строк текстом.
+    """
+    frame = {
+        SUMMARY_HEADERS[0]: [str(item['name']) for item in structured_data_list],
+        'Уровень': np.array([item['level'] for item in structured_data_list], dtype=np.int64)
+    }
+    for header, field in zip(SUMMARY_HEADERS[1:], SUMMARY_FIELDS):
+        frame[header] = np.array([item[field] for item in structured_data_list], dtype=np.float64)
+    return pd.DataFrame(frame)
+
+def second_table_frame(second_table_data_list) -> pd.DataFrame:
+    """Вторая таблица (build_report_tables) для выгрузки; проценты - от 0 до 100, как в расчете"""
+    name, amount, percent = SECOND_TABLE_HEADERS
+    return pd.DataFrame({
+        name: [item['name'] for item in second_table_data_list],
+        amount: np.array([item['amount'] for item in second_table_data_list], dtype=np.float64),
+        percent: np.array([item['percent'] for item in second_table_data_list], dtype=np.float64)
+    })
+
+def _read_report(file_path, file_format: str = None, stats: dict = None) -> pd.DataFrame:
+    """read_wb_report с записью длительности разбора и числа строк в stats"""
+    with stage_timer(stats, 'parse'):
+        df = read_wb_report(file_path, file_format=file_format, stats=stats)
+    if stats is not None:
+        stats['rows'] = len(df)
+    return df
+
+def aggregate_csv_chunks(file_path, chunk_rows: int = None, stats: dict = None) -> dict:
+    """
+    Сворачивает csv-отчет в суммы (как aggregate_report), читая его порциями по chunk_rows строк.
+    
+    Суммы каждой порции сразу объединяются с накопленными (merge_aggregates), поэтому
+    в памяти одновременно находятся только одна порция и суммы - их размер зависит от
+    числа сочетаний J, K, AQ и номеров поставок, а не от числа строк отчета.
+    """
+    rows_total = _expected_rows(stats, file_path, 'csv')
+    chunks = iter_csv_chunks(file_path, chunk_rows or CHUNK_ROWS)
+    aggregates = None
+    rows = 0
+    while True:
+        with stage_timer(stats, 'parse'):
+            chunk = next(chunks, None)
+        if chunk is None:
+            break
+        rows += len(chunk)
+        report_progress(stats, 'parse', rows=rows, rows_total=rows_total)
+        with stage_timer(stats, 'aggregate'):
+            aggregates = fold_aggregates(aggregates, _aggregate_chunk(chunk))
+        del chunk
+    if stats is not None:
+        stats['rows'] = rows
+    return aggregates
+
+def aggregate_csv_range(file_path, header_line: bytes, start: int, end: int, chunk_rows: int = None,
+                        stats: dict = None) -> list:
+    """
+    Суммы порций части CSV-файла (csv_partitions) - список в порядке порций, без объединения.
+    
+    Части обрабатываются в разных процессах; чтобы итог совпал с обработкой файла целиком,
+    суммы порций объединяются вызывающим по порядку (fold_aggregates).
+    """
+    source = io.BufferedReader(_PrefixedStream(header_line, _FileRange(file_path, start, end)))
+    partials = []
+    rows = 0
+    with source:
+        chunks = iter_csv_chunks(source, chunk_rows or CHUNK_ROWS)
+        while True:
+            with stage_timer(stats, 'parse'):
+                chunk = next(chunks, None)
+            if chunk is None:
+                break
+            rows += len(chunk)
+            report_progress(stats, 'parse', rows=rows)
+            with stage_timer(stats, 'aggregate'):
+                partials.append(_aggregate_chunk(chunk))
+            del chunk
+    if stats is not None:
+        stats['rows'] = rows
+    return partials
+
+def aggregate_csv_parallel(file_path, workers: int = None, chunk_rows: int = None) -> dict:
+    """
+    Суммы CSV-отчета, части которого разбираются одновременно в workers процессах.
+    
+    Результат тот же, что у aggregate_csv_chunks (и aggregate_report) с тем же chunk_rows.
+    """
+    from concurrent.futures import ProcessPoolExecutor
+    
+    workers = workers or os.cpu_count() or 1
+    header_line, ranges = csv_partitions(file_path, workers, chunk_rows)
+    aggregates = None
+    with ProcessPoolExecutor(max_workers=min(workers, len(ranges))) as executor:
+        futures = [executor.submit(aggregate_csv_range, file_path, header_line, start, end, chunk_rows)
+                   for start, end in ranges]
+        for future in futures:
+            for partial in future.result():
+                aggregates = fold_aggregates(aggregates, partial)
+    return aggregates
+
+def _aggregate_file(file_path, file_format: str = None, stats: dict = None) -> dict:
+    """Суммы отчета: CSV читается порциями (CHUNK_ROWS), остальные форматы - целиком"""
+    file_format = file_format or report_format(file_path)
+    if file_format == 'csv' and CHUNK_ROWS > 0:
+        return aggregate_csv_chunks(file_path, CHUNK_ROWS, stats)
+    df = _read_report(file_path, file_format, stats)
+    with stage_timer(stats, 'aggregate'):
+        return aggregate_report(df)
+
+def aggregate_report_file(file_path, file_format: str = None, stats: dict = None) -> dict:
+    """
+    Читает отчет и возвращает его суммы (aggregate_report).
+    
+    Результат небольшой и сериализуемый, поэтому отчеты можно разбирать
+    параллельно в отдельных процессах и затем объединять merge_aggregates.
+    """
+    return _aggregate_file(file_path, file_format, stats)
+
+def summarize_report_file(file_path, file_format: str = None, stats: dict = None) -> tuple:
+    """Читает отчет и возвращает данные обеих таблиц без построения Excel-файла"""
+    aggregates = _aggregate_file(file_path, file_format, stats)
+    with stage_timer(stats, 'aggregate'):
+        return build_report_tables(aggregates, stats)
+
+def render_report_file(structured_data_list, second_table_data_list, output_path: str, stats: dict = None):
+    """create_excel_with_grouping с записью длительности построения файла в stats"""
+    with stage_timer(stats, 'render'):
+        create_excel_with_grouping(structured_data_list, second_table_data_list, output_path, stats)
+
+def process_wb_report_file(file_path, output_path: str = "результат_с_группировкой.xlsx", file_format: str = None,
+                           stats: dict = None):
     """
     Основная функция для обработки отчета Wildberries с группировкой
     
     Args:
-        file_path (str): Путь к файлу отчета (.xlsx или .csv)
+        file_path: Путь к файлу отчета (.xlsx или .csv) или файловый объект
         output_path (str): Путь для сохранения результата с группировкой
+        file_format (str): 'xlsx' или 'csv', если формат нельзя определить по имени файла
+        stats (dict): Если передан - в него записываются число строк и длительность
+            этапов (parse_seconds, aggregate_seconds, render_seconds)
     """
-    # Чтение файла
-    df = read_wb_report(file_path)
+    # Чтение файла и свертка в суммы (CSV - порциями)
+    aggregates = _aggregate_file(file_path, file_format, stats)
     
     # Создание структурированных данных
-    structured_data, second_table_data = create_summary_data(df)
+    with stage_timer(stats, 'aggregate'):
+        structured_data, second_table_data = build_report_tables(aggregates, stats)
     
     # Создание Excel файла с группировкой
-    create_excel_with_grouping(structured_data, second_table_data, output_path)
+    render_report_file(structured_data, second_table_data, output_path, stats)
     
     return structured_data, second_table_data
 
+def main(argv=None):
+    """
+    Обработка отчета из командной строки:
+        python processor.py Отчёт.xlsx -o результат.xlsx
+        python processor.py Отчёт.xlsx --profile профили/
+        python processor.py Отчёт.csv --workers 0
+    С --profile обработка выполняется под cProfile и tracemalloc, артефакты профиля
+    сохраняются в указанный каталог (profiling.profile_call).
+    """
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Обработка отчета о реализации Wildberries")
+    parser.add_argument('file_path', nargs='?', default="Отчёт.xlsx", help="Файл отчета (.xlsx или .csv)")
+    parser.add_argument('-o', '--output', default="результат_с_группировкой.xlsx", help="Файл результата")
+    parser.add_argument('--profile', metavar='DIR', help="Профилировать обработку и сохранить профиль в DIR")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="Разбирать CSV по частям в нескольких процессах (0 - по числу ядер)")
+    args = parser.parse_args(argv)
+
+    if args.workers != 1 and report_format(args.file_path) == 'csv':
+        aggregates = aggregate_csv_parallel(args.file_path, args.workers or None)
+        render_report_file(*build_report_tables(aggregates), args.output)
+    elif args.profile:
+        import profiling
+
+        os.makedirs(args.profile, exist_ok=True)
+        profile_id = profiling.new_profile_id()
+        profiling.profile_call(process_wb_report_file, args.profile, profile_id, args.file_path, args.output,
+                               stats={})
+        print(f"Профиль сохранен: {profiling.profile_path(args.profile, profile_id, profiling.REPORT_SUFFIX)}")
+    else:
+        process_wb_report_file(args.file_path, args.output)
+
+    print("Обработка завершена! Откройте Excel файл и используйте функцию группировкой для сворачивания/разворачивания строк.")
+
 # Пример использования:
 if __name__ == "__main__":
-    # Укажите путь к вашему файлу
-    file_path = "Отчёт.xlsx"  # или .csv
-    
-    # Обработка файла
-    result1, result2 = process_wb_report_file(file_path, "результат_с_группировкой.xlsx")
-    
-    print("Обработка завершена! Откройте Excel файл и используйте функцию группировкой для сворачивания/разворачивания строк.")
+    main()
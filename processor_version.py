@@ -0,0 +1,6 @@
+# backend/processor_version.py
+"""Версия алгоритма обработки - отдельно от processor, чтобы ее можно было узнать без загрузки pandas"""
+
+# Версия алгоритма обработки: входит в ключ кэша результатов,
+# увеличивать при любом изменении содержимого итогового отчета
+PROCESSOR_VERSION = '3'
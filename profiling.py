@@ -0,0 +1,150 @@
+# backend/profiling.py
+"""
+Профилирование одной обработки отчета: cProfile и топ выделений памяти tracemalloc.
+
+Включается только для отдельного запуска (profile_call) - остальные обработки
+выполняются без профилировщика и трассировки памяти.
+Артефакты профиля сохраняются рядом с результатом:
+    profile_<id>.prof - статистика cProfile (pstats, открывается snakeviz/pstats)
+    profile_<id>.txt  - текстовый отчет: самые долгие функции и места выделения памяти
+"""
+import io
+import os
+import time
+import uuid
+import pstats
+import cProfile
+import tracemalloc
+
+# Имена файлов профилей в каталоге результатов
+PROFILE_PREFIX = 'profile_'
+PSTATS_SUFFIX = '.prof'
+REPORT_SUFFIX = '.txt'
+
+# Сколько функций и мест выделения памяти попадает в текстовый отчет
+TOP_FUNCTIONS = 40
+TOP_ALLOCATIONS = 25
+# Глубина стека, сохраняемая tracemalloc для каждого выделения
+TRACEMALLOC_FRAMES = 1
+
+
+def new_profile_id() -> str:
+    return uuid.uuid4().hex
+
+
+def is_profile_id(value: str) -> bool:
+    """Идентификатор профиля - 32 шестнадцатеричных символа (new_profile_id)"""
+    return len(value) == 32 and all(char in '0123456789abcdef' for char in value)
+
+
+def profile_path(directory: str, profile_id: str, suffix: str) -> str:
+    return os.path.join(directory, f"{PROFILE_PREFIX}{profile_id}{suffix}")
+
+
+class ProfileStats(dict):
+    """
+    Словарь stats обработки, который в конце каждого этапа (processor.stage_timer)
+    сохраняет снимок tracemalloc, если памяти занято больше, чем в прошлых снимках.
+
+    К концу обработки данные отчета уже освобождены - снимок на самом тяжелом этапе
+    показывает, где выделена память, пока она занята.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.snapshot = None
+        self.snapshot_stage = None
+        self.snapshot_bytes = -1
+
+    def stage_finished(self, stage: str):
+        current, _ = tracemalloc.get_traced_memory()
+        if current > self.snapshot_bytes:
+            self.snapshot = tracemalloc.take_snapshot()
+            self.snapshot_stage = stage
+            self.snapshot_bytes = current
+
+
+def profile_call(func, directory: str, profile_id: str, *args, top: int = TOP_ALLOCATIONS, **kwargs):
+    """
+    Выполняет func(*args, **kwargs) под cProfile и tracemalloc и возвращает ее результат.
+
+    Артефакты записываются в directory, в том числе если func завершилась ошибкой.
+    Функция модульного уровня, поэтому ее можно выполнить в пуле процессов.
+    Переданный словарь stats заполняется как при обычной обработке.
+    """
+    stats = kwargs.get('stats')
+    profile_stats = kwargs['stats'] = ProfileStats(stats or {})
+    profiler = cProfile.Profile()
+    tracemalloc.start(TRACEMALLOC_FRAMES)
+    started = time.perf_counter()
+    error = None
+    try:
+        profiler.enable()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            profiler.disable()
+    except Exception as e:
+        error = e
+        raise
+    finally:
+        elapsed = time.perf_counter() - started
+        _, peak = tracemalloc.get_traced_memory()
+        snapshot, snapshot_stage = profile_stats.snapshot, profile_stats.snapshot_stage
+        if snapshot is None:
+            snapshot, snapshot_stage = tracemalloc.take_snapshot(), 'end'
+        tracemalloc.stop()
+        if stats is not None:
+            stats.update(profile_stats)
+        write_profile(directory, profile_id, profiler, snapshot, {
+            'function': f"{func.__module__}.{func.__qualname__}",
+            'elapsed_seconds': elapsed,
+            'traced_peak_bytes': peak,
+            'snapshot_stage': snapshot_stage,
+            'stats': dict(profile_stats),
+            'error': repr(error) if error is not None else None
+        }, top)
+
+
+def write_profile(directory: str, profile_id: str, profiler: cProfile.Profile, snapshot, summary: dict,
+                  top: int = TOP_ALLOCATIONS):
+    """Сохраняет статистику cProfile и текстовый отчет профиля"""
+    profiler.dump_stats(profile_path(directory, profile_id, PSTATS_SUFFIX))
+
+    report = io.StringIO()
+    report.write(f"Профиль {profile_id}: {summary['function']}\n")
+    report.write(f"Время выполнения: {summary['elapsed_seconds']:.3f} с "
+                 f"(под профилировщиком, без него быстрее)\n")
+    report.write(f"Пик памяти, отслеженной tracemalloc: {summary['traced_peak_bytes'] / 2 ** 20:.1f} МБ\n")
+    if summary.get('stats'):
+        report.write(f"Этапы: {summary['stats']}\n")
+    if summary.get('error'):
+        report.write(f"Ошибка: {summary['error']}\n")
+
+    report.write(f"\n=== Функции по суммарному времени (топ {TOP_FUNCTIONS}) ===\n")
+    stats = pstats.Stats(profiler, stream=report)
+    stats.strip_dirs().sort_stats(pstats.SortKey.CUMULATIVE).print_stats(TOP_FUNCTIONS)
+
+    report.write(f"\n=== Занятая память по строкам кода в конце этапа {summary['snapshot_stage']} (топ {top}) ===\n")
+    for statistic in snapshot.statistics('lineno')[:top]:
+        report.write(f"{statistic}\n")
+
+    temp_path = profile_path(directory, profile_id, REPORT_SUFFIX + '.tmp')
+    with open(temp_path, 'w', encoding='utf-8') as target:
+        target.write(report.getvalue())
+    os.replace(temp_path, profile_path(directory, profile_id, REPORT_SUFFIX))
+
+
+def remove_expired(directory: str, ttl_seconds: float) -> int:
+    """Удаляет файлы профилей старше ttl_seconds; возвращает число удаленных файлов"""
+    now = time.time()
+    removed = 0
+    with os.scandir(directory) as scan:
+        for entry in scan:
+            if entry.name.startswith(PROFILE_PREFIX) and now - entry.stat().st_mtime > ttl_seconds:
+                try:
+                    os.remove(entry.path)
+                    removed += 1
+                except OSError:
+                    pass
+    return removed
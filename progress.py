@@ -0,0 +1,224 @@
+# backend/progress.py
+"""
+Ход обработки отчетов для клиента: обновления по этапам и поток Server-Sent Events.
+
+Обработка получает вместо словаря stats ProgressStats: processor сообщает о ходе этапов
+(processor.report_progress) - сколько строк прочитано, категорий посчитано, строк записано
+в Excel. ProgressStats передает обновление дальше не чаще раза в interval секунд и в конце
+каждого этапа, поэтому сообщения из циклов обработки почти ничего не стоят.
+В пуле процессов обновления пересылаются по каналу рабочего процесса (process_pool).
+
+ProgressBoard хранит последнее состояние обработок по идентификатору и отдает его изменения
+потоком событий (events). Состояние хранится в памяти процесса: события обработки видны
+только в том процессе gunicorn, который ее выполняет.
+"""
+import json
+import time
+import threading
+from contextlib import contextmanager
+
+# Как часто передавать обновления хода обработки, секунды
+PROGRESS_INTERVAL = 0.25
+# Период комментария keepalive в потоке событий, секунды (прокси не закрывают соединение)
+EVENT_KEEPALIVE = 15
+# Сколько хранить состояние завершенной обработки и ждать появления неизвестной, секунды
+PROGRESS_TTL = 600
+# Как часто проверять состояние обработки в другом источнике (events, status), секунды
+STATUS_POLL_INTERVAL = 1
+
+# Названия событий потока: ход обработки, успешное завершение, ошибка, обработка не найдена
+PROGRESS = 'progress'
+DONE = 'done'
+ERROR = 'error'
+UNKNOWN = 'unknown'
+
+
+class ProgressStats(dict):
+    """
+    Словарь stats обработки, который передает ход этапов в publish(update).
+
+    update - словарь {'stage': этап, ...счетчики этапа}. Счетчики, не переданные из-за
+    interval, передаются в конце этапа (processor.stage_timer), - последнее значение
+    не теряется. При передаче в другой процесс publish не сохраняется - его назначает
+    рабочий процесс пула.
+    """
+
+    def __init__(self, publish=None, interval: float = PROGRESS_INTERVAL, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.publish = publish
+        self.interval = interval
+        self._published_at = 0.0
+        self._pending = {}
+
+    def __getstate__(self):
+        return {'interval': self.interval}
+
+    def __setstate__(self, state):
+        self.publish = None
+        self.interval = state['interval']
+        self._published_at = 0.0
+        self._pending = {}
+
+    def progress(self, stage: str, **counts):
+        """Обновление хода этапа; передается, если с прошлого прошло не меньше interval"""
+        now = time.monotonic()
+        if self.publish is None or now - self._published_at < self.interval:
+            self._pending[stage] = counts
+            return
+        self._published_at = now
+        self._pending.pop(stage, None)
+        self.publish(dict(counts, stage=stage))
+
+    def stage_finished(self, stage: str):
+        if self.publish is None:
+            return
+        while self._pending:
+            pending_stage, counts = self._pending.popitem()
+            self.publish(dict(counts, stage=pending_stage))
+
+
+def format_event(event: str, data) -> str:
+    """Событие Server-Sent Events с данными в JSON"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+class ProgressBoard:
+    """
+    Последнее состояние обработок по идентификатору и ожидание его изменений.
+
+    Состояние - словарь {'stage', 'stages' (счетчики по этапам), 'status', 'updated_at'};
+    status - PROGRESS, пока обработка идет, затем DONE или ERROR (с 'result' или 'error').
+    """
+
+    def __init__(self, ttl: float = PROGRESS_TTL, keepalive: float = EVENT_KEEPALIVE):
+        self.ttl = ttl
+        self.keepalive = keepalive
+        self._condition = threading.Condition()
+        self._entries = {}
+        self._local = threading.local()
+
+    def _expire(self, now: float):
+        expired = [progress_id for progress_id, entry in self._entries.items()
+                   if entry['status'] != PROGRESS and now - entry['updated_at'] > self.ttl]
+        for progress_id in expired:
+            del self._entries[progress_id]
+
+    def _change(self, progress_id: str, update=None, **fields):
+        with self._condition:
+            now = time.time()
+            entry = self._entries.get(progress_id)
+            if entry is None:
+                self._expire(now)
+                entry = self._entries[progress_id] = {'status': PROGRESS, 'stage': None, 'stages': {},
+                                                      'started_at': now, 'version': 0}
+            if update is not None:
+                update = dict(update)
+                stage = entry['stage'] = update.pop('stage')
+                entry['stages'].setdefault(stage, {}).update(update)
+            entry.update(fields)
+            entry['updated_at'] = now
+            entry['version'] += 1
+            self._condition.notify_all()
+
+    def start(self, progress_id: str):
+        """Отмечает начало обработки (состояние прошлой обработки с тем же идентификатором сбрасывается)"""
+        with self._condition:
+            self._entries.pop(progress_id, None)
+        self._change(progress_id)
+
+    def update(self, progress_id: str, update: dict):
+        """Обновление хода обработки (ProgressStats.publish)"""
+        self._change(progress_id, update)
+
+    def finish(self, progress_id: str, result=None, error: str = None):
+        """Завершение обработки: result - данные для клиента, error - текст ошибки"""
+        if error is not None:
+            self._change(progress_id, status=ERROR, error=error)
+        else:
+            self._change(progress_id, status=DONE, result=result)
+
+    def get(self, progress_id: str):
+        """Копия состояния обработки или None"""
+        with self._condition:
+            entry = self._entries.get(progress_id)
+            return json.loads(json.dumps(entry)) if entry is not None else None
+
+    @contextmanager
+    def tracking(self, progress_id: str):
+        """
+        Обработки в блоке (stats) сообщают о ходе в progress_id - в текущем потоке.
+        При ошибке в блоке обработка отмечается завершенной с ошибкой. Данные для клиента
+        передаются в finish внутри блока; если его не вызвали, завершение отмечается без данных.
+        """
+        previous = getattr(self._local, 'progress_id', None)
+        self._local.progress_id = progress_id
+        self.start(progress_id)
+        try:
+            yield
+        except Exception as e:
+            self.finish(progress_id, error=str(e))
+            raise
+        else:
+            with self._condition:
+                running = self._entries.get(progress_id, {}).get('status') == PROGRESS
+            if running:
+                self.finish(progress_id)
+        finally:
+            self._local.progress_id = previous
+
+    def current(self):
+        """Идентификатор обработки, ход которой отслеживается в текущем потоке (tracking), или None"""
+        return getattr(self._local, 'progress_id', None)
+
+    def stats(self) -> dict:
+        """Словарь stats для обработки: ProgressStats, если в потоке отслеживается ход (tracking)"""
+        progress_id = self.current()
+        if progress_id is None:
+            return {}
+        return ProgressStats(lambda update: self.update(progress_id, update))
+
+    def events(self, progress_id: str, status=None, limit: float = None):
+        """
+        Генератор потока Server-Sent Events обработки progress_id.
+
+        Событие PROGRESS отдается при каждом изменении состояния, DONE или ERROR - в конце,
+        после чего поток завершается. Если обработка не появится за ttl секунд, отдается UNKNOWN.
+        status() - состояние обработки из другого источника (очередь задач), если здесь его нет:
+        None, пока обработка не завершена, иначе (DONE или ERROR, данные события).
+        limit - наибольшая длительность потока, секунды.
+        """
+        started = last_sent = time.monotonic()
+        deadline = started + limit if limit else None
+        wait = min(self.keepalive, STATUS_POLL_INTERVAL) if status is not None else self.keepalive
+        version = None
+        while True:
+            with self._condition:
+                self._condition.wait_for(
+                    lambda: self._entries.get(progress_id, {}).get('version') != version, wait)
+                entry = self._entries.get(progress_id)
+                snapshot = json.loads(json.dumps(entry)) if entry is not None else None
+
+            if snapshot is not None and snapshot['version'] != version:
+                version = snapshot['version']
+                status_name = snapshot.pop('status')
+                snapshot.pop('version')
+                last_sent = time.monotonic()
+                yield format_event(status_name, snapshot)
+                if status_name != PROGRESS:
+                    return
+                continue
+
+            if status is not None:
+                finished = status()
+                if finished is not None:
+                    yield format_event(*finished)
+                    return
+            now = time.monotonic()
+            if snapshot is None and status is None and now - started > self.ttl:
+                yield format_event(UNKNOWN, {'error': 'Обработка не найдена'})
+                return
+            if deadline is not None and now > deadline:
+                return
+            if now - last_sent >= self.keepalive:
+                last_sent = now
+                yield ': keepalive\n\n'
@@ -0,0 +1,144 @@
+# backend/report_schema.py
+"""
+Схемы заголовков отчетов Wildberries.
+
+Wildberries время от времени переименовывает столбцы отчета о реализации.
+Здесь собраны известные варианты заголовков (REPORT_LAYOUTS, HEADER_ALIASES),
+по которым первая строка отчета сопоставляется со столбцами COLUMN_MAPPING -
+до разбора остальных строк. Результат сопоставления кэшируется по отпечатку
+заголовка, поэтому отчеты уже встречавшегося вида распознаются одним поиском в словаре.
+Если нужных столбцов в заголовке нет, сразу выбрасывается ReportHeaderError.
+"""
+import hashlib
+import threading
+
+# Столбцы отчета Wildberries, которые используются при расчетах
+COLUMN_MAPPING = {
+    'Тип документа': 'J',
+    'Обоснование для оплаты': 'K',
+    'Кол-во': 'N',
+    'Цена розничная': 'O',
+    'К перечислению Продавцу за реализованный Товар': 'AH',
+    'Удержания': 'BI',
+    'Хранение': 'BH',
+    'Услуги по доставке товара покупателю': 'AK',
+    'Общая сумма штрафов': 'AO',
+    'Эквайринг/Комиссии за организацию платежей': 'AC',
+    'Платная приемка': 'BJ',
+    'Номер поставки': 'B',
+    'Возмещение издержек по перевозке/по складским операциям с товаром': 'BK',
+    'Размер кВВ, %': 'X',
+    'Виды логистики, штрафов и корректировок ВВ': 'AQ'  # Добавлен новый столбец
+}
+
+# Известные виды отчета: столбцы, которые в нем называются не так, как в COLUMN_MAPPING
+REPORT_LAYOUTS = [
+    {
+        'name': 'Отчет о реализации',
+        'renamed': {}
+    },
+    {
+        'name': 'Отчет о реализации (ранние версии)',
+        'renamed': {
+            'Эквайринг/Комиссии за организацию платежей': 'Возмещение расходов по эквайрингу',
+            'Виды логистики, штрафов и корректировок ВВ': 'Виды логистики, штрафов и доплат',
+            'Возмещение издержек по перевозке/по складским операциям с товаром': 'Возмещение издержек по перевозке'
+        }
+    },
+    {
+        'name': 'Отчет о реализации (новые названия)',
+        'renamed': {
+            'Удержания': 'Прочие удержания/выплаты',
+            'Платная приемка': 'Операции на приемке'
+        }
+    }
+]
+
+# Другие встречающиеся названия столбцов (в дополнение к REPORT_LAYOUTS)
+HEADER_ALIASES = {
+    'Кол-во': ['Количество'],
+    'Общая сумма штрафов': ['Штрафы']
+}
+
+# Сколько разных заголовков помнит кэш сопоставлений
+FINGERPRINT_CACHE_SIZE = 256
+
+
+class ReportHeaderError(ValueError):
+    """Файл не похож на отчет Wildberries: нет нужных столбцов или он не читается как таблица"""
+
+
+def normalize_header(name) -> str:
+    """Название столбца без различий в регистре, пробелах и букве ё"""
+    return ' '.join(str(name).split()).casefold().replace('ё', 'е')
+
+
+def header_fingerprint(header) -> str:
+    """Отпечаток заголовка отчета (названия столбцов по порядку)"""
+    digest = hashlib.sha1()
+    for name in header:
+        digest.update(str(name).encode('utf-8', 'surrogatepass') + b'\x1f')
+    return digest.hexdigest()
+
+
+def _names(canonical: str) -> list:
+    """Все известные названия столбца: основное, из видов отчета и HEADER_ALIASES"""
+    names = [canonical]
+    names.extend(layout['renamed'][canonical] for layout in REPORT_LAYOUTS if canonical in layout['renamed'])
+    names.extend(HEADER_ALIASES.get(canonical, []))
+    return names
+
+
+def _match(header, columns) -> tuple:
+    """Сопоставление заголовка со столбцами columns: (вид отчета, {название в файле: название столбца})"""
+    # Повторяющиеся названия: используется первый столбец, как и при разборе
+    positions = {}
+    for name in header:
+        if name is not None:
+            positions.setdefault(normalize_header(name), name)
+
+    for layout in REPORT_LAYOUTS:
+        found = {}
+        for canonical in columns:
+            name = positions.get(normalize_header(layout['renamed'].get(canonical, canonical)))
+            if name is None:
+                break
+            found[name] = canonical
+        else:
+            return layout['name'], found
+
+    # Заголовок не совпал целиком ни с одним видом - ищем каждый столбец по всем названиям
+    found = {}
+    missing = []
+    for canonical in columns:
+        name = next((positions[key] for key in map(normalize_header, _names(canonical)) if key in positions), None)
+        if name is None:
+            missing.append(canonical)
+        else:
+            found[name] = canonical
+    if missing:
+        raise ReportHeaderError(
+            "Файл не похож на отчет о реализации Wildberries: нет столбцов " + ', '.join(f"«{name}»" for name in missing))
+    return 'Отчет о реализации (другие названия столбцов)', found
+
+
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+def resolve_header(header, columns=COLUMN_MAPPING) -> tuple:
+    """
+    Сопоставляет заголовок отчета (первую строку) с нужными столбцами.
+
+    Возвращает (вид отчета, {название в файле: название из columns}).
+    Выбрасывает ReportHeaderError, если каких-то столбцов нет.
+    """
+    key = (header_fingerprint(header), tuple(columns))
+    result = _cache.get(key)
+    if result is None:
+        result = _match(header, columns)
+        with _cache_lock:
+            if len(_cache) >= FINGERPRINT_CACHE_SIZE:
+                _cache.clear()
+            _cache[key] = result
+    return result
@@ -0,0 +1,434 @@
+# backend/result_cache.py
+"""Кэш результатов обработки, адресуемый по содержимому загруженного файла"""
+import io
+import os
+import gzip
+import json
+import stat
+import time
+import shutil
+import hashlib
+import logging
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows - блокировка только внутри процесса
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Префикс и расширение файлов результатов в каталоге кэша
+RESULT_PREFIX = 'результат_'
+RESULT_SUFFIX = '.xlsx'
+# Таблицы результата в JSON - по ним Excel-файл строится при первом скачивании
+TABLES_SUFFIX = '.json'
+# Суммы отчета в JSON - по ним отчет сравнивается с другими периодами без повторного разбора
+AGGREGATES_SUFFIX = '.aggregates.json'
+# Файлы, которые при скачивании стоит отдавать сжатыми (xlsx уже сжат внутри)
+COMPRESSIBLE_SUFFIXES = ('.json', '.txt', '.csv', '.ndjson')
+GZIP_LEVEL = 6
+
+_HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def _json_value(value):
+    """Числа numpy (np.int64, np.bool_) - в обычные значения Python"""
+    if hasattr(value, 'item'):
+        return value.item()
+    raise TypeError(f"Значение типа {type(value).__name__} не сериализуется в JSON")
+
+
+def write_tables(path: str, structured_data: list, second_table_data: list):
+    """Сохраняет обе таблицы отчета в JSON-файл"""
+    with open(path, 'w', encoding='utf-8') as target:
+        json.dump({'structured_data': structured_data, 'second_table_data': second_table_data},
+                  target, ensure_ascii=False, default=_json_value)
+
+
+def write_aggregates(path: str, aggregates: dict):
+    """Сохраняет суммы отчета (processor.aggregate_report) в JSON-файл: столбцы таблиц и их типы"""
+    frames = {
+        name: {
+            'columns': {column: frame[column].tolist() for column in frame.columns},
+            'dtypes': {column: str(dtype) for column, dtype in frame.dtypes.items()}
+        }
+        for name, frame in aggregates.items()
+    }
+    with open(path, 'w', encoding='utf-8') as target:
+        json.dump(frames, target, ensure_ascii=False, default=_json_value)
+
+
+def _file_digest(path: str) -> str:
+    """SHA-256 содержимого файла"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as source:
+        for chunk in iter(lambda: source.read(_HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class HashingStream(io.RawIOBase):
+    """
+    Поток-обертка, считающий ключ кэша по мере чтения данных.
+
+    Позволяет разбирать загрузку прямо из входящего потока и узнать ее ключ
+    после разбора, не сохраняя содержимое целиком.
+    """
+
+    def __init__(self, stream, version: str):
+        self.stream = stream
+        self.digest = hashlib.sha256(version.encode('utf-8') + b'\0')
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        data = self.stream.read(len(buffer))
+        size = len(data)
+        buffer[:size] = data
+        self.digest.update(data)
+        return size
+
+    def key(self) -> str:
+        """Ключ кэша; непрочитанный остаток потока дочитывается"""
+        for chunk in iter(lambda: self.stream.read(_HASH_CHUNK_SIZE), b''):
+            self.digest.update(chunk)
+        return self.digest.hexdigest()
+
+
+class ResultCache:
+    """
+    Кэш результатов в каталоге RESULT_FOLDER.
+
+    Ключ - SHA-256 содержимого загруженного файла вместе с версией обработчика,
+    поэтому повторная загрузка того же отчета сразу возвращает готовый результат.
+    Одновременные загрузки одного файла выполняют обработку один раз (single-flight),
+    в том числе между процессами. Каталог ограничен по размеру и возрасту файлов:
+    время изменения файла обновляется при каждом обращении и используется для LRU/TTL.
+    """
+
+    def __init__(self, directory: str, version: str, max_bytes: int = 1024 * 1024 * 1024,
+                 ttl_seconds: float = 7 * 24 * 3600):
+        """
+        Args:
+            directory (str): Каталог с файлами результатов
+            version (str): Версия обработчика, входит в ключ кэша
+            max_bytes (int): Максимальный суммарный размер файлов результатов
+            ttl_seconds (float): Сколько хранить результат после последнего обращения
+        """
+        self.directory = directory
+        self.version = version
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.lock_directory = os.path.join(directory, '.locks')
+        # Отпечатки содержимого результатов (ETag) и их сжатые копии
+        self.validator_directory = os.path.join(directory, '.etags')
+        self.gzip_directory = os.path.join(directory, '.gzip')
+        for path in (self.lock_directory, self.validator_directory, self.gzip_directory):
+            os.makedirs(path, exist_ok=True)
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._key_locks = {}
+        # Прочитанные отпечатки: имя файла -> ((inode, размер), (отпечаток, время построения))
+        self._validators = {}
+
+    def key_for_file(self, file_obj) -> str:
+        """Ключ кэша для файла (путь или файловый объект) с учетом версии обработчика"""
+        digest = hashlib.sha256(self.version.encode('utf-8') + b'\0')
+        if isinstance(file_obj, (str, os.PathLike)):
+            with open(file_obj, 'rb') as source:
+                for chunk in iter(lambda: source.read(_HASH_CHUNK_SIZE), b''):
+                    digest.update(chunk)
+        else:
+            position = file_obj.tell()
+            for chunk in iter(lambda: file_obj.read(_HASH_CHUNK_SIZE), b''):
+                digest.update(chunk)
+            file_obj.seek(position)
+        return digest.hexdigest()
+
+    def key_for_batch(self, parts, kind: str = 'batch') -> str:
+        """
+        Ключ кэша для набора файлов: пары (название, ключ файла) в заданном порядке.
+
+        kind - вид результата по набору (сводный отчет, сравнение периодов): у разных видов разные ключи.
+        """
+        digest = hashlib.sha256(f"{self.version}\0{kind}\0".encode('utf-8'))
+        for label, key in parts:
+            digest.update(f"{label}\0{key}\n".encode('utf-8'))
+        return digest.hexdigest()
+
+    def hashing_reader(self, stream) -> io.BufferedReader:
+        """Буферизованный поток поверх stream; ключ кэша - reader.raw.key() после чтения"""
+        return io.BufferedReader(HashingStream(stream, self.version), buffer_size=_HASH_CHUNK_SIZE)
+
+    def filename(self, key: str, suffix: str = RESULT_SUFFIX) -> str:
+        """Имя файла результата (или таблиц результата) для ключа"""
+        return f"{RESULT_PREFIX}{key[:32]}{suffix}"
+
+    def key_from_filename(self, filename: str):
+        """Ключ (сокращенный до имени файла) по имени файла результата или None для чужих имен"""
+        if not (filename.startswith(RESULT_PREFIX) and filename.endswith(RESULT_SUFFIX)):
+            return None
+        key = filename[len(RESULT_PREFIX):-len(RESULT_SUFFIX)]
+        if len(key) != 32 or any(char not in '0123456789abcdef' for char in key):
+            return None
+        return key
+
+    def read_tables(self, filename: str) -> dict:
+        """Таблицы результата из JSON-файла кэша (write_tables)"""
+        with open(os.path.join(self.directory, filename), encoding='utf-8') as source:
+            return json.load(source)
+
+    def read_aggregates(self, filename: str) -> dict:
+        """Суммы отчета из JSON-файла кэша (write_aggregates) - таблицы pandas с исходными типами"""
+        # pandas импортируется при первом чтении, чтобы не замедлять запуск веб-сервера
+        import pandas as pd
+
+        with open(os.path.join(self.directory, filename), encoding='utf-8') as source:
+            frames = json.load(source)
+        # Столбцы category восстанавливаются как object - так же объединяются суммы нескольких отчетов
+        return {
+            name: pd.DataFrame(frame['columns']).astype(
+                {column: dtype for column, dtype in frame['dtypes'].items() if dtype != 'category'})
+            for name, frame in frames.items()
+        }
+
+    def lookup(self, key: str, suffix: str = RESULT_SUFFIX):
+        """Имя готового результата для ключа или None (обновляет время обращения)"""
+        filename = self.filename(key, suffix)
+        if self.touch(filename):
+            with self._lock:
+                self.hits += 1
+            return filename
+        return None
+
+    def touch(self, filename: str) -> bool:
+        """Отмечает обращение к результату, возвращает False, если файла нет"""
+        try:
+            os.utime(os.path.join(self.directory, filename))
+            return True
+        except OSError:
+            return False
+
+    def get_or_create(self, key: str, build, suffix: str = RESULT_SUFFIX):
+        """
+        Возвращает (имя файла результата, был ли он в кэше).
+
+        При промахе вызывает build(path) для построения результата по указанному пути.
+        Параллельные вызовы с тем же ключом ждут первого и получают его результат.
+        suffix - какой файл результата нужен: Excel (RESULT_SUFFIX), таблицы (TABLES_SUFFIX)
+        или суммы отчета (AGGREGATES_SUFFIX).
+        """
+        filename = self.lookup(key, suffix)
+        if filename is not None:
+            return filename, True
+
+        filename = self.filename(key, suffix)
+        with self._single_flight(filename):
+            # Пока ждали блокировку, результат мог построить другой поток или процесс
+            if self.lookup(key, suffix) is not None:
+                return filename, True
+
+            path = os.path.join(self.directory, filename)
+            temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp{suffix}"
+            try:
+                build(temp_path)
+                digest = _file_digest(temp_path)
+                os.replace(temp_path, path)
+                self._write_validator(filename, digest)
+            finally:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+
+            with self._lock:
+                self.misses += 1
+
+        self.evict()
+        return filename, False
+
+    def validators(self, filename: str):
+        """
+        (отпечаток содержимого, время построения) файла результата или None, если файла нет.
+
+        Отпечаток (SHA-256 содержимого) сохраняется при построении результата, для файлов,
+        построенных не через get_or_create, - считается при первом обращении. Время изменения
+        самого файла для этого не подходит: его обновляет каждое обращение (touch).
+        """
+        try:
+            file_stat = os.stat(os.path.join(self.directory, filename))
+        except OSError:
+            return None
+        if not stat.S_ISREG(file_stat.st_mode):
+            return None
+        identity = (file_stat.st_ino, file_stat.st_size)
+        cached = self._validators.get(filename)
+        if cached is not None and cached[0] == identity:
+            return cached[1]
+
+        validator_path = os.path.join(self.validator_directory, filename)
+        try:
+            with open(validator_path, encoding='ascii') as source:
+                digest, inode, size = source.read().split()
+                built_at = os.fstat(source.fileno()).st_mtime
+            if (int(inode), int(size)) != identity:
+                raise ValueError("отпечаток другого файла")
+        except (OSError, ValueError):
+            digest = _file_digest(os.path.join(self.directory, filename))
+            built_at = self._write_validator(filename, digest)
+            if built_at is None:
+                return None
+        self._validators[filename] = (identity, (digest, built_at))
+        return digest, built_at
+
+    def _write_validator(self, filename: str, digest: str):
+        """Сохраняет отпечаток файла результата; возвращает время построения или None, если файла уже нет"""
+        try:
+            file_stat = os.stat(os.path.join(self.directory, filename))
+        except OSError:
+            return None
+        validator_path = os.path.join(self.validator_directory, filename)
+        temp_path = f"{validator_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temp_path, 'w', encoding='ascii') as target:
+            target.write(f"{digest} {file_stat.st_ino} {file_stat.st_size}\n")
+        os.replace(temp_path, validator_path)
+        return os.stat(validator_path).st_mtime
+
+    def compressed(self, filename: str):
+        """
+        Путь к сжатой gzip копии файла результата или None, если файл не сжимается или его нет.
+
+        Копия строится при первом запросе; ее имя содержит отпечаток содержимого,
+        поэтому после перестроения результата старая копия не используется.
+        """
+        if not filename.endswith(COMPRESSIBLE_SUFFIXES):
+            return None
+        validators = self.validators(filename)
+        if validators is None:
+            return None
+        path = os.path.join(self.gzip_directory, f"{filename}.{validators[0][:16]}.gz")
+        try:
+            os.utime(path)
+            return path
+        except OSError:
+            pass
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(os.path.join(self.directory, filename), 'rb') as source, \
+                    gzip.GzipFile(temp_path, 'wb', compresslevel=GZIP_LEVEL, mtime=0) as target:
+                shutil.copyfileobj(source, target, _HASH_CHUNK_SIZE)
+            os.replace(temp_path, path)
+        except OSError:
+            return None
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+        return path
+
+    @contextmanager
+    def _single_flight(self, filename: str):
+        """Блокировка построения файла результата: между потоками и между процессами"""
+        with self._lock:
+            entry = self._key_locks.setdefault(filename, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                if fcntl is None:
+                    yield
+                    return
+                with open(os.path.join(self.lock_directory, f"{filename}.lock"), 'w') as lock_file:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX)
+                    try:
+                        yield
+                    finally:
+                        fcntl.flock(lock_file, fcntl.LOCK_UN)
+        finally:
+            with self._lock:
+                entry[1] -= 1
+                if entry[1] == 0:
+                    del self._key_locks[filename]
+
+    def _entries(self, temporary: bool = False) -> list:
+        """Файлы результатов, таблиц и сумм отчетов (или недостроенные временные файлы): (время обращения, размер, путь)"""
+        entries = []
+        with os.scandir(self.directory) as scan:
+            for entry in scan:
+                if (entry.name.startswith(RESULT_PREFIX) and entry.name.endswith((RESULT_SUFFIX, TABLES_SUFFIX, AGGREGATES_SUFFIX))
+                        and ('.tmp' in entry.name) == temporary and entry.is_file()):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return entries
+
+    def evict(self):
+        """Удаляет результаты старше TTL, затем самые давние, пока размер каталога превышает лимит"""
+        now = time.time()
+        entries = sorted(self._entries())
+        total_size = sum(size for _, size, _ in entries)
+        evicted = 0
+
+        for accessed_at, size, path in entries:
+            if now - accessed_at <= self.ttl_seconds and total_size <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            self._validators.pop(os.path.basename(path), None)
+            total_size -= size
+            evicted += 1
+
+        # Временные файлы прерванных построений и блокировки давно не использовавшихся ключей
+        stale = [path for accessed_at, _, path in self._entries(temporary=True) if now - accessed_at > self.ttl_seconds]
+        with os.scandir(self.lock_directory) as scan:
+            stale.extend(entry.path for entry in scan if now - entry.stat().st_mtime > self.ttl_seconds)
+        stale.extend(self._stale_companions(now))
+        for path in stale:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+        if evicted:
+            with self._lock:
+                self.evictions += evicted
+            logger.info(f"Из кэша результатов удалено файлов: {evicted}")
+
+    def _stale_companions(self, now: float) -> list:
+        """Отпечатки и сжатые копии удаленных результатов, давно не запрашивавшиеся сжатые копии"""
+        stale = []
+        with os.scandir(self.validator_directory) as scan:
+            for entry in scan:
+                if entry.name.endswith('.tmp'):
+                    expired = now - entry.stat().st_mtime > self.ttl_seconds
+                else:
+                    expired = not os.path.exists(os.path.join(self.directory, entry.name))
+                if expired:
+                    stale.append(entry.path)
+        with os.scandir(self.gzip_directory) as scan:
+            for entry in scan:
+                # Имя сжатой копии: <имя результата>.<отпечаток>.gz
+                expired = now - entry.stat().st_mtime > self.ttl_seconds
+                if not expired and entry.name.endswith('.gz'):
+                    expired = not os.path.exists(os.path.join(self.directory, entry.name.rsplit('.', 2)[0]))
+                if expired:
+                    stale.append(entry.path)
+        return stale
+
+    def stats(self) -> dict:
+        """Счетчики попаданий и промахов, текущий размер кэша"""
+        entries = self._entries()
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'in_flight': len(self._key_locks),
+                'files': len(entries),
+                'size_bytes': sum(size for _, size, _ in entries),
+                'max_bytes': self.max_bytes,
+                'ttl_seconds': self.ttl_seconds
+            }
@@ -0,0 +1,123 @@
+# backend/tests/conftest.py
+"""
+Модули сервиса импортируются из корня репозитория.
+
+Эталоны в tests/data получены исходной (до переработки) версией processor.py
+на отчете tests/data/report.csv: baseline_tables.json - данные обеих таблиц,
+baseline_workbook.json - содержимое и оформление листов Excel-файла (workbook_snapshot).
+"""
+import os
+import sys
+import json
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+REPORT_CSV = os.path.join(DATA_DIR, 'report.csv')
+
+
+def load_json(name: str):
+    with open(os.path.join(DATA_DIR, name), encoding='utf-8') as source:
+        return json.load(source)
+
+
+def workbook_snapshot(path: str) -> dict:
+    """
+    Содержимое листов Excel-файла для сравнения с эталоном: по строкам значения, числовые форматы,
+    жирный шрифт, заливка и отступ ячеек, уровень группировки и скрытие строки; закрепленная область листа.
+    """
+    from openpyxl import load_workbook
+
+    wb = load_workbook(path)
+    sheets = {}
+    for ws in wb.worksheets:
+        rows = []
+        for row in ws.iter_rows(min_row=1, max_row=ws.max_row, max_col=ws.max_column):
+            dimension = ws.row_dimensions[row[0].row]
+            rows.append({
+                'values': [cell.value for cell in row],
+                'number_formats': [cell.number_format for cell in row],
+                'bold': [bool(cell.font.b) for cell in row],
+                'fills': [cell.fill.fgColor.rgb if cell.fill.fill_type else None for cell in row],
+                'indents': [int(cell.alignment.indent or 0) for cell in row],
+                'outline_level': int(dimension.outline_level or 0),
+                'hidden': bool(dimension.hidden)
+            })
+        sheets[ws.title] = {'freeze_panes': ws.freeze_panes, 'rows': rows}
+    return sheets
+
+
+def assert_rows_equal(actual: list, expected: list):
+    """Строки таблиц (списки словарей) равны; числа - с точностью до ошибок округления суммирования"""
+    assert len(actual) == len(expected)
+    for actual_row, expected_row in zip(actual, expected):
+        assert actual_row == pytest.approx(expected_row, rel=1e-9, abs=1e-6)
+
+
+def assert_snapshots_equal(actual: dict, expected: dict):
+    """Листы (workbook_snapshot) равны; числа в ячейках - с точностью до ошибок округления суммирования"""
+    assert list(actual) == list(expected)
+    for title, sheet in expected.items():
+        assert actual[title]['freeze_panes'] == sheet['freeze_panes']
+        assert len(actual[title]['rows']) == len(sheet['rows'])
+        for actual_row, expected_row in zip(actual[title]['rows'], sheet['rows']):
+            assert actual_row['values'] == pytest.approx(expected_row['values'], rel=1e-9, abs=1e-6)
+            assert {**actual_row, 'values': None} == {**expected_row, 'values': None}
+
+
+@pytest.fixture(scope='session')
+def report_csv() -> str:
+    return REPORT_CSV
+
+
+@pytest.fixture(scope='session')
+def report_xlsx(tmp_path_factory, report_csv) -> str:
+    """Тот же отчет, что report_csv, в формате xlsx (пустые ячейки не записываются)"""
+    import pandas as pd
+    from openpyxl import Workbook
+
+    df = pd.read_csv(report_csv)
+    path = str(tmp_path_factory.mktemp('xlsx') / 'report.xlsx')
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet('Sheet1')
+    ws.append(list(df.columns))
+    for values in df.astype(object).where(df.notna(), None).itertuples(index=False, name=None):
+        ws.append(values)
+    wb.save(path)
+    return path
+
+
+@pytest.fixture(scope='session')
+def app_module(tmp_path_factory):
+    """
+    Модуль app с каталогами загрузок и результатов, базами и кэшем во временном каталоге
+    (настройки читаются из окружения при импорте) и загруженным processor.
+    """
+    root = tmp_path_factory.mktemp('app')
+    os.environ.update({
+        'UPLOAD_FOLDER': str(root / 'uploads'),
+        'RESULT_FOLDER': str(root / 'results'),
+        'JOB_DB_PATH': str(root / 'jobs.sqlite3'),
+        'AGGREGATE_DB_PATH': str(root / 'aggregates.sqlite3')
+    })
+    import app
+
+    assert app.processor_available()
+    return app
+
+
+@pytest.fixture
+def client(app_module):
+    return app_module.app.test_client()
+
+
+@pytest.fixture(scope='session')
+def baseline_tables() -> dict:
+    return load_json('baseline_tables.json')
+
+
+@pytest.fixture(scope='session')
+def baseline_workbook() -> dict:
+    return load_json('baseline_workbook.json')
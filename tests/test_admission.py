@@ -0,0 +1,131 @@
+# backend/tests/test_admission.py
+"""Допуск обработок по оценке стоимости (admission) и ответ 429 с Retry-After"""
+import io
+import time
+import threading
+
+import pytest
+
+from admission import AdmissionController, AdmissionRejected, estimate_cost, combine_costs
+from conftest import assert_rows_equal
+
+MB = 1024 * 1024
+
+
+def _cost(memory_mb: float, cpu_seconds: float = 1) -> dict:
+    return {'rows': 0, 'memory_bytes': int(memory_mb * MB), 'cpu_seconds': cpu_seconds}
+
+
+def _admit_later(controller: AdmissionController, cost: dict, admitted: list, name: str, **kwargs):
+    """Поток, ждущий допуска; после допуска имя попадает в admitted, а билет сразу освобождается"""
+    def run():
+        ticket = controller.acquire(cost, **kwargs)
+        admitted.append(name)
+        controller.release(ticket)
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    return thread
+
+
+def _wait_for_waiting(controller: AdmissionController, count: int):
+    deadline = time.monotonic() + 10
+    while controller.stats()['waiting'] != count:
+        assert time.monotonic() < deadline, "обработки не встали в очередь"
+        time.sleep(0.01)
+
+
+def test_chunked_csv_costs_less_memory_than_whole_file():
+    whole = estimate_cost(100000, 'xlsx')
+    chunked = estimate_cost(100000, 'csv', chunk_rows=1000)
+
+    assert chunked['memory_bytes'] == estimate_cost(1000, 'csv')['memory_bytes'] < whole['memory_bytes']
+    assert chunked['cpu_seconds'] == estimate_cost(100000, 'csv')['cpu_seconds']
+    assert combine_costs([whole, chunked]) == {name: whole[name] + chunked[name] for name in whole}
+
+
+def test_jobs_over_budget_wait_in_order():
+    controller = AdmissionController(100 * MB, max_running=4, queue_timeout=10)
+    first = controller.acquire(_cost(60))
+    admitted = []
+
+    threads = [_admit_later(controller, _cost(60), admitted, 'large')]
+    _wait_for_waiting(controller, 1)
+    # Маленькая обработка поместилась бы в бюджет, но не обгоняет ожидающую
+    threads.append(_admit_later(controller, _cost(1), admitted, 'small'))
+    _wait_for_waiting(controller, 2)
+    assert admitted == []
+
+    controller.release(first)
+    for thread in threads:
+        thread.join(10)
+
+    assert admitted == ['large', 'small']
+    stats = controller.stats()
+    assert (stats['memory_used_bytes'], stats['running'], stats['admitted'], stats['queued']) == (0, 0, 3, 2)
+
+
+def test_job_larger_than_budget_runs_alone():
+    controller = AdmissionController(100 * MB, max_running=4)
+
+    ticket = controller.acquire(_cost(500))
+
+    assert controller.stats()['memory_used_bytes'] == 100 * MB
+    with pytest.raises(AdmissionRejected):
+        controller.acquire(_cost(1), timeout=0.05)
+    controller.release(ticket)
+    controller.release(controller.acquire(_cost(1), timeout=0.05))
+
+
+def test_full_queue_and_long_backlog_are_rejected_at_once():
+    controller = AdmissionController(100 * MB, max_running=1, max_queue=1, queue_timeout=10)
+    running = controller.acquire(_cost(10, cpu_seconds=40))
+
+    # Ожидание заведомо дольше queue_timeout: отказ без ожидания, повтор - когда освободится место
+    started = time.monotonic()
+    with pytest.raises(AdmissionRejected) as rejected:
+        controller.acquire(_cost(10))
+    assert time.monotonic() - started < 1
+    assert 39 <= rejected.value.retry_after <= 40
+
+    admitted = []
+    waiting = _admit_later(controller, _cost(10), admitted, 'queued', timeout=None)
+    _wait_for_waiting(controller, 1)
+    with pytest.raises(AdmissionRejected, match='очередь'):
+        controller.acquire(_cost(10), timeout=60)
+    controller.release(running)
+    waiting.join(10)
+
+    assert admitted == ['queued'] and controller.rejected == 2
+
+
+def test_wait_ends_after_timeout():
+    controller = AdmissionController(100 * MB, max_running=1)
+    running = controller.acquire(_cost(10, cpu_seconds=0.01))
+
+    with pytest.raises(AdmissionRejected, match='истекло'):
+        controller.acquire(_cost(10), timeout=0.1)
+
+    assert controller.stats()['waiting'] == 0
+    controller.release(running)
+
+
+def test_busy_service_answers_429_until_budget_is_free(client, app_module, monkeypatch, report_csv, baseline_tables):
+    controller = AdmissionController(100 * MB, max_running=1, max_queue=0, queue_timeout=1)
+    monkeypatch.setattr(app_module, 'admission', controller)
+    running = controller.acquire(_cost(10, cpu_seconds=5))
+    with open(report_csv, 'rb') as source:
+        report = source.read() + b'\n' * 2000
+
+    busy = client.post('/api/summary', data={'file': (io.BytesIO(report), 'week.csv')})
+
+    assert busy.status_code == 429
+    assert busy.headers['Retry-After'] == str(busy.get_json()['retry_after'])
+    assert int(busy.headers['Retry-After']) >= 1
+    assert client.get('/api/admission').get_json()['rejected'] == 1
+
+    controller.release(running)
+    response = client.post('/api/summary', data={'file': (io.BytesIO(report), 'week.csv')})
+    assert response.status_code == 200
+    assert_rows_equal(response.get_json()['structured_data'], baseline_tables['structured_data'])
+    assert controller.stats()['memory_used_bytes'] == 0
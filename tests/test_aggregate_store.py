@@ -0,0 +1,74 @@
+# backend/tests/test_aggregate_store.py
+"""Хранилище сумм отчетов продавцов (aggregate_store.AggregateStore): суммы за период, замена и удаление отчетов"""
+import pytest
+
+import processor
+from aggregate_store import AggregateStore
+from conftest import assert_rows_equal
+
+WEEK1 = ('2024-01-01', '2024-01-07')
+WEEK2 = ('2024-01-08', '2024-01-14')
+
+
+@pytest.fixture(scope='module')
+def weeks(report_csv) -> list:
+    """Суммы отчета, разделенного на две недели"""
+    report = processor.read_wb_report(report_csv)
+    return [processor.aggregate_report(report.iloc[:250]), processor.aggregate_report(report.iloc[250:])]
+
+
+@pytest.fixture
+def store(tmp_path, weeks) -> AggregateStore:
+    store = AggregateStore(str(tmp_path / 'aggregates.sqlite3'))
+    store.add('s1', 'week1', *WEEK1, weeks[0], label='Неделя 1')
+    store.add('s1', 'week2', *WEEK2, weeks[1], label='Неделя 2')
+    return store
+
+
+def _assert_tables_equal(aggregates: dict, expected: tuple):
+    for actual, expected_rows in zip(processor.build_report_tables(aggregates), expected):
+        assert_rows_equal(actual, expected_rows)
+
+
+def test_seller_totals_match_baseline(store, baseline_tables):
+    _assert_tables_equal(store.aggregates('s1'),
+                         (baseline_tables['structured_data'], baseline_tables['second_table_data']))
+    assert [report['id'] for report in store.reports('s1')] == ['week1', 'week2']
+
+
+def test_period_filter_selects_whole_reports(store, weeks):
+    assert [report['id'] for report in store.reports('s1', date_from='2024-01-02')] == ['week2']
+    assert [report['id'] for report in store.reports('s1', date_to='2024-01-13')] == ['week1']
+
+    _assert_tables_equal(store.aggregates('s1', *WEEK1), processor.build_report_tables(weeks[0]))
+    _assert_tables_equal(store.aggregates('s1', *WEEK2), processor.build_report_tables(weeks[1]))
+
+
+def test_report_aggregates_are_kept_per_report(store, weeks):
+    periods = store.report_aggregates('s1')
+
+    assert [(report['id'], report['label']) for report, _ in periods] == [('week1', 'Неделя 1'), ('week2', 'Неделя 2')]
+    for (_, aggregates), expected in zip(periods, weeks):
+        _assert_tables_equal(aggregates, processor.build_report_tables(expected))
+
+
+def test_sellers_are_separate_and_reports_replaced(store, weeks, baseline_tables):
+    store.add('s2', 'week1', *WEEK1, weeks[0])
+    # Повторная загрузка того же отчета заменяет его суммы, а не добавляет их еще раз
+    store.add('s1', 'week2', *WEEK2, weeks[1], label='Неделя 2')
+
+    _assert_tables_equal(store.aggregates('s1'),
+                         (baseline_tables['structured_data'], baseline_tables['second_table_data']))
+    _assert_tables_equal(store.aggregates('s2'), processor.build_report_tables(weeks[0]))
+
+
+def test_removed_reports_leave_empty_totals(store):
+    assert store.remove('s1', 'week1') and store.remove('s1', 'week2')
+    assert not store.remove('s1', 'week2')
+
+    aggregates = store.aggregates('s1')
+
+    assert aggregates['key_totals'].empty and aggregates['supplies'].empty
+    assert all(aggregates['key_totals'][name].dtype == 'float64' for name in ['N', 'NO', 'AH'])
+    structured_data, _ = processor.build_report_tables(aggregates)
+    assert all(row['qty'] == 0 for row in structured_data)
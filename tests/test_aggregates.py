@@ -0,0 +1,162 @@
+# backend/tests/test_aggregates.py
+"""Суммы отчета (aggregate_report, aggregate_by_keys) и их объединение (merge_aggregates)"""
+import gc
+import math
+import weakref
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import processor
+from processor import COLUMN_MAPPING, KEY_COLUMNS
+from benchmarks.generate_report import generate_report
+from conftest import assert_rows_equal
+
+MEASURES = ['N', 'AH', 'AC', 'AK', 'BH', 'BI', 'AO', 'BJ', 'BK']
+
+
+@pytest.fixture(scope='module')
+def report(report_csv) -> pd.DataFrame:
+    return processor.read_wb_report(report_csv)
+
+
+def _by_letters(report_csv) -> pd.DataFrame:
+    """Отчет в столбцах-буквах COLUMN_MAPPING, прочитанный pandas без приведения типов"""
+    df = pd.read_csv(report_csv)
+    return df[list(COLUMN_MAPPING)].rename(columns=COLUMN_MAPPING)
+
+
+def _key(values) -> tuple:
+    return tuple(None if pd.isna(value) else value for value in values)
+
+
+def test_key_totals_are_exact_group_sums(report, report_csv):
+    raw = _by_letters(report_csv)
+    raw['NO'] = raw['N'] * raw['O']
+    raw['NOX'] = raw['NO'] * raw['X'] / 100
+    raw = raw[raw['J'].notna() | raw['K'].notna()]
+    expected = {}
+    for values, rows in raw.groupby(KEY_COLUMNS, dropna=False):
+        expected[_key(values)] = {letter: math.fsum(rows[letter].dropna()) for letter in MEASURES + ['NO', 'NOX']}
+
+    key_totals = processor.aggregate_report(report)['key_totals']
+
+    actual = {_key(row[KEY_COLUMNS]): row.drop(KEY_COLUMNS).to_dict() for _, row in key_totals.iterrows()}
+    assert actual.keys() == expected.keys()
+    for key, totals in expected.items():
+        assert actual[key] == pytest.approx(totals, rel=1e-12, abs=1e-9)
+
+
+def test_summary_data_matches_baseline(report, baseline_tables):
+    structured_data, second_table_data = processor.create_summary_data(report)
+
+    assert_rows_equal(structured_data, baseline_tables['structured_data'])
+    assert_rows_equal(second_table_data, baseline_tables['second_table_data'])
+
+
+def test_chunked_aggregation_matches_whole(report):
+    whole = processor.build_report_tables(processor.aggregate_report(report, chunk_rows=0))
+
+    chunked = processor.build_report_tables(processor.aggregate_report(report, chunk_rows=70))
+
+    for actual, expected in zip(chunked, whole):
+        assert_rows_equal(actual, expected)
+
+
+def test_merged_reports_match_concatenated_report(report, baseline_tables):
+    halves = [report.iloc[:200], report.iloc[200:]]
+
+    merged = processor.merge_aggregates([processor.aggregate_report(half) for half in halves])
+
+    structured_data, second_table_data = processor.build_report_tables(merged)
+    assert_rows_equal(structured_data, baseline_tables['structured_data'])
+    assert_rows_equal(second_table_data, baseline_tables['second_table_data'])
+
+
+def _detail_rows(structured_data: list, category: str) -> list:
+    """Строки детализации (level 1), идущие за строкой категории"""
+    start = next(i for i, row in enumerate(structured_data) if row['level'] == 0 and row['name'] == category) + 1
+    rows = []
+    for row in structured_data[start:]:
+        if row['level'] != 1:
+            break
+        rows.append(row)
+    return rows
+
+
+@pytest.mark.parametrize('category', ['Возврат', 'Продажа'])
+def test_supply_rows_match_per_supply_sums(report, report_csv, baseline_tables, category):
+    raw = _by_letters(report_csv)
+    raw = raw[(raw['J'] == category) & (raw['K'] == category) & raw['B'].notna()]
+    expected = []
+    for supply, rows in raw.groupby('B'):
+        prices = rows['O'].dropna()
+        qty = math.fsum(rows['N'].dropna())
+        expected.append({'name': int(supply), 'qty': qty,
+                         'retail_price': qty * math.fsum(prices) / len(prices) if len(prices) else 0,
+                         'to_seller': math.fsum(rows['AH'].dropna()), 'acquiring': math.fsum(rows['AC'].dropna())})
+
+    structured_data, _ = processor.create_summary_data(report)
+
+    rows = _detail_rows(structured_data, category)
+    assert_rows_equal(rows, _detail_rows(baseline_tables['structured_data'], category))
+    assert len(rows) == len(expected) > 0
+    for row, totals in zip(rows, expected):
+        assert isinstance(row['name'], int)
+        assert {field: row[field] for field in totals} == pytest.approx(totals, rel=1e-12, abs=1e-9)
+        assert (row['retention'], row['storage'], row['has_children']) == (0, 0, False)
+    assert [row['row_number'] for row in rows] == list(range(rows[0]['row_number'], rows[0]['row_number'] + len(rows)))
+
+
+def test_supply_rows_without_prices_or_numbers():
+    supplies = pd.DataFrame({
+        'supply': [30.0, None, 10.0],
+        'N': [2.0, 5.0, 1.0],
+        'O_sum': [0.0, 100.0, 250.0],
+        'O_count': [0, 1, 2],
+        'AH': [7.5, 1.0, 3.0],
+        'AC': [0.5, 0.0, 0.25]
+    })
+
+    rows = processor.create_supply_rows(supplies, 4)
+
+    # Без номера поставки строки нет; без цен розничная цена - 0; по возрастанию номера
+    assert [(row['name'], row['row_number'], row['retail_price']) for row in rows] == [(10, 4, 125.0), (30, 5, 0)]
+    assert [(row['qty'], row['to_seller'], row['acquiring']) for row in rows] == [(1.0, 3.0, 0.25), (2.0, 7.5, 0.5)]
+
+
+def test_aggregation_leaves_report_unchanged(report):
+    before = report.copy(deep=True)
+
+    processor.create_summary_data(report)
+
+    pd.testing.assert_frame_equal(report, before)
+
+
+def test_rows_without_keys_do_not_change_totals(report):
+    empty = report.iloc[:3].where(np.zeros((3, report.shape[1]), dtype=bool))
+    padded = pd.concat([report.iloc[:100], empty, report.iloc[100:]], ignore_index=True)
+
+    assert processor.create_summary_data(padded) == processor.create_summary_data(report)
+
+
+def test_aggregation_does_not_copy_report(tmp_path):
+    report = processor.read_wb_report(generate_report(str(tmp_path / 'report.csv'), 40000, seed=2))
+    size = report.memory_usage(deep=True).sum()
+
+    tracemalloc.start()
+    try:
+        aggregates = processor.aggregate_report(report, chunk_rows=0)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    # Копия всех показателей отчета заняла бы еще столько же, сколько сам отчет
+    assert peak < 1.5 * size
+    # Суммы не ссылаются на строки отчета
+    reference = weakref.ref(report)
+    del report
+    gc.collect()
+    assert reference() is None and len(aggregates['key_totals']) < 100
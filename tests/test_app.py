@@ -0,0 +1,409 @@
+# backend/tests/test_app.py
+"""Эндпоинты загрузки и обработки отчетов (app)"""
+import io
+import os
+import time
+import itertools
+
+import pytest
+
+from conftest import workbook_snapshot, assert_rows_equal, assert_snapshots_equal
+
+NOT_XLSX = b'PK not a zip archive'
+_UPLOADS = itertools.count(1)
+
+
+def _report(data: bytes, filename: str):
+    return io.BytesIO(data), filename
+
+
+@pytest.fixture(scope='module')
+def report_bytes(report_csv) -> bytes:
+    with open(report_csv, 'rb') as source:
+        return source.read()
+
+
+def _fresh(report: bytes) -> bytes:
+    """Тот же отчет с другим содержимым файла: пустые строки в конце не разбираются, но меняют ключ кэша"""
+    return report + b'\n' * next(_UPLOADS)
+
+
+def _wait(condition, timeout: float = 30):
+    deadline = time.monotonic() + timeout
+    while not (result := condition()):
+        assert time.monotonic() < deadline, "условие не выполнилось за отведенное время"
+        time.sleep(0.05)
+    return result
+
+
+def _wait_for_job(client, job_id: str) -> dict:
+    def finished():
+        job = client.get(f'/api/jobs/{job_id}').get_json()
+        return job if job['status'] in ('done', 'failed') else None
+
+    return _wait(finished)
+
+
+@pytest.mark.parametrize('url', ['/api/upload', '/api/summary', '/api/export?table=rows', '/api/export',
+                                 '/api/sellers/s1/reports?date_from=2024-01-01&date_to=2024-01-07'])
+def test_unreadable_xlsx_is_rejected(client, url):
+    response = client.post(url, data={'file': _report(NOT_XLSX, 'report.xlsx')})
+
+    assert response.status_code == 400
+    assert 'xlsx' in response.get_json()['error']
+
+
+@pytest.mark.parametrize('url', ['/api/upload/batch', '/api/compare'])
+def test_unreadable_xlsx_in_batch_is_rejected(client, report_csv, url):
+    with open(report_csv, 'rb') as source:
+        report = source.read()
+
+    response = client.post(url, data={'files': [_report(report, 'week1.csv'), _report(NOT_XLSX, 'week2.xlsx')]})
+
+    assert response.status_code == 400
+    assert 'xlsx' in response.get_json()['error']
+
+
+class _InlinePool:
+    """Пул процессов (process_pool.ProcessPool), выполняющий задачи в текущем процессе"""
+    max_workers = 3
+    in_flight = 0
+
+    def __init__(self, error: Exception = None):
+        self.error = error
+        self.tasks = []
+        self.sources = []
+
+    def run(self, func, *args, stats=None, **kwargs):
+        self.tasks.append(func.__name__)
+        self.sources.append(args[0])
+        if self.error is not None:
+            raise self.error
+        return func(*args, stats=stats, **kwargs)
+
+
+@pytest.fixture
+def parallel_csv(app_module, monkeypatch, tmp_path):
+    """Разбор CSV по частям из порций по 100 строк для любого размера файла; временные файлы - в tmp_path/'tmp'"""
+    import tempfile
+
+    temp_dir = tmp_path / 'tmp'
+    temp_dir.mkdir()
+    monkeypatch.setattr(tempfile, 'tempdir', str(temp_dir))
+    monkeypatch.setattr(app_module, 'PARALLEL_MIN_MB', 0.01)
+    monkeypatch.setattr(app_module.processor, 'CHUNK_ROWS', 100)
+
+    def use_pool(pool):
+        monkeypatch.setattr(app_module, 'report_pool', pool)
+        return pool
+
+    use_pool.temp_dir = temp_dir
+    return use_pool
+
+
+def test_parallel_csv_parts_match_whole_file(client, app_module, parallel_csv, report_csv, report_bytes):
+    pool = parallel_csv(_InlinePool())
+
+    response = client.post('/api/summary', data={'file': _report(_fresh(report_bytes), 'parts.csv')})
+
+    assert response.status_code == 200
+    assert pool.tasks == ['aggregate_csv_range'] * pool.max_workers
+    # Части читают копию загрузки во временном каталоге системы, а не в UPLOAD_FOLDER
+    assert {os.path.dirname(path) for path in pool.sources} == {str(parallel_csv.temp_dir)}
+    expected = app_module.processor.summarize_report_file(report_csv)
+    assert response.get_json()['second_table_data'] == pytest.approx(expected[1])
+    assert list(parallel_csv.temp_dir.iterdir()) == []
+
+
+def test_parallel_csv_copy_is_removed_after_pool_failure(client, app_module, parallel_csv, report_bytes):
+    from process_pool import WorkerCrashedError
+
+    parallel_csv(_InlinePool(WorkerCrashedError('Процесс обработки завершился с кодом -9')))
+
+    response = client.post('/api/upload', data={'file': _report(_fresh(report_bytes), 'crash.csv')})
+
+    assert response.status_code == 500
+    assert 'кодом -9' in response.get_json()['error']
+    assert list(parallel_csv.temp_dir.iterdir()) == []
+    assert os.listdir(app_module.UPLOAD_FOLDER) == []
+
+
+POST_ENDPOINTS = ['/api/upload', '/api/summary', '/api/export', '/api/upload/batch', '/api/compare',
+                  '/api/sellers/s1/reports?date_from=2024-01-01&date_to=2024-01-07']
+
+
+@pytest.mark.parametrize('url', POST_ENDPOINTS)
+def test_oversized_request_gets_json_413(client, app_module, monkeypatch, report_csv, url):
+    monkeypatch.setitem(app_module.app.config, 'MAX_CONTENT_LENGTH', 1024)
+    with open(report_csv, 'rb') as source:
+        report = source.read()
+
+    response = client.post(url, data={'file': _report(report, 'week1.csv'), 'files': _report(report, 'week2.csv')})
+
+    assert response.status_code == 413
+    assert response.get_json()['error'].startswith('Файл слишком большой')
+
+
+@pytest.mark.parametrize('url', POST_ENDPOINTS)
+def test_request_without_file_gets_json_400(client, url):
+    response = client.post(url, data={'comment': 'без файла'})
+
+    assert response.status_code == 400
+    assert response.get_json()['error']
+
+
+def test_error_response_maps_exceptions(app_module):
+    from admission import AdmissionRejected
+    from process_pool import JobTimeoutError, JobMemoryError, WorkerCrashedError
+    from report_schema import ReportHeaderError
+    from werkzeug.exceptions import RequestEntityTooLarge
+
+    cases = [
+        (app_module.RequestError('Профилирование не разрешено', 403), 403, 'Профилирование не разрешено'),
+        (AdmissionRejected('Сервер занят', 7), 429, 'Сервер занят'),
+        (RequestEntityTooLarge(), 413, 'Файл слишком большой (максимум'),
+        (ReportHeaderError('нет столбцов'), 400, 'нет столбцов'),
+        (JobTimeoutError('300 с'), 504, 'Ошибка обработки файлов: 300 с'),
+        (JobMemoryError('1024 МБ'), 413, 'Файлы слишком большие для обработки: 1024 МБ'),
+        (WorkerCrashedError('код -9'), 500, 'Ошибка обработки файлов: код -9'),
+    ]
+    with app_module.app.test_request_context('/api/upload/batch', method='POST'):
+        for error, status, message in cases:
+            response = app_module.app.make_response(app_module.error_response(error, batch=True))
+            assert response.status_code == status
+            assert response.get_json()['error'].startswith(message)
+            if status == 429:
+                assert response.headers['Retry-After'] == '7'
+
+
+def test_async_upload_is_processed_by_job_queue(client, app_module, tmp_path, report_bytes, baseline_workbook):
+    response = client.post('/api/upload?async=1', data={'file': _report(_fresh(report_bytes), 'week.csv')})
+
+    assert response.status_code == 202
+    job_id = response.get_json()['job_id']
+    job = _wait_for_job(client, job_id)
+    assert job['status'] == 'done', job
+    download = client.get(job['download_url'])
+    assert download.status_code == 200
+    path = tmp_path / 'result.xlsx'
+    path.write_bytes(download.data)
+    snapshot = workbook_snapshot(str(path))
+    assert [row['values'][0] for row in snapshot['Основной отчет']['rows']] == \
+        [row['values'][0] for row in baseline_workbook['Основной отчет']['rows']]
+    # Файл задачи удаляется, когда задача завершилась
+    _wait(lambda: os.listdir(app_module.UPLOAD_FOLDER) == [])
+
+
+def test_failed_async_upload_reports_error(client, app_module):
+    response = client.post('/api/upload?async=1', data={'file': _report(b'a,b\n1,2\n', 'week.csv')})
+
+    assert response.status_code == 202
+    job = _wait_for_job(client, response.get_json()['job_id'])
+    assert job['status'] == 'failed'
+    assert job['error'].startswith('Ошибка обработки файла')
+    assert 'download_url' not in job
+    _wait(lambda: os.listdir(app_module.UPLOAD_FOLDER) == [])
+    assert client.get('/api/jobs/unknown').status_code == 404
+
+
+def test_repeated_upload_is_served_from_cache(client, app_module, report_bytes):
+    report = _fresh(report_bytes)
+    hits = app_module.result_cache.hits
+
+    first = client.post('/api/upload', data={'file': _report(report, 'week.csv')})
+    second = client.post('/api/upload', data={'file': _report(report, 'again.csv')})
+
+    assert (first.status_code, second.status_code) == (200, 200)
+    assert (first.get_json()['cached'], second.get_json()['cached']) == (False, True)
+    assert first.get_json()['result_filename'] == second.get_json()['result_filename']
+    assert app_module.result_cache.hits == hits + 1
+
+
+@pytest.mark.parametrize('content_type', ['text/csv', 'application/x-www-form-urlencoded'])
+def test_raw_csv_body_is_parsed_as_stream(client, app_module, monkeypatch, report_bytes, baseline_tables,
+                                          content_type):
+    streamed = []
+    summarize_stream = app_module.summarize_stream
+    monkeypatch.setattr(app_module, 'summarize_stream', lambda stream: streamed.append(1) or summarize_stream(stream))
+    report = _fresh(report_bytes)
+
+    raw = client.post('/api/summary?filename=week.csv', data=report, content_type=content_type)
+    multipart = client.post('/api/summary', data={'file': _report(report, 'week.csv')})
+
+    assert (raw.status_code, multipart.status_code) == (200, 200)
+    assert streamed == [1]
+    assert_rows_equal(raw.get_json()['structured_data'], baseline_tables['structured_data'])
+    assert_rows_equal(raw.get_json()['second_table_data'], baseline_tables['second_table_data'])
+    # Тот же файл формой - тот же ключ кэша
+    assert multipart.get_json()['cached'] is True
+    assert multipart.get_json()['result_filename'] == raw.get_json()['result_filename']
+    assert os.listdir(app_module.UPLOAD_FOLDER) == []
+
+
+def test_raw_xlsx_body_is_processed(client, report_xlsx, baseline_tables):
+    with open(report_xlsx, 'rb') as source:
+        response = client.post('/api/summary?filename=week.xlsx', data=source.read(),
+                               content_type='application/octet-stream')
+
+    assert response.status_code == 200
+    assert_rows_equal(response.get_json()['second_table_data'], baseline_tables['second_table_data'])
+
+
+def test_raw_body_without_filename_is_rejected(client, report_bytes):
+    response = client.post('/api/upload', data=report_bytes, content_type='text/csv')
+
+    assert response.status_code == 400
+    assert response.get_json()['error'] == 'Файл не найден в запросе'
+
+
+def _halves(report: bytes, rows: int = 250) -> list:
+    """Отчет, разделенный на две недели: CSV-файлы с общим заголовком"""
+    header, *lines = report.splitlines(keepends=True)
+    return [header + b''.join(lines[:rows]), header + b''.join(lines[rows:])]
+
+
+def _period_sheets(tmp_path, weeks: dict) -> dict:
+    """Листы 'Россия' отчетов по отдельности, как в сводной книге"""
+    import processor
+
+    sheets = {}
+    for label, data in weeks.items():
+        path = tmp_path / f'{label}.csv'
+        path.write_bytes(data)
+        processor.process_wb_report_file(str(path), str(tmp_path / f'{label}.xlsx'))
+        sheets[f'Россия {label}'] = workbook_snapshot(str(tmp_path / f'{label}.xlsx'))['Россия']
+    return sheets
+
+
+def _download_snapshot(client, tmp_path, url: str) -> dict:
+    response = client.get(url)
+    assert response.status_code == 200
+    path = tmp_path / 'download.xlsx'
+    path.write_bytes(response.data)
+    return workbook_snapshot(str(path))
+
+
+@pytest.mark.parametrize('archived', [False, True])
+def test_batch_workbook_matches_baseline(client, tmp_path, report_bytes, baseline_workbook, archived):
+    import zipfile
+
+    weeks = dict(zip(['week1', 'week2'], _halves(_fresh(report_bytes))))
+    if archived:
+        archive = io.BytesIO()
+        with zipfile.ZipFile(archive, 'w') as target:
+            # В архиве отчеты идут по именам; служебные и посторонние файлы пропускаются
+            for label in reversed(list(weeks)):
+                target.writestr(f'reports/{label}.csv', weeks[label])
+            target.writestr('__MACOSX/reports/._week1.csv', b'')
+            target.writestr('reports/readme.txt', b'')
+        files = [_report(archive.getvalue(), 'weeks.zip')]
+    else:
+        files = [_report(data, f'{label}.csv') for label, data in weeks.items()]
+
+    response = client.post('/api/upload/batch', data={'files': files})
+
+    assert response.status_code == 200
+    assert response.get_json()['periods'] == ['week1', 'week2']
+    expected = dict(baseline_workbook, **_period_sheets(tmp_path, weeks))
+    assert_snapshots_equal(_download_snapshot(client, tmp_path, response.get_json()['download_url']), expected)
+
+
+def test_seller_reports_sum_to_baseline(client, report_bytes, baseline_tables):
+    weeks = _halves(_fresh(report_bytes))
+    url = '/api/sellers/{seller}/reports?date_from={0}&date_to={1}'
+    for seller in ('app-s1', 'app-s2'):
+        for data, period in zip(weeks, [('2024-01-01', '2024-01-07'), ('2024-01-08', '2024-01-14')]):
+            response = client.post(url.format(*period, seller=seller), data={'file': _report(data, 'week.csv')})
+            assert response.status_code == 200
+    # Повторная загрузка того же файла меняет только период отчета
+    moved = client.post(url.format('2024-02-05', '2024-02-11', seller='app-s2'),
+                        data={'file': _report(weeks[1], 'week2.csv')})
+
+    summary = client.get('/api/sellers/app-s1/summary').get_json()
+    assert_rows_equal(summary['structured_data'], baseline_tables['structured_data'])
+    assert_rows_equal(summary['second_table_data'], baseline_tables['second_table_data'])
+    reports = client.get('/api/sellers/app-s2/reports?date_from=2024-02-01').get_json()['reports']
+    assert [(report['id'], report['label']) for report in reports] == [(moved.get_json()['report_id'], 'week2')]
+    january = client.get('/api/sellers/app-s2/summary?date_to=2024-01-31').get_json()
+    assert len(january['reports']) == 1
+    assert client.get('/api/sellers/app-s2/summary?date_to=31.01.2024').status_code == 400
+
+
+def test_summary_workbook_is_built_on_first_download(client, app_module, tmp_path, report_bytes, baseline_tables,
+                                                     baseline_workbook):
+    report = _fresh(report_bytes)
+
+    response = client.post('/api/summary', data={'file': _report(report, 'week.csv')})
+
+    assert response.status_code == 200
+    summary = response.get_json()
+    assert summary['cached'] is False
+    assert_rows_equal(summary['structured_data'], baseline_tables['structured_data'])
+    result_path = os.path.join(app_module.RESULT_FOLDER, summary['result_filename'])
+    assert not os.path.exists(result_path)
+
+    assert_snapshots_equal(_download_snapshot(client, tmp_path, summary['download_url']), baseline_workbook)
+    assert os.path.exists(result_path)
+    # Таблицы и Excel-файл того же отчета уже в кэше
+    again = client.post('/api/upload', data={'file': _report(report, 'week.csv')}).get_json()
+    assert (again['cached'], again['result_filename']) == (True, summary['result_filename'])
+    assert client.get('/api/download/результат_' + '0' * 32 + '.xlsx').status_code == 404
+
+
+def test_parallel_csv_parts_run_in_process_pool(client, parallel_csv, report_bytes, baseline_tables):
+    from process_pool import ProcessPool
+
+    pool = parallel_csv(ProcessPool(max_workers=3, max_jobs_per_child=0, timeout=60, preload=()))
+    try:
+        response = client.post('/api/summary', data={'file': _report(_fresh(report_bytes), 'parts.csv')})
+    finally:
+        pool.shutdown()
+
+    assert response.status_code == 200
+    assert_rows_equal(response.get_json()['structured_data'], baseline_tables['structured_data'])
+    assert_rows_equal(response.get_json()['second_table_data'], baseline_tables['second_table_data'])
+    # Во временном каталоге остается только служебный каталог multiprocessing (pymp-*)
+    assert list(parallel_csv.temp_dir.glob('wb_parts_*')) == []
+
+
+def test_download_answers_conditional_and_range_requests(client, report_bytes):
+    url = client.post('/api/upload', data={'file': _report(_fresh(report_bytes), 'week.csv')}).get_json()['download_url']
+
+    full = client.get(url)
+
+    assert full.status_code == 200
+    etag = full.headers['ETag']
+    assert full.headers['Accept-Ranges'] == 'bytes' and full.headers['Last-Modified']
+    assert 'Content-Encoding' not in full.headers
+    not_modified = client.get(url, headers={'If-None-Match': etag})
+    assert (not_modified.status_code, not_modified.data) == (304, b'')
+    part = client.get(url, headers={'Range': 'bytes=100-199', 'If-Range': etag})
+    assert part.status_code == 206
+    assert part.data == full.data[100:200]
+    assert part.headers['Content-Range'] == f'bytes 100-199/{len(full.data)}'
+    # Файл изменился (другой ETag) - докачка начинается заново
+    stale = client.get(url, headers={'Range': 'bytes=100-199', 'If-Range': '"0123456789abcdef"'})
+    assert (stale.status_code, stale.data) == (200, full.data)
+
+
+def test_text_results_are_downloaded_compressed(client, report_bytes, baseline_tables):
+    import gzip
+    import json
+
+    summary = client.post('/api/summary', data={'file': _report(_fresh(report_bytes), 'week.csv')}).get_json()
+    url = summary['download_url'].replace('.xlsx', '.json')
+
+    plain = client.get(url)
+    compressed = client.get(url, headers={'Accept-Encoding': 'gzip'})
+
+    assert plain.status_code == compressed.status_code == 200
+    assert 'Content-Encoding' not in plain.headers
+    assert compressed.headers['Content-Encoding'] == 'gzip'
+    assert gzip.decompress(compressed.data) == plain.data
+    assert compressed.headers['ETag'] != plain.headers['ETag']
+    assert 'Accept-Encoding' in plain.headers['Vary'] and 'Accept-Encoding' in compressed.headers['Vary']
+    tables = json.loads(plain.data)
+    assert_rows_equal(tables['structured_data'], baseline_tables['structured_data'])
+    assert_rows_equal(tables['second_table_data'], baseline_tables['second_table_data'])
+    again = client.get(url, headers={'Accept-Encoding': 'gzip', 'If-None-Match': compressed.headers['ETag']})
+    assert again.status_code == 304
@@ -0,0 +1,55 @@
+# backend/tests/test_benchmarks.py
+"""Генератор синтетических отчетов и бенчмарк этапов обработки (benchmarks)"""
+import json
+
+import pytest
+from openpyxl.utils import column_index_from_string
+
+import processor
+from benchmarks import compare, run_benchmarks
+from benchmarks.generate_report import generate_report, REPORT_HEADERS, XLSX_MAX_ROWS
+from conftest import assert_rows_equal
+
+
+def test_report_columns_stand_on_their_letters():
+    for name, letter in processor.COLUMN_MAPPING.items():
+        assert REPORT_HEADERS[column_index_from_string(letter) - 1] == name
+
+
+def test_same_seed_gives_same_report(tmp_path):
+    first = generate_report(str(tmp_path / 'first.csv'), 700, seed=3)
+    second = generate_report(str(tmp_path / 'second.csv'), 700, seed=3)
+    other = generate_report(str(tmp_path / 'other.csv'), 700, seed=4)
+
+    with open(first, 'rb') as a, open(second, 'rb') as b, open(other, 'rb') as c:
+        assert a.read() == b.read() != c.read()
+
+
+def test_csv_and_xlsx_reports_have_same_tables(tmp_path):
+    from_csv = processor.summarize_report_file(generate_report(str(tmp_path / 'report.csv'), 700, seed=5))
+    from_xlsx = processor.summarize_report_file(generate_report(str(tmp_path / 'report.xlsx'), 700, seed=5))
+
+    for actual, expected in zip(from_xlsx, from_csv):
+        assert_rows_equal(actual, expected)
+    # В отчете есть обе категории с детализацией по поставкам
+    assert {row['name'] for row in from_csv[0] if row['has_children']} == {'Продажа', 'Возврат'}
+
+
+def test_xlsx_size_is_limited(tmp_path):
+    with pytest.raises(ValueError, match=str(XLSX_MAX_ROWS)):
+        generate_report(str(tmp_path / 'report.xlsx'), XLSX_MAX_ROWS + 1)
+
+
+def test_benchmark_results_are_compared(tmp_path):
+    results = run_benchmarks.run([300], ['csv'], repeat=1, memory=True, data_dir=str(tmp_path))
+
+    assert [result['stage'] for result in results['results']] == run_benchmarks.STAGES
+    assert all(result['peak_memory_bytes'] > 0 and len(result['times']) == 1 for result in results['results'])
+    baseline_path, current_path = tmp_path / 'before.json', tmp_path / 'after.json'
+    baseline_path.write_text(json.dumps(results), encoding='utf-8')
+    slower = json.loads(json.dumps(results))
+    slower['results'][0]['median'] *= 2
+    current_path.write_text(json.dumps(slower), encoding='utf-8')
+
+    assert compare.compare(str(baseline_path), str(current_path)) == [('read_wb_report', 300, 'csv')]
+    assert compare.compare(str(baseline_path), str(baseline_path)) == []
@@ -0,0 +1,76 @@
+# backend/tests/test_chunked.py
+"""Обработка отчета порциями (aggregate_csv_chunks, iter_report_rows): те же таблицы при ограниченной памяти"""
+import tracemalloc
+
+import pandas as pd
+import pytest
+
+import processor
+from benchmarks.generate_report import generate_report
+from conftest import assert_rows_equal
+
+
+@pytest.mark.parametrize('chunk_rows', [1, 37, 500, 10000])
+def test_chunked_csv_matches_baseline(report_csv, baseline_tables, chunk_rows):
+    stats = {}
+
+    aggregates = processor.aggregate_csv_chunks(report_csv, chunk_rows, stats)
+
+    structured_data, second_table_data = processor.build_report_tables(aggregates)
+    assert_rows_equal(structured_data, baseline_tables['structured_data'])
+    assert_rows_equal(second_table_data, baseline_tables['second_table_data'])
+    assert stats['rows'] == 500
+
+
+def test_chunked_csv_sums_like_chunked_frame(report_csv):
+    # Порции те же и объединяются в том же порядке - суммы совпадают до последнего знака
+    from_file = processor.build_report_tables(processor.aggregate_csv_chunks(report_csv, 70))
+
+    from_frame = processor.build_report_tables(
+        processor.aggregate_report(processor.read_wb_report(report_csv), chunk_rows=70))
+
+    assert from_file == from_frame
+
+
+@pytest.mark.parametrize('chunk_rows', [0, 50])
+def test_report_file_uses_configured_chunks(monkeypatch, report_csv, baseline_tables, chunk_rows):
+    monkeypatch.setattr(processor, 'CHUNK_ROWS', chunk_rows)
+
+    structured_data, second_table_data = processor.summarize_report_file(report_csv)
+
+    assert_rows_equal(structured_data, baseline_tables['structured_data'])
+    assert_rows_equal(second_table_data, baseline_tables['second_table_data'])
+
+
+@pytest.mark.parametrize('file_format', ['csv', 'xlsx'])
+def test_report_rows_skip_rows_without_keys(tmp_path, report_csv, file_format):
+    df = pd.read_csv(report_csv)
+    df.loc[[3, 4, 250], ['Тип документа', 'Обоснование для оплаты']] = None
+    path = str(tmp_path / f'report.{file_format}')
+    if file_format == 'csv':
+        df.to_csv(path, index=False)
+    else:
+        df.to_excel(path, index=False)
+
+    chunks = list(processor.iter_report_rows(path, chunk_rows=100))
+
+    with_keys = (df['Тип документа'].notna() | df['Обоснование для оплаты'].notna()).sum()
+    assert sum(len(chunk) for chunk in chunks) == with_keys < len(df) - 2
+    assert all((chunk['Тип документа'].notna() | chunk['Обоснование для оплаты'].notna()).all() for chunk in chunks)
+
+
+def test_chunked_memory_does_not_grow_with_report(tmp_path):
+    path = generate_report(str(tmp_path / 'report.csv'), 40000, seed=2)
+
+    def peak(func):
+        tracemalloc.start()
+        try:
+            func()
+            return tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    whole = peak(lambda: processor.aggregate_report(processor.read_wb_report(path), chunk_rows=0))
+    chunked = peak(lambda: processor.aggregate_csv_chunks(path, 2000))
+
+    assert chunked < whole / 2
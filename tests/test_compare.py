@@ -0,0 +1,154 @@
+# backend/tests/test_compare.py
+"""Сравнение периодов по суммам отчетов (compare_periods), /api/compare и /api/sellers/<seller>/compare"""
+import io
+import math
+
+import pandas as pd
+import pytest
+
+import processor
+from processor import COLUMN_MAPPING, COMPARISON_CATEGORIES
+from conftest import workbook_snapshot, assert_rows_equal
+
+PERIODS = ['week1', 'week2', 'week3']
+
+
+@pytest.fixture(scope='module')
+def report(report_csv) -> pd.DataFrame:
+    return processor.read_wb_report(report_csv)
+
+
+@pytest.fixture(scope='module')
+def parts(report) -> list:
+    """Отчет, разделенный на три периода"""
+    return [report.iloc[:150], report.iloc[150:320], report.iloc[320:]]
+
+
+@pytest.fixture(scope='module')
+def comparison(parts) -> dict:
+    return processor.compare_periods([(label, processor.aggregate_report(part)) for label, part in zip(PERIODS, parts)])
+
+
+def _change(previous: float, current: float) -> tuple:
+    """Изменение и изменение в процентах, как их считает сравнение (для первого периода - None)"""
+    if previous is None:
+        return None, None
+    return current - previous, (current - previous) / abs(previous) * 100 if previous else None
+
+
+def test_second_table_periods_match_separate_reports(parts, comparison):
+    tables = [processor.create_summary_data(part)[1] for part in parts]
+
+    assert comparison['periods'] == PERIODS
+    assert [row['name'] for row in comparison['second_table']] == [item['name'] for item in tables[0]]
+    for row, items in zip(comparison['second_table'], zip(*tables)):
+        assert row['amounts'] == pytest.approx([item['amount'] for item in items], rel=1e-12, abs=1e-9)
+        assert row['percents'] == pytest.approx([item['percent'] for item in items], rel=1e-12, abs=1e-9)
+        for position, amount in enumerate(row['amounts']):
+            delta, percent = _change(row['amounts'][position - 1] if position else None, amount)
+            assert row['deltas'][position] == pytest.approx(delta)
+            assert row['delta_percents'][position] == pytest.approx(percent)
+
+
+def test_supplies_match_per_period_sums(report_csv, comparison):
+    raw = pd.read_csv(report_csv)[list(COLUMN_MAPPING)].rename(columns=COLUMN_MAPPING)
+    bounds = [(0, 150), (150, 320), (320, len(raw))]
+    expected = {}
+    for position, (start, end) in enumerate(bounds):
+        period = raw.iloc[start:end]
+        period = period[period['J'].isin(COMPARISON_CATEGORIES) & (period['J'] == period['K']) & period['B'].notna()]
+        for (category, supply), rows in period.groupby(['J', 'B']):
+            totals = expected.setdefault((category, int(supply)), {'qty': [0] * 3, 'to_seller': [0] * 3})
+            totals['qty'][position] = math.fsum(rows['N'].dropna())
+            totals['to_seller'][position] = math.fsum(rows['AH'].dropna())
+
+    rows = comparison['supplies']
+
+    assert [(row['category'], row['supply']) for row in rows] == sorted(
+        expected, key=lambda key: (COMPARISON_CATEGORIES.index(key[0]), key[1]))
+    for row in rows:
+        totals = expected[(row['category'], row['supply'])]
+        assert row['qty'] == pytest.approx(totals['qty'], abs=1e-9)
+        assert row['to_seller'] == pytest.approx(totals['to_seller'], abs=1e-9)
+        assert row['qty_deltas'][0] is None
+        assert row['qty_deltas'][1:] == pytest.approx([b - a for a, b in zip(row['qty'], row['qty'][1:])])
+
+
+def test_same_period_twice_has_no_changes(report):
+    aggregates = processor.aggregate_report(report)
+
+    comparison = processor.compare_periods([('a', aggregates), ('b', aggregates)])
+
+    assert all(row['deltas'] == [None, 0] for row in comparison['second_table'])
+    assert all(row['to_seller_deltas'] == [None, 0] for row in comparison['supplies'])
+
+
+def test_comparison_workbook_lists_periods(tmp_path, comparison):
+    path = str(tmp_path / 'compare.xlsx')
+
+    processor.create_comparison_excel(comparison, path)
+
+    sheets = workbook_snapshot(path)
+    assert list(sheets) == ['Сравнение', 'Поставки']
+    header = sheets['Сравнение']['rows'][0]['values']
+    assert header == ['Статья', 'Сумма week1', 'Сумма week2', 'Изменение', 'Изменение, %',
+                      'Сумма week3', 'Изменение', 'Изменение, %']
+    assert len(sheets['Сравнение']['rows']) == len(comparison['second_table']) + 1
+    assert len(sheets['Поставки']['rows']) == len(comparison['supplies']) + 1
+
+
+def _weeks(report_csv, marker: int) -> list:
+    """Три CSV-файла периодов; marker меняет содержимое файлов, чтобы они не были в кэше"""
+    with open(report_csv, 'rb') as source:
+        header, *lines = source.read().splitlines(keepends=True)
+    return [header + b''.join(lines[start:end]) + b'\n' * marker for start, end in [(0, 150), (150, 320), (320, None)]]
+
+
+def test_compare_endpoint_reuses_report_sums(client, app_module, monkeypatch, report_csv):
+    parsed = []
+    run_aggregate = app_module.run_aggregate
+    monkeypatch.setattr(app_module, 'run_aggregate', lambda *args: parsed.append(1) or run_aggregate(*args))
+    weeks = _weeks(report_csv, 4000)
+
+    def compare(count: int):
+        files = [(io.BytesIO(data), f'{label}.csv') for label, data in zip(PERIODS, weeks[:count])]
+        return client.post('/api/compare', data={'files': files})
+
+    first = compare(2)
+    everything = compare(3)
+    again = compare(3)
+
+    assert first.status_code == everything.status_code == again.status_code == 200
+    assert len(parsed) == 3
+    assert (everything.get_json()['cached'], again.get_json()['cached']) == (False, True)
+    expected = processor.compare_periods(
+        [(label, processor.aggregate_report(processor.read_wb_report(io.BytesIO(data), 'csv')))
+         for label, data in zip(PERIODS, weeks)])
+    result = everything.get_json()
+    assert result['periods'] == PERIODS
+    for row, expected_row in zip(result['second_table'], expected['second_table']):
+        assert row == pytest.approx(expected_row, rel=1e-9, abs=1e-6)
+    assert client.get(result['download_url']).status_code == 200
+    single = client.post('/api/compare', data={'files': [(io.BytesIO(weeks[0]), 'week1.csv')]})
+    assert single.status_code == 400
+
+
+def test_seller_compare_matches_uploaded_comparison(client, report_csv):
+    weeks = _weeks(report_csv, 5000)
+    url = '/api/sellers/compare-s1/reports?date_from={0}&date_to={1}'
+    dates = [('2024-03-04', '2024-03-10'), ('2024-03-11', '2024-03-17'), ('2024-03-18', '2024-03-24')]
+    for data, label, period in zip(weeks, PERIODS, dates):
+        response = client.post(url.format(*period), data={'file': (io.BytesIO(data), f'{label}.csv')})
+        assert response.status_code == 200
+
+    seller = client.get('/api/sellers/compare-s1/compare?date_from=2024-03-11').get_json()
+    uploaded = client.post('/api/compare', data={
+        'files': [(io.BytesIO(data), f'{label}.csv') for label, data in zip(PERIODS[1:], weeks[1:])]}).get_json()
+
+    assert seller['periods'] == ['week2', 'week3'] == uploaded['periods']
+    assert len(seller['reports']) == 2
+    for row, expected_row in zip(seller['second_table'], uploaded['second_table']):
+        assert row == pytest.approx(expected_row, rel=1e-9, abs=1e-6)
+    assert_rows_equal(seller['supplies'], uploaded['supplies'])
+    too_few = client.get('/api/sellers/compare-s1/compare?date_from=2024-03-18')
+    assert too_few.status_code == 400
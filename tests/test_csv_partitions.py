@@ -0,0 +1,110 @@
+# backend/tests/test_csv_partitions.py
+"""Деление CSV-отчета на части (csv_partitions) и разбор частей (aggregate_csv_range)"""
+import pytest
+
+import processor
+from benchmarks.generate_report import generate_report
+
+ROWS = 3000
+CHUNK_ROWS = 250
+BRAND = ',Бренд,'.encode('utf-8')
+
+
+def _with_quoted_newlines(data: bytes) -> bytes:
+    return data.replace(BRAND, ',"Бр\nенд, ""с кавычками""",'.encode('utf-8'), 40)
+
+
+def _with_stray_quote(data: bytes) -> bytes:
+    return data.replace(BRAND, ',Бр"енд,'.encode('utf-8'), 1)
+
+
+def _with_stray_quotes(data: bytes) -> bytes:
+    # Кавычка не в начале поля - обычный символ, в том числе после закрывающей кавычки
+    data = data.replace(BRAND, ',Бр"ен"д,'.encode('utf-8'), 7)
+    return data.replace(BRAND, ',"Бр"енд,'.encode('utf-8'), 5)
+
+
+def _with_crlf(data: bytes) -> bytes:
+    return data.replace(b'\n', b'\r\n')
+
+
+def _with_blank_lines(data: bytes) -> bytes:
+    return data.replace(b'\n', b'\n\n', 300)
+
+
+TRANSFORMS = {
+    'plain': lambda data: data,
+    'quoted_newlines': _with_quoted_newlines,
+    'stray_quote': _with_stray_quote,
+    'stray_quotes': _with_stray_quotes,
+    'crlf': _with_crlf,
+    'blank_lines': _with_blank_lines,
+    'crlf_quoted_newlines_blank_lines': lambda data: _with_crlf(_with_blank_lines(_with_quoted_newlines(data))),
+}
+
+
+@pytest.fixture(scope='module')
+def report_bytes(tmp_path_factory):
+    path = tmp_path_factory.mktemp('report') / 'report.csv'
+    generate_report(str(path), ROWS, seed=1)
+    return path.read_bytes()
+
+
+def _write_report(path, report_bytes: bytes, transform) -> str:
+    """Отчет с измененными строками данных; заголовок остается как есть"""
+    header_end = report_bytes.index(b'\n') + 1
+    path.write_bytes(report_bytes[:header_end] + transform(report_bytes[header_end:]))
+    return str(path)
+
+
+def _partitioned(path: str, partitions: int) -> tuple:
+    header_line, ranges = processor.csv_partitions(path, partitions, CHUNK_ROWS)
+    aggregates = None
+    for start, end in ranges:
+        for partial in processor.aggregate_csv_range(path, header_line, start, end, CHUNK_ROWS):
+            aggregates = processor.fold_aggregates(aggregates, partial)
+    return ranges, aggregates
+
+
+@pytest.mark.parametrize('block_bytes', [None, 61])
+@pytest.mark.parametrize('name', list(TRANSFORMS))
+def test_partitions_match_serial_parse(tmp_path, monkeypatch, report_bytes, name, block_bytes):
+    if block_bytes:
+        # Маленькие блоки: кавычки и переводы строк попадают на границы блоков
+        monkeypatch.setattr(processor, '_SCAN_BLOCK_BYTES', block_bytes)
+    path = _write_report(tmp_path / 'report.csv', report_bytes, TRANSFORMS[name])
+
+    ranges, aggregates = _partitioned(path, 4)
+
+    assert len(ranges) == 4
+    expected = processor.aggregate_csv_chunks(path, CHUNK_ROWS)
+    assert processor.build_report_tables(aggregates) == processor.build_report_tables(expected)
+
+
+def test_record_offsets_follow_pandas_quoting(tmp_path):
+    path = tmp_path / 'rows.csv'
+    # Записи: обычная, с кавычкой внутри поля, с переводом строки и удвоенной кавычкой в кавычках,
+    # с кавычкой после закрывающей и (после пустой строки) последняя - ее конец совпадает с концом файла
+    path.write_bytes(b'a,b\n1,x\n2,p"l\n3,"q\n""r"""\n4,"s"t\n\n5,u\n')
+
+    assert processor.csv_record_offsets(str(path), 1, 4) == [8, 14, 26, 33]
+
+
+def test_bare_carriage_return_is_not_partitioned(tmp_path, report_bytes):
+    path = _write_report(tmp_path / 'report.csv', report_bytes, lambda data: data.replace(b'\n', b'\r', 10))
+
+    header_line, ranges = processor.csv_partitions(path, 4, CHUNK_ROWS)
+
+    assert ranges == [(len(header_line), len(report_bytes))]
+
+
+def test_parallel_parse_matches_baseline(report_csv, baseline_tables):
+    from conftest import assert_rows_equal
+
+    aggregates = processor.aggregate_csv_parallel(report_csv, workers=3, chunk_rows=100)
+
+    tables = processor.build_report_tables(aggregates)
+    # Порции те же, что при разборе одним процессом, и объединяются в том же порядке
+    assert tables == processor.build_report_tables(processor.aggregate_csv_chunks(report_csv, 100))
+    assert_rows_equal(tables[0], baseline_tables['structured_data'])
+    assert_rows_equal(tables[1], baseline_tables['second_table_data'])
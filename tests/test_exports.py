@@ -0,0 +1,126 @@
+# backend/tests/test_exports.py
+"""Выгрузка таблиц и строк отчета (exports) и эндпоинт /api/export"""
+import io
+import gzip
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import exports
+import processor
+
+
+@pytest.fixture
+def frames() -> list:
+    """Порции с текстом (в том числе category), числами и пропусками"""
+    first = pd.DataFrame({'Тип документа': pd.Categorical(['Продажа', 'Возврат', None]),
+                          'Кол-во': [1.0, np.nan, 3.0], 'Уровень': np.array([0, 1, 1], dtype=np.int64)})
+    second = pd.DataFrame({'Тип документа': pd.Categorical(['Продажа, "акция"'] * 8),
+                           'Кол-во': np.arange(8) / 3, 'Уровень': np.zeros(8, dtype=np.int64)})
+    return [first, second.iloc[:0], second]
+
+
+def _export(frames, export_format: str) -> bytes:
+    return b''.join(exports.iter_export(iter(frames), export_format))
+
+
+def test_csv_matches_whole_frame(monkeypatch, frames):
+    monkeypatch.setattr(exports, 'TEXT_BATCH_ROWS', 3)
+
+    data = _export(frames, 'csv')
+
+    expected = pd.concat(frames, ignore_index=True).to_csv(index=False, lineterminator='\n')
+    assert data.decode('utf-8') == expected
+
+
+def test_ndjson_rows_keep_values(monkeypatch, frames):
+    monkeypatch.setattr(exports, 'TEXT_BATCH_ROWS', 3)
+
+    lines = _export(frames, 'ndjson').decode('utf-8').splitlines()
+
+    assert len(lines) == 11
+    assert json.loads(lines[1]) == {'Тип документа': 'Возврат', 'Кол-во': None, 'Уровень': 1}
+    assert json.loads(lines[2])['Тип документа'] is None
+    assert [json.loads(line)['Кол-во'] for line in lines[3:]] == (np.arange(8) / 3).tolist()
+
+
+def test_gzip_stream_decompresses_to_input(frames):
+    chunks = list(exports.iter_export(iter(frames), 'csv'))
+
+    assert gzip.decompress(b''.join(exports.iter_gzip(iter(chunks)))) == b''.join(chunks)
+
+
+@pytest.mark.parametrize('export_format', ['parquet', 'arrow'])
+def test_arrow_formats_round_trip(frames, export_format):
+    pa = pytest.importorskip('pyarrow')
+
+    data = _export(frames, export_format)
+
+    if export_format == 'parquet':
+        import pyarrow.parquet as pq
+        table = pq.read_table(io.BytesIO(data))
+    else:
+        table = pa.ipc.open_stream(data).read_all()
+    expected = pd.concat(frames, ignore_index=True).astype({'Тип документа': object})
+    pd.testing.assert_frame_equal(table.to_pandas(), expected)
+
+
+def test_unavailable_formats_are_rejected(monkeypatch):
+    with pytest.raises(exports.ExportFormatError, match='xml'):
+        exports.check_format('xml')
+    monkeypatch.setattr(exports, 'pyarrow_available', lambda: False)
+    with pytest.raises(exports.ExportFormatError, match='pyarrow'):
+        exports.check_format('parquet')
+
+
+def _post(client, report_bytes: bytes, query: str, **kwargs):
+    return client.post(f'/api/export?{query}', data={'file': (io.BytesIO(report_bytes), 'week.csv')}, **kwargs)
+
+
+@pytest.fixture(scope='module')
+def report_bytes(report_csv) -> bytes:
+    with open(report_csv, 'rb') as source:
+        return source.read()
+
+
+def test_summary_export_matches_baseline(client, report_bytes, baseline_tables):
+    response = _post(client, report_bytes, 'format=csv&table=summary')
+
+    assert response.status_code == 200
+    assert response.headers['Content-Disposition'] == 'attachment; filename="week_summary.csv"'
+    exported = pd.read_csv(io.BytesIO(response.data))
+    expected = processor.summary_table_frame(baseline_tables['structured_data'])
+    pd.testing.assert_frame_equal(exported, expected, check_dtype=False, rtol=1e-9)
+
+
+def test_russia_export_is_gzipped_for_clients_that_accept_it(client, report_bytes, baseline_tables):
+    response = _post(client, report_bytes, 'format=ndjson&table=russia', headers={'Accept-Encoding': 'gzip'})
+
+    assert response.status_code == 200
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in response.headers['Vary']
+    rows = [json.loads(line) for line in gzip.decompress(response.data).decode('utf-8').splitlines()]
+    assert [row['Статья'] for row in rows] == [row['name'] for row in baseline_tables['second_table_data']]
+    assert [row['Сумма'] for row in rows] == pytest.approx([row['amount'] for row in baseline_tables['second_table_data']])
+
+
+def test_rows_export_streams_report_rows(client, report_csv, report_bytes):
+    response = _post(client, report_bytes, 'format=csv&table=rows')
+
+    assert response.status_code == 200
+    exported = pd.read_csv(io.BytesIO(response.data))
+    expected = pd.concat(processor.iter_report_rows(report_csv), ignore_index=True)
+    assert list(exported.columns) == list(expected.columns)
+    assert len(exported) == len(expected)
+    assert exported['Кол-во'].sum() == pytest.approx(expected['Кол-во'].sum())
+
+
+def test_export_parameters_are_checked(client, monkeypatch, report_bytes):
+    monkeypatch.setattr(exports, 'pyarrow_available', lambda: False)
+
+    assert _post(client, report_bytes, 'format=xml').status_code == 400
+    assert _post(client, report_bytes, 'table=everything').status_code == 400
+    response = _post(client, report_bytes, 'format=parquet')
+    assert response.status_code == 501 and 'pyarrow' in response.get_json()['error']
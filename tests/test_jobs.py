@@ -0,0 +1,120 @@
+# backend/tests/test_jobs.py
+"""Очередь задач на SQLite (jobs.JobQueue): выполнение, повторные попытки, удаление файлов задач"""
+import time
+
+import pytest
+
+from jobs import JobQueue, RUNNING, DONE, FAILED
+
+
+def _wait(condition, timeout: float = 10):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "условие не выполнилось за отведенное время"
+        time.sleep(0.02)
+
+
+@pytest.fixture
+def input_file(tmp_path):
+    path = tmp_path / 'upload.csv'
+    path.write_bytes(b'report')
+    return str(path)
+
+
+def _queue(tmp_path, handler=None, **kwargs) -> JobQueue:
+    return JobQueue(str(tmp_path / 'jobs.sqlite3'), handler=handler, workers=1, poll_interval=0.05, **kwargs)
+
+
+def _abandon(queue: JobQueue, job_id: str, attempts: int):
+    """Задача, обработчик которой перестал подавать heartbeat после attempts попыток"""
+    with queue._connect() as conn:
+        conn.execute("UPDATE jobs SET status = ?, owner = 'упавший', heartbeat_at = ?, attempts = ? WHERE id = ?",
+                     (RUNNING, time.time() - queue.lease_seconds - 1, attempts, job_id))
+
+
+@pytest.mark.parametrize('fails', [False, True])
+def test_finished_job_removes_input(tmp_path, input_file, fails):
+    def handler(job_id, input_path):
+        with open(input_path, 'rb') as source:
+            assert source.read() == b'report'
+        if fails:
+            raise ValueError('нет столбцов')
+        return 'result.xlsx'
+
+    queue = _queue(tmp_path, handler)
+    queue.start()
+    try:
+        job_id = queue.submit(input_file)
+        _wait(lambda: queue.get(job_id)['status'] in (DONE, FAILED))
+    finally:
+        queue.stop()
+
+    job = queue.get(job_id)
+    if fails:
+        assert (job['status'], job['error']) == (FAILED, 'нет столбцов')
+    else:
+        assert (job['status'], job['result_filename']) == (DONE, 'result.xlsx')
+    assert job['attempts'] == 1
+    _wait(lambda: not (tmp_path / 'upload.csv').exists())
+
+
+def test_abandoned_job_is_requeued_with_its_input(tmp_path, input_file):
+    queue = _queue(tmp_path, max_attempts=3)
+    job_id = queue.submit(input_file)
+    _abandon(queue, job_id, attempts=1)
+
+    claimed = queue._claim()
+
+    assert dict(claimed) == {'id': job_id, 'input_path': input_file}
+    job = queue.get(job_id)
+    assert (job['status'], job['attempts'], job['owner']) == (RUNNING, 2, queue.owner)
+    assert (tmp_path / 'upload.csv').exists()
+
+
+def test_job_out_of_attempts_fails_and_removes_input(tmp_path, input_file):
+    queue = _queue(tmp_path, max_attempts=3)
+    job_id = queue.submit(input_file)
+    _abandon(queue, job_id, attempts=3)
+
+    assert queue._claim() is None
+
+    job = queue.get(job_id)
+    assert (job['status'], job['error']) == (FAILED, 'Превышено число попыток обработки')
+    assert not (tmp_path / 'upload.csv').exists()
+    assert queue.stats()['failed'] == 1
+
+
+def test_result_of_lost_lease_is_not_recorded(tmp_path, input_file):
+    queue = _queue(tmp_path)
+    job_id = queue.submit(input_file)
+    queue._claim()
+    # Задачу забрал другой обработчик - файл нужен ему
+    with queue._connect() as conn:
+        conn.execute("UPDATE jobs SET owner = 'другой' WHERE id = ?", (job_id,))
+
+    queue._finish(job_id, input_file, DONE, result_filename='result.xlsx')
+
+    assert queue.get(job_id)['status'] == RUNNING
+    assert (tmp_path / 'upload.csv').exists()
+
+
+def test_worker_loop_purges_expired_jobs(tmp_path, input_file):
+    queue = _queue(tmp_path, retention_seconds=60, purge_interval=0)
+    expired = queue.submit(input_file)
+    recent = queue.submit(str(tmp_path / 'recent.csv'))
+    with queue._connect() as conn:
+        conn.execute("UPDATE jobs SET status = ?, finished_at = ? WHERE id = ?", (FAILED, time.time() - 120, expired))
+        conn.execute("UPDATE jobs SET status = ?, finished_at = ? WHERE id = ?", (DONE, time.time(), recent))
+
+    queue.start()
+    try:
+        # Записи удаляются и после запуска - пока обработчики ждут задач
+        _wait(lambda: queue.get(expired) is None)
+        with queue._connect() as conn:
+            conn.execute("UPDATE jobs SET finished_at = ? WHERE id = ?", (time.time() - 120, recent))
+        _wait(lambda: queue.get(recent) is None)
+    finally:
+        queue.stop()
+
+    assert not (tmp_path / 'upload.csv').exists()
+    assert queue.stats()['queue_depth'] == 0
@@ -0,0 +1,76 @@
+# backend/tests/test_metrics.py
+"""Метрики в формате Prometheus (metrics) и эндпоинт /metrics"""
+import io
+
+import pytest
+
+import metrics
+
+
+def _sample(text: str, name: str) -> float:
+    """Значение строки метрики с именем и метками name (0, если строки нет)"""
+    for line in text.splitlines():
+        if line.startswith(name + ' '):
+            return float(line.rsplit(' ', 1)[1])
+    return 0
+
+
+def test_metrics_are_rendered_in_text_format():
+    registry = metrics.Registry()
+    requests = metrics.Counter('requests_total', 'Запросы', ['endpoint'], registry=registry)
+    metrics.Gauge('depth', 'Глубина очереди', registry=registry, callback=lambda: 3)
+    duration = metrics.Histogram('duration_seconds', 'Длительность', ['stage'], registry=registry, buckets=(1, 0.1))
+
+    requests.inc(endpoint='upload')
+    requests.inc(2, endpoint='upload')
+    requests.inc(endpoint='say "hi"\n')
+    for value in (0.05, 0.1, 0.5, 7):
+        duration.observe(value, stage='parse')
+
+    assert registry.render() == '\n'.join([
+        '# HELP requests_total Запросы',
+        '# TYPE requests_total counter',
+        'requests_total{endpoint="upload"} 3',
+        'requests_total{endpoint="say \\"hi\\"\\n"} 1',
+        '# HELP depth Глубина очереди',
+        '# TYPE depth gauge',
+        'depth 3',
+        '# HELP duration_seconds Длительность',
+        '# TYPE duration_seconds histogram',
+        'duration_seconds_bucket{stage="parse",le="0.1"} 2',
+        'duration_seconds_bucket{stage="parse",le="1"} 3',
+        'duration_seconds_bucket{stage="parse",le="+Inf"} 4',
+        'duration_seconds_sum{stage="parse"} 7.65',
+        'duration_seconds_count{stage="parse"} 4',
+    ]) + '\n'
+
+
+def test_wrong_labels_and_duplicate_names_are_rejected():
+    registry = metrics.Registry()
+    counter = metrics.Counter('errors_total', 'Ошибки', ['exception'], registry=registry)
+
+    with pytest.raises(ValueError, match='exception'):
+        counter.inc(endpoint='upload')
+    with pytest.raises(ValueError, match='errors_total'):
+        metrics.Gauge('errors_total', 'Ошибки', registry=registry)
+
+
+def test_processing_is_counted_in_metrics_endpoint(client, report_csv):
+    before = client.get('/metrics').get_data(as_text=True)
+    with open(report_csv, 'rb') as source:
+        # Пустые строки в конце меняют ключ кэша - отчет обрабатывается заново
+        report = source.read() + b'\n' * 1000
+
+    response = client.post('/api/summary', data={'file': (io.BytesIO(report), 'metrics.csv')})
+    after = client.get('/metrics')
+
+    assert response.status_code == 200
+    assert after.content_type == metrics.CONTENT_TYPE
+    text = after.get_data(as_text=True)
+    for name, delta in [('wb_requests_total{endpoint="summary",status="200"}', 1),
+                        ('wb_stage_duration_seconds_count{stage="parse"}', 1),
+                        ('wb_stage_duration_seconds_count{stage="aggregate"}', 1),
+                        ('wb_rows_processed_total', 500),
+                        ('wb_result_cache_requests_total{result="miss"}', 1)]:
+        assert _sample(text, name) - _sample(before, name) == delta, name
+    assert _sample(text, 'wb_requests_in_flight{endpoint="summary"}') == 0
@@ -0,0 +1,112 @@
+# backend/tests/test_process_pool.py
+"""Пул процессов (process_pool.ProcessPool): результаты, ограничения времени и памяти, падения и перезапуск"""
+import os
+import time
+import threading
+
+import pytest
+
+import processor
+from process_pool import ProcessPool, JobTimeoutError, JobMemoryError, WorkerCrashedError
+from conftest import assert_rows_equal
+
+
+def _pid() -> int:
+    return os.getpid()
+
+
+def _sleep(seconds: float) -> int:
+    time.sleep(seconds)
+    return os.getpid()
+
+
+def _allocate(mb: int) -> int:
+    block = bytearray(mb * 1024 * 1024)
+    time.sleep(5)
+    return len(block)
+
+
+def _exit(code: int):
+    os._exit(code)
+
+
+def _fail(message: str):
+    raise ValueError(message)
+
+
+def _count_rows(path: str, stats: dict = None) -> int:
+    stats['rows'] = len(processor.read_wb_report(path))
+    return stats['rows']
+
+
+@pytest.fixture
+def pool():
+    pool = ProcessPool(max_workers=2, max_jobs_per_child=0, timeout=30, preload=())
+    yield pool
+    pool.shutdown()
+
+
+def test_report_is_processed_in_worker(pool, report_csv, baseline_tables):
+    structured_data, second_table_data = pool.run(processor.summarize_report_file, report_csv)
+
+    assert_rows_equal(structured_data, baseline_tables['structured_data'])
+    assert_rows_equal(second_table_data, baseline_tables['second_table_data'])
+    stats = {}
+    assert pool.run(_count_rows, report_csv, stats=stats) == 500
+    assert stats['rows'] == 500 and stats['peak_rss_bytes'] > 0
+
+
+def test_task_error_keeps_worker(pool):
+    pid = pool.run(_pid)
+
+    with pytest.raises(ValueError, match='нет столбцов'):
+        pool.run(_fail, 'нет столбцов')
+    # Аргументы не сериализуются - задача в процесс не передается
+    with pytest.raises(TypeError, match='pickle'):
+        pool.run(_sleep, threading.Lock())
+
+    assert pool.run(_pid) == pid
+    assert pool.in_flight == 0
+
+
+def test_timeout_kills_worker(pool):
+    pid = pool.run(_pid)
+
+    with pytest.raises(JobTimeoutError):
+        pool.run(_sleep, 10, timeout=0.5)
+
+    assert pool.run(_pid) != pid
+    assert not any(worker.process.pid == pid for worker in pool._workers)
+
+
+def test_crashed_worker_is_replaced(pool):
+    pid = pool.run(_pid)
+
+    with pytest.raises(WorkerCrashedError, match='кодом 3'):
+        pool.run(_exit, 3)
+
+    assert pool.run(_pid) != pid
+    assert pool.in_flight == 0
+
+
+def test_memory_limit_kills_worker():
+    pool = ProcessPool(max_workers=1, max_jobs_per_child=0, timeout=30, memory_limit_mb=150, preload=())
+    try:
+        pid = pool.run(_pid)
+
+        with pytest.raises(JobMemoryError, match='150 МБ'):
+            pool.run(_allocate, 300)
+
+        assert pool.run(_pid) != pid
+    finally:
+        pool.shutdown()
+
+
+def test_worker_is_recycled_after_max_jobs():
+    pool = ProcessPool(max_workers=1, max_jobs_per_child=2, timeout=30, preload=())
+    try:
+        pids = [pool.run(_pid) for _ in range(5)]
+    finally:
+        pool.shutdown()
+
+    assert pids[0] == pids[1] != pids[2] == pids[3] != pids[4]
@@ -0,0 +1,68 @@
+# backend/tests/test_profiling.py
+"""Профилирование отдельной обработки (profiling.profile_call) и запросы с ?profile=1"""
+import io
+import pstats
+
+import pytest
+
+import processor
+import profiling
+from conftest import workbook_snapshot, assert_snapshots_equal
+
+TOKEN = 'profiling-secret'
+
+
+def _fail(stats=None):
+    stats['rows'] = 3
+    raise ValueError('нет столбцов')
+
+
+def test_profile_is_written_for_success_and_error(tmp_path, report_csv):
+    stats = {}
+
+    tables = profiling.profile_call(processor.summarize_report_file, str(tmp_path), 'a' * 32, report_csv, stats=stats)
+    with pytest.raises(ValueError):
+        profiling.profile_call(_fail, str(tmp_path), 'b' * 32, stats={})
+
+    assert tables == processor.summarize_report_file(report_csv)
+    assert stats['rows'] == 500 and 'parse_seconds' in stats
+    report = (tmp_path / f'profile_{"a" * 32}.txt').read_text(encoding='utf-8')
+    assert 'processor.summarize_report_file' in report
+    pstats.Stats(str(tmp_path / f'profile_{"a" * 32}.prof'))
+    assert "ValueError('нет столбцов')" in (tmp_path / f'profile_{"b" * 32}.txt').read_text(encoding='utf-8')
+    assert (tmp_path / f'profile_{"b" * 32}.prof').exists()
+
+
+def test_profiled_upload_requires_token(client, app_module, monkeypatch, tmp_path, report_csv, baseline_workbook):
+    monkeypatch.setattr(app_module, 'PROFILING_TOKEN', TOKEN)
+    with open(report_csv, 'rb') as source:
+        report = source.read()
+
+    def upload(headers):
+        return client.post('/api/upload?profile=1', data={'file': (io.BytesIO(report), 'week.csv')}, headers=headers)
+
+    assert upload({}).status_code == 403
+    assert upload({'X-Profiling-Token': 'другой'}).status_code == 403
+    response = upload({'X-Profiling-Token': TOKEN})
+
+    assert response.status_code == 200
+    result = response.get_json()
+    assert result['cached'] is False and result['result_filename'].startswith(profiling.PROFILE_PREFIX)
+    path = tmp_path / 'result.xlsx'
+    path.write_bytes(client.get(result['download_url']).data)
+    assert_snapshots_equal(workbook_snapshot(str(path)), baseline_workbook)
+
+    assert client.get(result['profile_url']).status_code == 403
+    text = client.get(result['profile_url'], headers={'X-Profiling-Token': TOKEN})
+    assert text.status_code == 200 and 'process_wb_report_file' in text.get_data(as_text=True)
+    binary = client.get(result['profile_url'] + '?format=pstats', headers={'X-Profiling-Token': TOKEN})
+    assert binary.status_code == 200 and binary.data
+    assert client.get('/api/profiles/..%2Fjobs', headers={'X-Profiling-Token': TOKEN}).status_code == 404
+
+
+def test_profiling_is_disabled_without_configured_token(client, app_module, monkeypatch):
+    monkeypatch.setattr(app_module, 'PROFILING_TOKEN', '')
+
+    response = client.get('/api/profiles/' + 'a' * 32, headers={'X-Profiling-Token': ''})
+
+    assert response.status_code == 403
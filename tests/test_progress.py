@@ -0,0 +1,121 @@
+# backend/tests/test_progress.py
+"""Ход обработки по этапам (progress) и поток Server-Sent Events"""
+import io
+import json
+import pickle
+import threading
+
+import pytest
+
+import processor
+import progress
+from progress import ProgressBoard, ProgressStats
+from conftest import assert_rows_equal
+
+
+def _events(stream) -> list:
+    """Поток Server-Sent Events - список (событие, данные); комментарии keepalive - ('keepalive', None)"""
+    events = []
+    for message in ''.join(stream).split('\n\n')[:-1]:
+        if message.startswith(':'):
+            events.append(('keepalive', None))
+            continue
+        fields = dict(line.split(': ', 1) for line in message.split('\n'))
+        events.append((fields['event'], json.loads(fields['data'])))
+    return events
+
+
+def test_updates_are_throttled_but_last_value_is_kept():
+    published = []
+    stats = ProgressStats(published.append, interval=60)
+
+    for rows in range(1, 5):
+        stats.progress('parse', rows=rows)
+    stats.progress('aggregate', categories=1)
+    stats.stage_finished('parse')
+
+    assert published[0] == {'stage': 'parse', 'rows': 1}
+    assert sorted(published[1:], key=lambda update: update['stage']) == [
+        {'stage': 'aggregate', 'categories': 1}, {'stage': 'parse', 'rows': 4}]
+    # В другой процесс передается только interval
+    copy = pickle.loads(pickle.dumps(stats))
+    assert (copy.publish, copy.interval) == (None, 60)
+
+
+def test_report_progress_does_not_change_result(report_csv, baseline_tables):
+    published = []
+    stats = ProgressStats(published.append, interval=0)
+
+    structured_data, second_table_data = processor.summarize_report_file(report_csv, stats=stats)
+
+    assert_rows_equal(structured_data, baseline_tables['structured_data'])
+    assert_rows_equal(second_table_data, baseline_tables['second_table_data'])
+    parse = [update for update in published if update['stage'] == 'parse']
+    assert parse[-1]['rows'] == stats['rows'] == 500
+    assert [update['rows'] for update in parse] == sorted(update['rows'] for update in parse)
+    assert published[-1]['stage'] == 'aggregate'
+    assert published[-1]['categories'] == published[-1]['categories_total']
+
+
+def test_events_follow_tracked_processing():
+    board = ProgressBoard(keepalive=60)
+    started, finish = threading.Event(), threading.Event()
+
+    def run():
+        with board.tracking('job-1'):
+            stats = board.stats()
+            stats.progress('parse', rows=10)
+            started.set()
+            finish.wait(10)
+            # Обновление чаще interval отложено и передается в конце этапа
+            stats.progress('parse', rows=20)
+            stats.stage_finished('parse')
+            board.finish('job-1', {'download_url': '/api/download/x.xlsx'})
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    started.wait(10)
+    stream = board.events('job-1')
+    first = next(stream)
+    finish.set()
+    events = _events([first, *stream])
+    thread.join(10)
+
+    assert events[0][0] == progress.PROGRESS
+    assert (events[0][1]['stage'], events[0][1]['stages']) == ('parse', {'parse': {'rows': 10}})
+    name, data = events[-1]
+    assert name == progress.DONE
+    assert data['stages'] == {'parse': {'rows': 20}}
+    assert data['result'] == {'download_url': '/api/download/x.xlsx'}
+    assert board.current() is None
+
+
+def test_failed_and_unknown_processing_end_the_stream():
+    board = ProgressBoard(ttl=0.2, keepalive=0.05)
+    with pytest.raises(ValueError):
+        with board.tracking('job-2'):
+            raise ValueError('нет столбцов')
+
+    [(name, data)] = _events(board.events('job-2'))
+    assert (name, data['error']) == (progress.ERROR, 'нет столбцов')
+    events = _events(board.events('job-3'))
+    assert events[-1] == (progress.UNKNOWN, {'error': 'Обработка не найдена'})
+    assert ('keepalive', None) in events
+
+
+def test_upload_progress_stream_ends_with_result(client, report_csv, baseline_tables):
+    with open(report_csv, 'rb') as source:
+        report = source.read() + b'\n' * 3000
+
+    response = client.post('/api/summary?progress_id=progress-test-1', data={'file': (io.BytesIO(report), 'week.csv')})
+
+    assert response.status_code == 200
+    assert_rows_equal(response.get_json()['structured_data'], baseline_tables['structured_data'])
+    stream = client.get('/api/progress/progress-test-1')
+    assert stream.mimetype == 'text/event-stream'
+    name, data = _events([stream.get_data(as_text=True)])[-1]
+    assert name == progress.DONE
+    assert data['result']['download_url'] == response.get_json()['download_url']
+    assert data['stages']['parse']['rows'] == 500
+    assert client.get('/api/progress/bad id').status_code == 400
+    assert client.post('/api/summary?progress_id=short', data={'file': (io.BytesIO(report), 'week.csv')}).status_code == 400
@@ -0,0 +1,167 @@
+# backend/tests/test_readers.py
+"""Чтение отчетов: xlsx (read_xlsx_columns, iter_xlsx_chunks) и CSV (read_csv_columns, iter_csv_chunks)"""
+import io
+
+import numpy as np
+import pandas as pd
+import pytest
+from openpyxl import Workbook
+
+import processor
+from processor import COLUMN_MAPPING, TEXT_COLUMNS
+
+NUMERIC_COLUMNS = [name for name in COLUMN_MAPPING if name not in TEXT_COLUMNS]
+TO_SELLER = 'К перечислению Продавцу за реализованный Товар'
+
+
+def _write_xlsx(path, rows) -> str:
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet('Sheet1')
+    for row in rows:
+        ws.append(row)
+    wb.save(path)
+    return str(path)
+
+
+def _stray_text_rows(report_csv) -> list:
+    """Заголовок и строки отчета, в одной из которых вместо суммы к перечислению - текст"""
+    df = pd.read_csv(report_csv, nrows=20)
+    rows = [list(df.columns)] + [list(values) for values in df.astype(object).where(df.notna(), None).itertuples(
+        index=False, name=None)]
+    rows[3][list(df.columns).index(TO_SELLER)] = 'н/д'
+    return rows
+
+
+def _plain(df: pd.DataFrame) -> pd.DataFrame:
+    """Текстовые столбцы - object: наборы категорий порций и файлов разных форматов различаются"""
+    return df.astype({name: object for name in TEXT_COLUMNS if name in df})
+
+
+def test_csv_and_xlsx_readers_agree(report_csv, report_xlsx):
+    from_csv = processor.read_csv_columns(report_csv)
+    from_xlsx = processor.read_xlsx_columns(report_xlsx)
+
+    assert sorted(from_csv.columns) == sorted(COLUMN_MAPPING)
+    for df in (from_csv, from_xlsx):
+        assert all(df[name].dtype == np.float64 for name in NUMERIC_COLUMNS)
+        assert all(isinstance(df[name].dtype, pd.CategoricalDtype) for name in TEXT_COLUMNS)
+    # Строки без значений в нужных столбцах разбор xlsx пропускает - на суммы они не влияют
+    from_csv = from_csv.dropna(how='all').reset_index(drop=True)
+    pd.testing.assert_frame_equal(_plain(from_csv), _plain(from_xlsx))
+
+
+def test_csv_chunks_match_whole_file(report_csv):
+    chunks = list(processor.iter_csv_chunks(report_csv, 120))
+
+    assert len(chunks) == 5
+    whole = pd.concat(map(_plain, chunks), ignore_index=True)
+    pd.testing.assert_frame_equal(whole, _plain(processor.read_csv_columns(report_csv)))
+
+
+@pytest.mark.parametrize('file_format', ['csv', 'xlsx'])
+def test_text_in_numeric_column_becomes_nan(tmp_path, report_csv, file_format):
+    rows = _stray_text_rows(report_csv)
+    if file_format == 'csv':
+        path = tmp_path / 'report.csv'
+        pd.DataFrame(rows[1:], columns=rows[0]).to_csv(path, index=False)
+        path = str(path)
+    else:
+        path = _write_xlsx(tmp_path / 'report.xlsx', rows)
+
+    df = processor.read_wb_report(path)
+
+    assert df[TO_SELLER].dtype == np.float64
+    assert np.isnan(df[TO_SELLER].iloc[2])
+    assert df[TO_SELLER].notna().sum() == len(df) - 1
+    # Порциями - так же, как целиком
+    chunk = next(processor.iter_report_rows(path, chunk_rows=5))
+    assert np.isnan(chunk[TO_SELLER].iloc[2])
+
+
+def test_empty_csv_report_has_schema_columns(report_csv):
+    with open(report_csv, 'rb') as source:
+        header = source.readline()
+
+    chunks = list(processor.iter_csv_chunks(io.BytesIO(header), 100))
+
+    assert len(chunks) == 1 and chunks[0].empty
+    pd.testing.assert_frame_equal(_plain(chunks[0]), _plain(processor.read_csv_columns(io.BytesIO(header))))
+
+
+MAIN_NS = 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'
+REL_NS = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'
+
+
+def _xlsx_archive(sheet_rows: str, shared_strings: list, sheet_path: str = 'worksheets/report.xml') -> io.BytesIO:
+    """Минимальная книга xlsx: лист sheet_path (XML строк sheetData) и таблица общих строк (XML элементов si)"""
+    import zipfile
+
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, 'w') as target:
+        target.writestr('xl/workbook.xml', f'<workbook xmlns="{MAIN_NS}" xmlns:r="{REL_NS}"><sheets>'
+                                           f'<sheet name="Отчет" sheetId="1" r:id="rId7"/></sheets></workbook>')
+        target.writestr('xl/_rels/workbook.xml.rels',
+                        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+                        f'<Relationship Id="rId7" Type="{REL_NS}/worksheet" Target="{sheet_path}"/></Relationships>')
+        target.writestr(f'xl/{sheet_path}', f'<worksheet xmlns="{MAIN_NS}"><dimension ref="A1:C3"/>'
+                                            f'<sheetData>{sheet_rows}</sheetData></worksheet>')
+        target.writestr('xl/sharedStrings.xml', f'<sst xmlns="{MAIN_NS}">{"".join(shared_strings)}</sst>')
+    archive.seek(0)
+    return archive
+
+
+def test_xlsx_reader_resolves_cell_kinds():
+    columns = {'Тип документа': 'J', 'Кол-во': 'N', 'Цена розничная': 'O'}
+    archive = _xlsx_archive(
+        # Заголовок: общая строка, rich text из двух фрагментов и строка в ячейке (inlineStr);
+        # во второй строке ссылок на ячейки нет - ячейки идут подряд
+        '<row r="1"><c r="A1" t="s"><v>0</v></c><c r="B1" t="s"><v>1</v></c>'
+        '<c r="C1" t="inlineStr"><is><t>Цена розничная</t></is></c></row>'
+        '<row r="2"><c t="s"><v>2</v></c><c><v>2</v></c><c><v>1432.5</v></c></row>'
+        '<row r="3"><c r="A3" t="inlineStr"><is><r><t>Воз</t></r><r><t>врат</t></r></is></c>'
+        '<c r="C3" t="str"><v>н/д</v></c></row>'
+        '<row r="4"/>',
+        ['<si><t>Тип документа</t></si>', '<si><r><t>Кол-</t></r><r><t>во</t></r><rPh><t>x</t></rPh></si>',
+         '<si><t>Продажа</t></si>'])
+
+    df = processor.read_xlsx_columns(archive, columns)
+
+    assert list(df.columns) == list(columns)
+    assert df['Тип документа'].tolist() == ['Продажа', 'Возврат']
+    assert df['Кол-во'].tolist()[0] == 2 and np.isnan(df['Кол-во'].iloc[1])
+    assert df['Цена розничная'].tolist()[0] == 1432.5 and np.isnan(df['Цена розничная'].iloc[1])
+
+
+def test_xlsx_header_without_report_columns_is_rejected():
+    archive = _xlsx_archive('<row r="1"><c r="A1" t="inlineStr"><is><t>Дата</t></is></c></row>', [])
+
+    with pytest.raises(processor.ReportHeaderError, match='Тип документа'):
+        processor.read_xlsx_columns(archive)
+
+
+def test_xlsx_reader_matches_read_excel(report_xlsx):
+    # Прежнее чтение - pd.read_excel всего листа; строки без значений в нужных столбцах xlsx-разбор пропускает
+    expected = pd.read_excel(report_xlsx)[list(COLUMN_MAPPING)].dropna(how='all').reset_index(drop=True)
+
+    df = processor.read_xlsx_columns(report_xlsx)
+
+    pd.testing.assert_frame_equal(_plain(df[list(COLUMN_MAPPING)]), expected, check_dtype=False)
+
+
+def test_xlsx_chunks_match_whole_file(report_xlsx):
+    chunks = list(processor.iter_xlsx_chunks(report_xlsx, 100))
+
+    assert [len(chunk) for chunk in chunks] == [100, 100, 100, 100, 97]
+    whole = pd.concat(map(_plain, chunks), ignore_index=True)
+    pd.testing.assert_frame_equal(whole, _plain(processor.read_xlsx_columns(report_xlsx)))
+
+
+@pytest.mark.parametrize('file_format', ['csv', 'xlsx'])
+def test_report_tables_match_baseline(report_csv, report_xlsx, baseline_tables, file_format):
+    from conftest import assert_rows_equal
+
+    path = report_csv if file_format == 'csv' else report_xlsx
+    structured_data, second_table_data = processor.summarize_report_file(path)
+
+    assert_rows_equal(structured_data, baseline_tables['structured_data'])
+    assert_rows_equal(second_table_data, baseline_tables['second_table_data'])
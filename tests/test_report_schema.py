@@ -0,0 +1,82 @@
+# backend/tests/test_report_schema.py
+"""Сопоставление заголовков отчетов со столбцами COLUMN_MAPPING (report_schema)"""
+import io
+
+import pandas as pd
+import pytest
+
+import processor
+import report_schema
+from report_schema import COLUMN_MAPPING, REPORT_LAYOUTS, ReportHeaderError, resolve_header
+from conftest import assert_rows_equal
+
+
+def _renamed(header: list, renamed: dict) -> list:
+    return [renamed.get(name, name) for name in header]
+
+
+@pytest.fixture(scope='module')
+def header(report_csv) -> list:
+    return list(pd.read_csv(report_csv, nrows=0).columns)
+
+
+@pytest.mark.parametrize('layout', REPORT_LAYOUTS, ids=[layout['name'] for layout in REPORT_LAYOUTS])
+def test_known_layouts_are_recognized(header, layout):
+    name, found = resolve_header(_renamed(header, layout['renamed']))
+
+    assert name == layout['name']
+    assert sorted(found.values()) == sorted(COLUMN_MAPPING)
+    assert all(found[layout['renamed'][canonical]] == canonical for canonical in layout['renamed'])
+
+
+def test_aliases_and_spelling_differences_are_resolved(header):
+    renamed = _renamed(header, {'Кол-во': 'Количество', 'Хранение': '  ХРАНЕНИЕ ',
+                                'Эквайринг/Комиссии за организацию платежей': 'Возмещение расходов по эквайрингу'})
+    # Повторяющийся столбец: используется первый
+    renamed.append('Количество')
+
+    name, found = resolve_header(renamed)
+
+    assert name == 'Отчет о реализации (другие названия столбцов)'
+    assert found['Количество'] == 'Кол-во' and found['  ХРАНЕНИЕ '] == 'Хранение'
+    assert len(found) == len(COLUMN_MAPPING)
+
+
+def test_missing_columns_are_listed(header):
+    header = [name for name in header if name not in ('Кол-во', 'Платная приемка')]
+
+    with pytest.raises(ReportHeaderError, match='«Кол-во», «Платная приемка»'):
+        resolve_header(header)
+
+
+def test_resolved_headers_are_cached(monkeypatch, header):
+    header = _renamed(header, {'Общая сумма штрафов': 'Штрафы'})
+    calls = []
+    match = report_schema._match
+    monkeypatch.setattr(report_schema, '_match', lambda *args: calls.append(1) or match(*args))
+    monkeypatch.setattr(report_schema, '_cache', {})
+
+    assert resolve_header(header) == resolve_header(list(header))
+    assert resolve_header(header, {'Кол-во': 'N'})[1] == {'Кол-во': 'Кол-во'}
+    assert len(calls) == 2
+
+
+@pytest.mark.parametrize('file_format', ['csv', 'xlsx'])
+def test_renamed_report_matches_baseline(tmp_path, report_csv, baseline_tables, file_format):
+    renamed = REPORT_LAYOUTS[1]['renamed']
+    df = pd.read_csv(report_csv).rename(columns=renamed)
+    path = str(tmp_path / f'report.{file_format}')
+    if file_format == 'csv':
+        df.to_csv(path, index=False)
+    else:
+        df.to_excel(path, index=False)
+
+    structured_data, second_table_data = processor.summarize_report_file(path)
+
+    assert_rows_equal(structured_data, baseline_tables['structured_data'])
+    assert_rows_equal(second_table_data, baseline_tables['second_table_data'])
+
+
+def test_report_without_columns_is_rejected_before_parsing():
+    with pytest.raises(ReportHeaderError, match='Тип документа'):
+        processor.read_wb_report(io.BytesIO('Дата,Сумма\n2024-01-01,5\n'.encode('utf-8')), 'csv')
@@ -0,0 +1,131 @@
+# backend/tests/test_result_cache.py
+"""Кэш результатов (result_cache.ResultCache): ключи, попадания и промахи, single-flight, вытеснение LRU/TTL"""
+import io
+import os
+import time
+import threading
+
+import pytest
+
+from result_cache import ResultCache
+
+
+def _cache(tmp_path, **kwargs) -> ResultCache:
+    return ResultCache(str(tmp_path / 'results'), 'v1', **kwargs)
+
+
+def _writer(data: bytes, calls: list = None):
+    def build(path):
+        if calls is not None:
+            calls.append(path)
+        with open(path, 'wb') as target:
+            target.write(data)
+    return build
+
+
+def _accessed(cache: ResultCache, filename: str, seconds_ago: float):
+    accessed_at = time.time() - seconds_ago
+    os.utime(os.path.join(cache.directory, filename), (accessed_at, accessed_at))
+
+
+def test_key_depends_on_content_and_version(tmp_path):
+    path = tmp_path / 'report.csv'
+    path.write_bytes(b'a,b\n1,2\n')
+    cache = _cache(tmp_path)
+    stream = io.BytesIO(b'prefix' + path.read_bytes())
+    stream.seek(len(b'prefix'))
+
+    key = cache.key_for_file(str(path))
+
+    assert cache.key_for_file(stream) == key and stream.tell() == len(b'prefix')
+    reader = cache.hashing_reader(io.BytesIO(path.read_bytes()))
+    reader.read(3)
+    assert reader.raw.key() == key
+    assert ResultCache(str(tmp_path / 'other'), 'v2').key_for_file(str(path)) != key
+    assert cache.key_for_file(io.BytesIO(b'a,b\n1,3\n')) != key
+
+
+def test_hit_after_miss(tmp_path):
+    cache = _cache(tmp_path)
+    calls = []
+
+    first = cache.get_or_create('a' * 64, _writer(b'xlsx', calls))
+    second = cache.get_or_create('a' * 64, _writer(b'other', calls))
+
+    assert first == (cache.filename('a' * 64), False)
+    assert second == (cache.filename('a' * 64), True)
+    assert len(calls) == 1
+    with open(os.path.join(cache.directory, first[0]), 'rb') as source:
+        assert source.read() == b'xlsx'
+    assert (cache.stats()['hits'], cache.stats()['misses'], cache.stats()['files']) == (1, 1, 1)
+
+
+def test_concurrent_requests_build_once(tmp_path):
+    cache = _cache(tmp_path)
+    calls = []
+    started = threading.Barrier(8)
+    results = []
+
+    def build(path):
+        calls.append(path)
+        time.sleep(0.3)
+        _writer(b'xlsx')(path)
+
+    def request():
+        started.wait()
+        results.append(cache.get_or_create('b' * 64, build))
+
+    threads = [threading.Thread(target=request) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert sorted(cached for _, cached in results) == [False] + [True] * 7
+    assert {filename for filename, _ in results} == {cache.filename('b' * 64)}
+    assert (cache.misses, cache.hits, cache.stats()['in_flight']) == (1, 7, 0)
+
+
+def test_failed_build_leaves_nothing(tmp_path):
+    cache = _cache(tmp_path)
+
+    def build(path):
+        _writer(b'partial')(path)
+        raise ValueError('нет столбцов')
+
+    with pytest.raises(ValueError):
+        cache.get_or_create('c' * 64, build)
+
+    assert cache.lookup('c' * 64) is None
+    assert [name for name in os.listdir(cache.directory) if not name.startswith('.')] == []
+    assert cache.get_or_create('c' * 64, _writer(b'xlsx')) == (cache.filename('c' * 64), False)
+
+
+def test_least_recently_used_results_are_evicted(tmp_path):
+    cache = _cache(tmp_path, max_bytes=250)
+    for age, key in enumerate(['1' * 64, '2' * 64]):
+        filename, _ = cache.get_or_create(key, _writer(b'x' * 100))
+        _accessed(cache, filename, 200 - age * 100)
+    # Обращение к первому результату делает давним второй
+    assert cache.lookup('1' * 64) is not None
+
+    cache.get_or_create('3' * 64, _writer(b'x' * 100))
+
+    assert [cache.lookup(key) is not None for key in ['1' * 64, '2' * 64, '3' * 64]] == [True, False, True]
+    assert cache.evictions == 1
+    assert cache.stats()['size_bytes'] == 200
+
+
+def test_expired_results_are_evicted(tmp_path):
+    cache = _cache(tmp_path, ttl_seconds=3600)
+    old, _ = cache.get_or_create('d' * 64, _writer(b'xlsx'))
+    recent, _ = cache.get_or_create('e' * 64, _writer(b'xlsx'))
+    _accessed(cache, old, 7200)
+    cache.validators(old)
+
+    cache.evict()
+
+    assert cache.lookup('d' * 64) is None and cache.lookup('e' * 64) == recent
+    assert cache.evictions == 1
+    assert os.listdir(cache.validator_directory) == [recent]
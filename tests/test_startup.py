@@ -0,0 +1,50 @@
+# backend/tests/test_startup.py
+"""Быстрый запуск: модули веб-сервера без библиотек обработки, /readyz, загрузка processor в master gunicorn"""
+import os
+import sys
+import logging
+import subprocess
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_MODULES = ['jobs', 'result_cache', 'aggregate_store', 'admission', 'metrics', 'exports', 'progress',
+               'profiling', 'report_schema', 'process_pool', 'processor_version']
+
+
+def test_app_modules_do_not_import_processing_libraries():
+    script = (f"import sys\nimport {', '.join(APP_MODULES)}\n"
+              "print(','.join(name for name in ('pandas', 'numpy', 'openpyxl') if name in sys.modules))")
+
+    result = subprocess.run([sys.executable, '-c', script], cwd=ROOT, capture_output=True, text=True, check=True)
+
+    assert result.stdout.strip() == ''
+
+
+def test_readiness_reports_startup(client):
+    response = client.get('/readyz')
+
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body['status'] == 'ready' and body['pid'] == os.getpid()
+    assert {'app_import_seconds', 'processor_import_seconds', 'ready_seconds'} <= set(body['startup'])
+    assert body['startup']['ready_seconds'] >= body['startup']['app_import_seconds']
+
+
+@pytest.mark.parametrize('preload', [True, False])
+def test_gunicorn_master_preloads_processor(monkeypatch, preload):
+    import importlib.util
+
+    spec = importlib.util.spec_from_file_location('gunicorn_conf', os.path.join(ROOT, 'gunicorn.conf.py'))
+    config = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(config)
+    monkeypatch.setattr(config, 'PRELOAD_PROCESSOR', preload)
+    monkeypatch.delitem(sys.modules, 'processor', raising=False)
+
+    class Server:
+        log = logging.getLogger('gunicorn')
+
+    config.on_starting(Server())
+
+    assert config.preload_app is False
+    assert ('processor' in sys.modules) == preload
@@ -0,0 +1,22 @@
+# backend/tests/test_workbook.py
+"""Excel-файл отчета (create_excel_with_grouping): содержимое, группировка строк и оформление"""
+import processor
+from conftest import workbook_snapshot, assert_snapshots_equal
+
+
+def test_rendered_tables_match_baseline_workbook(tmp_path, baseline_tables, baseline_workbook):
+    path = str(tmp_path / 'report.xlsx')
+
+    processor.create_excel_with_grouping(baseline_tables['structured_data'], baseline_tables['second_table_data'],
+                                         path)
+
+    assert workbook_snapshot(path) == baseline_workbook
+
+
+def test_processed_report_matches_baseline_workbook(tmp_path, report_csv, baseline_workbook):
+    path = str(tmp_path / 'report.xlsx')
+
+    processor.process_wb_report_file(report_csv, path)
+
+    assert_snapshots_equal(workbook_snapshot(path), baseline_workbook)
+